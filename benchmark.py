@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Benchmark the heater service against a fleet of in-process fake miners.
+
+Starts N FakeMiners (see fake_miner.py), points the service's SSH pool at them,
+serves the Flask app on a local port and drives /heaters, /set_heater,
+/execute and /apply at a fixed concurrency. Reports p50, p95 and p99 latency
+and throughput per endpoint.
+
+Like the job queue, the driver sends one request at a time per heater to the
+endpoints that change a heater, so two levels are never uploaded to the same
+miner at once (/apply would rightly fail verification). Latency is measured
+from when a request is sent.
+
+Example:
+    python benchmark.py --miners 8 --concurrency 16 --requests 400 --latency 0.02
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import paramiko
+from werkzeug.serving import make_server
+
+import heaterService
+import utils
+from fake_miner import FakeFleet
+from history import HistoryStore
+from ssh_pool import SSHConnectionPool, set_pool
+
+ENDPOINTS = ("heaters", "set_heater", "execute", "apply")
+LEVELS = ("low", "medium", "high")
+CLIENT_KEY_BITS = 2048
+REQUEST_TIMEOUT = 60  # seconds
+
+
+def percentile(values, pct):
+    """
+    Return the nearest-rank percentile of a list of numbers.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def build_request(endpoint, index, heaters, force=False):
+    """
+    Return (heater name, method, path, body) for the index-th request to an endpoint.
+    The heater name is None for requests that do not change a heater.
+    Requests rotate over the heaters, and the level changes every round so
+    config pushes are not all skipped as unchanged.
+    """
+    heater = heaters[index % len(heaters)]
+    level = LEVELS[(index // len(heaters)) % len(LEVELS)]
+    name = heater["heaterName"]
+    if endpoint == "heaters":
+        return None, "GET", "/heaters", None
+    if endpoint == "set_heater":
+        return name, "POST", "/set_heater", {"heaterName": name, "action": level, "force": force}
+    if endpoint == "execute":
+        return name, "POST", "/execute", {"host": heater["ipAddress"], "command": "start"}
+    if endpoint == "apply":
+        return name, "POST", "/apply", {"heaterName": name, "action": level, "force": force}
+    raise ValueError(f"Unknown endpoint '{endpoint}'. Valid endpoints: {', '.join(ENDPOINTS)}")
+
+
+def send_request(base_url, method, path, body):
+    """
+    Send one HTTP request and return (status code, seconds).
+    """
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(base_url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 0
+    return status, time.perf_counter() - started
+
+
+def drive(base_url, endpoint, heaters, requests, concurrency, force=False):
+    """
+    Send requests to one endpoint at the given concurrency and summarize the results.
+    """
+    plan = [build_request(endpoint, index, heaters, force) for index in range(requests)]
+    heater_locks = {heater["heaterName"]: threading.Lock() for heater in heaters}
+
+    def send(item):
+        name, method, path, body = item
+        if name is None:
+            return send_request(base_url, method, path, body)
+        with heater_locks[name]:
+            return send_request(base_url, method, path, body)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, plan))
+    elapsed = time.perf_counter() - started
+
+    latencies = [seconds for _, seconds in results]
+    errors = sum(1 for status, _ in results if not 200 <= status < 300)
+    return {
+        "endpoint": endpoint,
+        "requests": requests,
+        "errors": errors,
+        "elapsed": round(elapsed, 3),
+        "ops_per_sec": round(requests / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1)
+    }
+
+
+@contextlib.contextmanager
+def serve_app(app):
+    """
+    Serve a Flask app on a free local port and yield its base URL.
+    """
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name="benchmark-http", daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def run_benchmark(miners=4, endpoints=ENDPOINTS, requests=100, concurrency=8,
+                  latency=0.0, failure_rate=0.0, bandwidth=None, force=False):
+    """
+    Run the benchmark and return one summary dict per endpoint.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        key_path = os.path.join(workdir, "id_rsa")
+        paramiko.RSAKey.generate(CLIENT_KEY_BITS).write_private_key_file(key_path)
+
+        with FakeFleet(miners, latency=latency, failure_rate=failure_rate, bandwidth=bandwidth) as fleet:
+            heaters = fleet.heaters()
+            heaters_path = os.path.join(workdir, "heaters.json")
+            with open(heaters_path, "w") as file:
+                json.dump(heaters, file)
+
+            pool = SSHConnectionPool(key_path=key_path, addresses=fleet.addresses())
+            previous_pool = set_pool(pool)
+            previous_path, heaterService.HEATERS_JSON_PATH = heaterService.HEATERS_JSON_PATH, heaters_path
+            history = HistoryStore(os.path.join(workdir, "history.db"))
+            previous_history, heaterService.history_store = heaterService.history_store, history
+            utils._remote_hashes.clear()
+            try:
+                with serve_app(heaterService.app) as base_url, contextlib.redirect_stdout(io.StringIO()):
+                    return [drive(base_url, endpoint, heaters, requests, concurrency, force)
+                            for endpoint in endpoints]
+            finally:
+                heaterService.HEATERS_JSON_PATH = previous_path
+                heaterService.history_store = previous_history
+                history.close()
+                set_pool(previous_pool)
+                pool.close_all()
+                utils._remote_hashes.clear()
+
+
+def print_report(results):
+    print(f"{'endpoint':<12}{'requests':>10}{'errors':>8}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for result in results:
+        print(f"{result['endpoint']:<12}{result['requests']:>10}{result['errors']:>8}{result['ops_per_sec']:>10}"
+              f"{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the heater service against fake miners.")
+    parser.add_argument("--miners", type=int, default=4, help="Number of fake miners (default: 4)")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help=f"Comma-separated endpoints to drive (default: {','.join(ENDPOINTS)})")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint (default: 100)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight (default: 8)")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds each fake miner adds per command and SFTP open (default: 0)")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="Probability a fake miner command fails (default: 0)")
+    parser.add_argument("--bandwidth", type=float, default=None,
+                        help="Fake miner SFTP write speed in bytes/second (default: unlimited)")
+    parser.add_argument("--force", action="store_true", help="Force config uploads instead of skipping unchanged ones")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    endpoints = [endpoint.strip() for endpoint in args.endpoints.split(",") if endpoint.strip()]
+    unknown = [endpoint for endpoint in endpoints if endpoint not in ENDPOINTS]
+    if unknown:
+        print(f"Unknown endpoints: {', '.join(unknown)}. Valid endpoints: {', '.join(ENDPOINTS)}", file=sys.stderr)
+        return 2
+
+    # Failed requests are counted in the report; keep the service's logs out of it
+    logging.disable(logging.ERROR)
+    print(f"Benchmarking {', '.join(endpoints)} against {args.miners} fake miners "
+          f"({args.requests} requests each, concurrency {args.concurrency})...", file=sys.stderr)
+    results = run_benchmark(args.miners, endpoints, args.requests, args.concurrency,
+                            args.latency, args.failure_rate, args.bandwidth, args.force)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+Per-host circuit breaker for miners that are powered off or unreachable.
+
+After FAILURE_THRESHOLD consecutive connection failures a host is marked down
+for a backoff window that doubles with every failed retry, up to MAX_BACKOFF.
+While a host is down, callers fail immediately with HostUnreachableError
+instead of waiting out a connect timeout, and a background thread probes the
+host so it is marked up again as soon as it answers.
+"""
+
+import logging
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Breaker tuning
+FAILURE_THRESHOLD = 3  # consecutive connection failures before a host is marked down
+BASE_BACKOFF = 30  # seconds a host stays down after it is first marked down
+MAX_BACKOFF = 600  # upper bound for the doubling backoff
+PROBE_TIMEOUT = 2  # seconds per background reachability probe
+
+# Breaker states
+CLOSED = "closed"  # host is reachable; calls go through
+OPEN = "open"  # host is down; calls fail fast until the backoff expires
+HALF_OPEN = "half_open"  # backoff expired; one trial call is let through
+
+
+class HostUnreachableError(ConnectionError):
+    """Raised instead of connecting to a host that is marked down."""
+
+    def __init__(self, host, retry_after):
+        self.host = host
+        self.retry_after = max(1, int(round(retry_after)))
+        super().__init__(f"Host {host} is unreachable; retry after {self.retry_after} seconds")
+
+
+def tcp_probe(host, port, timeout=PROBE_TIMEOUT):
+    """
+    Return True if a TCP connection to host:port can be opened.
+    """
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+class _HostState:
+    __slots__ = ("state", "failures", "opened", "retry_at", "backoff", "last_error")
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = None
+        self.retry_at = 0.0
+        self.backoff = 0
+        self.last_error = None
+
+
+class CircuitBreaker:
+    """
+    Tracks connection failures per host and fails fast for hosts marked down.
+
+    :param probe: Optional callable probe(host) -> bool run in the background
+                  for hosts that are down; a successful probe marks the host up.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, base_backoff=BASE_BACKOFF,
+                 max_backoff=MAX_BACKOFF, probe=None):
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.probe = probe
+
+        self._lock = threading.Lock()
+        self._hosts = {}  # host -> _HostState
+        self._wakeup = threading.Condition(self._lock)
+        self._prober = None
+        self._stopped = False
+
+    def check(self, host):
+        """
+        Raise HostUnreachableError if host is down.
+
+        Once a host's backoff has expired, a single caller is let through as a
+        trial; others keep failing fast until that trial succeeds or fails.
+        """
+        with self._lock:
+            entry = self._hosts.get(host)
+            if entry is None or entry.state == CLOSED:
+                return
+            now = time.monotonic()
+            if entry.state == OPEN and now >= entry.retry_at:
+                entry.state = HALF_OPEN
+                return
+            raise HostUnreachableError(host, max(entry.retry_at - now, 1))
+
+    def fail_fast(self, host):
+        """
+        Raise HostUnreachableError if host is down and not yet due for a trial.
+
+        Unlike check(), this never lets a trial through, so callers can fail
+        fast before queueing for a connection and still call check() once when
+        they actually connect.
+        """
+        with self._lock:
+            entry = self._hosts.get(host)
+            if entry is None or entry.state == CLOSED:
+                return
+            now = time.monotonic()
+            if entry.state == OPEN and now >= entry.retry_at:
+                return
+            raise HostUnreachableError(host, max(entry.retry_at - now, 1))
+
+    def end_trial(self, host, error=None):
+        """
+        Settle a trial call that failed for a reason that does not count as a
+        connection failure (e.g. authentication): a host left half open would
+        otherwise never be tried or probed again, so it is marked down again.
+        """
+        with self._lock:
+            entry = self._hosts.get(host)
+            if entry is None or entry.state != HALF_OPEN:
+                return
+            entry.last_error = str(error) if error is not None else None
+            self._open(host, entry)
+
+    def record_success(self, host):
+        with self._lock:
+            entry = self._hosts.pop(host, None)
+        if entry is not None and entry.state != CLOSED:
+            logger.info(f"Host {host} is reachable again")
+
+    def record_failure(self, host, error=None):
+        """
+        Count a connection failure and mark the host down once the threshold is reached.
+        """
+        with self._lock:
+            entry = self._hosts.setdefault(host, _HostState())
+            entry.failures += 1
+            entry.last_error = str(error) if error is not None else None
+            if entry.state == CLOSED and entry.failures < self.failure_threshold:
+                return
+            self._open(host, entry)
+
+    def _open(self, host, entry):
+        """
+        Mark host down, doubling the backoff if it was already down.
+        Must be called with self._lock held.
+        """
+        entry.backoff = min(self.max_backoff, entry.backoff * 2 if entry.backoff else self.base_backoff)
+        entry.retry_at = time.monotonic() + entry.backoff
+        if entry.state == CLOSED:
+            entry.opened = time.time()
+            logger.warning(f"Host {host} marked unreachable for {entry.backoff}s after {entry.failures} failures")
+        entry.state = OPEN
+        self._start_prober()
+        self._wakeup.notify()
+
+    def retry_after(self, host):
+        """
+        Return the seconds until host is tried again, or 0 if it is not down.
+        """
+        with self._lock:
+            entry = self._hosts.get(host)
+            if entry is None or entry.state == CLOSED:
+                return 0
+            return max(0.0, entry.retry_at - time.monotonic())
+
+    # ---------------------------------------------------------------- probing
+
+    def _start_prober(self):
+        # Must be called with self._lock held
+        if self.probe is None or self._prober is not None or self._stopped:
+            return
+        self._prober = threading.Thread(target=self._probe_loop, name="circuit-prober", daemon=True)
+        self._prober.start()
+
+    def _probe_loop(self):
+        while True:
+            with self._lock:
+                if self._stopped:
+                    return
+                now = time.monotonic()
+                due = [host for host, entry in self._hosts.items()
+                       if entry.state == OPEN and entry.retry_at <= now]
+                if not due:
+                    waits = [entry.retry_at - now for entry in self._hosts.values() if entry.state == OPEN]
+                    self._wakeup.wait(min(waits) if waits else None)
+                    continue
+                for host in due:
+                    # Keep callers failing fast while the probe runs
+                    self._hosts[host].state = HALF_OPEN
+
+            for host in due:
+                if self.probe(host):
+                    self.record_success(host)
+                else:
+                    with self._lock:
+                        entry = self._hosts.get(host)
+                        if entry is not None and entry.state == HALF_OPEN:
+                            self._open(host, entry)
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify_all()
+
+    def stats(self):
+        """
+        Return the hosts that are currently down or being retried.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "host": host,
+                    "state": entry.state,
+                    "failures": entry.failures,
+                    "retryAfter": round(max(0.0, entry.retry_at - now), 1),
+                    "lastError": entry.last_error
+                }
+                for host, entry in self._hosts.items() if entry.state != CLOSED
+            ]
@@ -0,0 +1,123 @@
+"""
+Streaming remote command output for long-running or chatty commands.
+
+A CommandStream runs one command over a pooled SSH connection and yields its
+output as it is produced instead of collecting it all first. Memory stays
+bounded end to end: the SSH channel is opened with a small window, so once
+WINDOW_SIZE bytes are waiting the miner stops sending until the HTTP client
+has read them, and the stream stops after max_bytes or max_seconds.
+
+The command runs on a pseudo-terminal, so closing the stream (when the
+client disconnects, or a limit is reached) hangs up the remote session and
+the command is terminated rather than left running on the miner. A pty also
+merges stderr into stdout.
+"""
+
+import codecs
+import logging
+import socket
+import time
+
+from ssh_pool import ssh_phase
+
+logger = logging.getLogger(__name__)
+
+# Stream tuning
+WINDOW_SIZE = 64 * 1024  # bytes the miner may send ahead of the HTTP client
+CHUNK_SIZE = 4096  # bytes read from the channel at a time
+MAX_BYTES = 1024 * 1024  # output sent before the stream is cut off
+MAX_SECONDS = 600  # lifetime of a stream
+HEARTBEAT_INTERVAL = 15  # seconds without output before a heartbeat is sent
+EXIT_STATUS_TIMEOUT = 5  # seconds to wait for the exit status after the output ends
+
+# Ways a stream can end
+EXITED = "exited"
+TRUNCATED = "truncated"
+TIMED_OUT = "timed_out"
+
+
+class CommandStream:
+    """
+    One command running on a host, read incrementally.
+
+    open() starts the command and raises like execute_remote_command's pool
+    path would (HostUnreachableError, paramiko errors, OSError). events() then
+    yields ("output", text), ("heartbeat", None) and finally ("end", summary),
+    and always closes the channel and returns the connection to the pool.
+    """
+
+    def __init__(self, pool, host, command, max_bytes=None, max_seconds=None,
+                 heartbeat_interval=None, window_size=None):
+        self.pool = pool
+        self.host = host
+        self.command = command
+        self.max_bytes = max_bytes or MAX_BYTES
+        self.max_seconds = max_seconds or MAX_SECONDS
+        self.heartbeat_interval = heartbeat_interval or HEARTBEAT_INTERVAL
+        self.window_size = window_size or WINDOW_SIZE
+        self._client = None
+        self._channel = None
+
+    def open(self):
+        self._client, _ = self.pool.acquire(self.host)
+        try:
+            with ssh_phase("exec", self.host):
+                channel = self._client.get_transport().open_session(window_size=self.window_size)
+                channel.get_pty()
+                channel.exec_command(self.command)
+        except Exception:
+            self.pool.release(self.host, self._client)
+            self._client = None
+            raise
+        channel.settimeout(self.heartbeat_interval)
+        self._channel = channel
+        return self
+
+    def close(self):
+        """
+        Close the channel, which hangs up the remote command if it is still running.
+        """
+        if self._channel is not None:
+            self._channel.close()
+            self._channel = None
+        if self._client is not None:
+            self.pool.release(self.host, self._client)
+            self._client = None
+
+    def events(self):
+        started = time.monotonic()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        sent = 0
+        reason = EXITED
+        try:
+            while True:
+                if time.monotonic() - started >= self.max_seconds:
+                    reason = TIMED_OUT
+                    break
+                try:
+                    data = self._channel.recv(CHUNK_SIZE)
+                except socket.timeout:
+                    # Heartbeats keep proxies from timing out and reveal disconnected clients
+                    yield "heartbeat", None
+                    continue
+                if not data:
+                    break
+                if sent + len(data) > self.max_bytes:
+                    data = data[:self.max_bytes - sent]
+                    reason = TRUNCATED
+                sent += len(data)
+                text = decoder.decode(data)
+                if text:
+                    yield "output", text
+                if reason == TRUNCATED:
+                    break
+
+            exit_code = None
+            if reason == EXITED and self._channel.status_event.wait(EXIT_STATUS_TIMEOUT):
+                exit_code = self._channel.exit_status
+            elapsed = round(time.monotonic() - started, 3)
+            logger.info(f"Stream of '{self.command}' on {self.host} ended ({reason}) after {sent} bytes")
+            yield "end", {"reason": reason, "exitCode": exit_code, "bytes": sent, "elapsed": elapsed}
+        finally:
+            # Also runs when the HTTP client disconnects and the generator is closed
+            self.close()
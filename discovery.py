@@ -0,0 +1,382 @@
+"""
+LAN discovery of miners, to build and refresh heaters.json.
+
+A sweep connects to the SSH and bosminer API ports of every address in one or
+more subnets from a single asyncio event loop, with up to SWEEP_CONCURRENCY
+connection attempts in flight. Closed ports on a LAN answer at once and silent
+addresses give up after CONNECT_TIMEOUT, so a /24 takes a second or two
+instead of the minutes a serial scan would.
+
+Each host with an open port is then fingerprinted:
+
+- the SSH server's banner, e.g. 'SSH-2.0-dropbear_2020.81';
+- the firmware version reported by the bosminer API, which tells a miner
+  from any other SSH host on the network;
+- its hostname, read over SSH with the service's key, or by reverse DNS when
+  SSH is disabled or fails.
+
+Hosts are matched to heaters.json entries by hostname, and the result is a
+proposal: heaters whose ipAddress changed, miners that are not in the file,
+and heaters that were not found. Nothing is written unless --apply is given;
+heaters are never removed, and new miners are only added with --add-new.
+The file is replaced atomically, so a running heater service picks up the
+new registry on its next request.
+
+Usage:
+    python discovery.py --subnet 192.168.1.0/24 [--apply] [--add-new] [--json]
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import socket
+import tempfile
+import time
+
+from telemetry import MINER_API_PORT, MinerAPIError, decode_miner_response
+
+logger = logging.getLogger(__name__)
+
+# Sweep tuning
+SWEEP_CONCURRENCY = 256  # connection attempts in flight at once
+CONNECT_TIMEOUT = 0.5  # seconds before a silent address counts as closed
+FINGERPRINT_TIMEOUT = 3  # seconds per banner read or API request
+HOSTNAME_TIMEOUT = 10  # seconds to read a hostname over SSH, including connecting
+
+SSH_PORT = 22
+HOSTNAME_COMMAND = "cat /proc/sys/kernel/hostname"
+NEW_HEATER_LOCATION = "Unassigned"
+
+
+async def port_open(address, port, timeout=CONNECT_TIMEOUT):
+    """
+    Return whether a TCP connection to address:port succeeds within timeout.
+    """
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+
+async def scan(addresses, ports, concurrency=SWEEP_CONCURRENCY, timeout=CONNECT_TIMEOUT):
+    """
+    Check every port on every address concurrently.
+
+    :return: {address: [open ports]} for the addresses with at least one open port, in address order.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def check(address, port):
+        async with semaphore:
+            return address, port, await port_open(address, port, timeout)
+
+    results = await asyncio.gather(*(check(str(address), port) for address in addresses for port in ports))
+    found = {}
+    for address, port, is_open in results:
+        if is_open:
+            found.setdefault(address, []).append(port)
+    return found
+
+
+async def read_ssh_banner(address, port=SSH_PORT, timeout=FINGERPRINT_TIMEOUT):
+    """
+    Return the identification line an SSH server sends on connect, or None.
+    """
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    try:
+        line = await asyncio.wait_for(reader.readline(), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    finally:
+        writer.close()
+    banner = line.decode("ascii", errors="replace").strip()
+    return banner if banner.startswith("SSH-") else None
+
+
+async def query_miner_api_async(address, command, port=MINER_API_PORT, timeout=FINGERPRINT_TIMEOUT):
+    """
+    Send one command to a bosminer API without blocking the event loop, like telemetry.query_miner_api.
+    """
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+    except (OSError, asyncio.TimeoutError) as e:
+        raise MinerAPIError(f"{address}:{port} {command}: {str(e) or 'timed out'}") from e
+    try:
+        writer.write(json.dumps({"command": command}).encode("utf-8"))
+        await writer.drain()
+        # bosminer ends its answer with a NUL byte, then closes the connection
+        raw = await asyncio.wait_for(reader.read(), timeout)
+    except (OSError, asyncio.TimeoutError) as e:
+        raise MinerAPIError(f"{address}:{port} {command}: {str(e) or 'timed out'}") from e
+    finally:
+        writer.close()
+    return decode_miner_response(address, port, command, raw)
+
+
+def firmware_of(version):
+    """
+    Return a firmware description from the API's VERSION answer, e.g. 'BOSminer 0.2.0-...'.
+    """
+    fields = (version.get("VERSION") or [{}])[0]
+    for name in ("BOSer", "BOSminer", "CGMiner"):
+        if fields.get(name):
+            return f"{name} {fields[name]}"
+    return "unknown"
+
+
+async def reverse_lookup(address):
+    """
+    Return the short name reverse DNS (or mDNS via the resolver) gives for address, or None.
+    """
+    try:
+        name, _ = await asyncio.get_running_loop().getnameinfo((address, 0), socket.NI_NAMEREQD)
+    except (OSError, socket.gaierror):
+        return None
+    return name.split(".")[0] or None
+
+
+async def read_hostname(engine, address, timeout=HOSTNAME_TIMEOUT):
+    """
+    Return the hostname a host reports over SSH, or None.
+    """
+    result = await engine.execute(address, HOSTNAME_COMMAND, timeout)
+    if result.get("exit_code") != 0:
+        logger.debug(f"Could not read the hostname of {address}: {result.get('error')}")
+        return None
+    return result["output"].strip() or None
+
+
+async def fingerprint(address, ports, engine=None, ssh_port=SSH_PORT, api_port=MINER_API_PORT):
+    """
+    Identify a host found by the sweep.
+
+    :param engine: RemoteEngine used to read the hostname over SSH; reverse DNS is used when None.
+    :return: Dict with "ipAddress", "ports", "sshBanner", "firmware", "hostname" and "hostnameSource".
+    """
+    host = {"ipAddress": address, "ports": ports, "sshBanner": None, "firmware": None,
+            "hostname": None, "hostnameSource": None}
+    if ssh_port in ports:
+        host["sshBanner"] = await read_ssh_banner(address, ssh_port)
+    if api_port in ports:
+        try:
+            host["firmware"] = firmware_of(await query_miner_api_async(address, "version", api_port))
+        except MinerAPIError as e:
+            logger.debug(f"No bosminer API answer from {address}: {str(e)}")
+
+    if engine is not None and host["sshBanner"] is not None:
+        host["hostname"] = await read_hostname(engine, address)
+        host["hostnameSource"] = "ssh" if host["hostname"] else None
+    if host["hostname"] is None:
+        host["hostname"] = await reverse_lookup(address)
+        host["hostnameSource"] = "dns" if host["hostname"] else None
+    return host
+
+
+async def discover_async(networks, engine=None, ssh_port=SSH_PORT, api_port=MINER_API_PORT,
+                         concurrency=SWEEP_CONCURRENCY, timeout=CONNECT_TIMEOUT):
+    """
+    Sweep networks (ipaddress networks or CIDR strings) and fingerprint every host found.
+
+    :return: List of fingerprint dicts, in address order.
+    """
+    addresses = []
+    for network in networks:
+        network = ipaddress.ip_network(network, strict=False)
+        addresses.extend(network.hosts() if network.num_addresses > 1 else [network.network_address])
+    found = await scan(addresses, (ssh_port, api_port), concurrency, timeout)
+    return list(await asyncio.gather(*(fingerprint(address, ports, engine, ssh_port, api_port)
+                                       for address, ports in found.items())))
+
+
+def discover(networks, use_ssh=True, **options):
+    """
+    Synchronous discover_async, reading hostnames over SSH with a RemoteEngine when use_ssh is set.
+    """
+    engine = None
+    if use_ssh:
+        from remote_engine import RemoteEngine
+        engine = RemoteEngine()
+    return asyncio.run(discover_async(networks, engine, **options))
+
+
+def propose_updates(heaters, hosts, add_new=False, new_type="standard"):
+    """
+    Compare discovered hosts with heaters.json entries, matching them by hostname.
+
+    :return: Dict with "heaters" (the entries with the proposed changes applied),
+             "changes" (ipAddress updates), "new" (miners not in the file),
+             "missing" (heaters that were not found), "conflicts" (hostnames
+             found at several addresses, left unchanged) and "unidentified"
+             (other hosts: not a known heater, nor a bosminer with a hostname).
+    """
+    by_hostname = {}
+    for host in hosts:
+        if host["hostname"]:
+            by_hostname.setdefault(host["hostname"].lower(), []).append(host)
+    conflicts = {name: [host["ipAddress"] for host in found]
+                 for name, found in by_hostname.items() if len(found) > 1}
+
+    updated, changes, missing = [], [], []
+    for heater in heaters:
+        found = by_hostname.get(heater.get("hostname", "").lower())
+        if not found:
+            missing.append(heater["heaterName"])
+        elif len(found) == 1 and found[0]["ipAddress"] != heater.get("ipAddress"):
+            changes.append({"heaterName": heater["heaterName"], "hostname": heater["hostname"],
+                            "old": heater.get("ipAddress"), "new": found[0]["ipAddress"]})
+            heater = dict(heater, ipAddress=found[0]["ipAddress"])
+        updated.append(heater)
+
+    known = {heater.get("hostname", "").lower() for heater in heaters}
+    new, unidentified = [], []
+    for host in hosts:
+        name = (host["hostname"] or "").lower()
+        if name in known or name in conflicts:
+            continue
+        if host["firmware"] and name:
+            new.append(host)
+        else:
+            unidentified.append(host)
+
+    if add_new:
+        for host in new:
+            updated.append({
+                "heaterName": host["hostname"],
+                "hostname": host["hostname"],
+                "type": new_type,
+                "location": NEW_HEATER_LOCATION,
+                "ipAddress": host["ipAddress"],
+                "limitPower": False
+            })
+    return {"heaters": updated, "changes": changes, "new": new, "missing": missing,
+            "conflicts": conflicts, "unidentified": unidentified}
+
+
+def write_heaters(path, heaters):
+    """
+    Replace heaters.json atomically, so readers see either the old or the new file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".heaters-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as file:
+            json.dump(heaters, file, indent=2)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def default_networks(heaters):
+    """
+    Return the /24 networks of the heaters' current IP addresses.
+    """
+    networks = []
+    for heater in heaters:
+        try:
+            network = ipaddress.ip_network(f"{heater['ipAddress']}/24", strict=False)
+        except (KeyError, ValueError):
+            continue
+        if network not in networks:
+            networks.append(network)
+    return networks
+
+
+def print_proposal(proposal, hosts, elapsed):
+    print(f"Found {len(hosts)} host(s) with SSH or the bosminer API open in {elapsed:.1f}s\n")
+
+    if proposal["changes"]:
+        print("IP ADDRESS CHANGES:")
+        print(f"{'Heater Name':<20} {'Hostname':<15} {'Old IP':<16} {'New IP':<16}")
+        print(f"{'-'*20} {'-'*15} {'-'*16} {'-'*16}")
+        for change in proposal["changes"]:
+            print(f"{change['heaterName']:<20} {change['hostname']:<15} {change['old'] or '':<16} {change['new']:<16}")
+        print()
+
+    if proposal["new"]:
+        print("MINERS NOT IN HEATERS.JSON:")
+        print(f"{'Hostname':<20} {'IP Address':<16} {'Firmware':<40}")
+        print(f"{'-'*20} {'-'*16} {'-'*40}")
+        for host in proposal["new"]:
+            print(f"{host['hostname']:<20} {host['ipAddress']:<16} {host['firmware']:<40}")
+        print()
+
+    if proposal["missing"]:
+        print(f"NOT FOUND: {', '.join(proposal['missing'])}\n")
+    for hostname, addresses in proposal["conflicts"].items():
+        print(f"CONFLICT: {hostname} answers at {', '.join(addresses)}; left unchanged\n")
+    if proposal["unidentified"]:
+        print(f"Unidentified hosts: {', '.join(host['ipAddress'] for host in proposal['unidentified'])}\n")
+
+
+def parse_args():
+    """
+    Parse command line options.
+    """
+    parser = argparse.ArgumentParser(description="Find miners on the LAN and update heaters.json.")
+    parser.add_argument("--heaters", default="./heaters.json", help="Path to the heaters JSON file")
+    parser.add_argument("--subnet", action="append", default=None,
+                        help="Network to sweep, e.g. 192.168.1.0/24; may be repeated "
+                             "(default: the /24 networks of the heaters' IP addresses)")
+    parser.add_argument("--concurrency", type=int, default=SWEEP_CONCURRENCY,
+                        help="Connection attempts in flight at once")
+    parser.add_argument("--timeout", type=float, default=CONNECT_TIMEOUT,
+                        help="Seconds before an address that does not answer counts as closed")
+    parser.add_argument("--no-ssh", action="store_true",
+                        help="Do not log in to read hostnames; use reverse DNS only")
+    parser.add_argument("--add-new", action="store_true", help="Add miners that are not in heaters.json")
+    parser.add_argument("--type", default="standard", help="Miner type of added heaters (default: standard)")
+    parser.add_argument("--apply", action="store_true", help="Write the proposed changes to heaters.json")
+    parser.add_argument("--json", action="store_true", help="Print the proposal as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    try:
+        with open(args.heaters, "r") as file:
+            heaters = json.load(file)
+    except FileNotFoundError:
+        heaters = []
+    except json.JSONDecodeError:
+        print(f"ERROR: Invalid JSON format in {args.heaters}")
+        return 1
+
+    networks = args.subnet or default_networks(heaters)
+    if not networks:
+        print("ERROR: No subnet given and no heater IP addresses to derive one from; use --subnet")
+        return 1
+
+    started = time.monotonic()
+    hosts = discover(networks, use_ssh=not args.no_ssh, concurrency=args.concurrency, timeout=args.timeout)
+    elapsed = time.monotonic() - started
+    proposal = propose_updates(heaters, hosts, args.add_new, args.type)
+
+    if args.json:
+        print(json.dumps(dict(proposal, discovered=hosts, elapsed=round(elapsed, 3)), indent=2))
+    else:
+        print_proposal(proposal, hosts, elapsed)
+
+    if proposal["heaters"] == heaters:
+        if not args.json:
+            print("heaters.json is up to date")
+    elif args.apply:
+        write_heaters(args.heaters, proposal["heaters"])
+        if not args.json:
+            print(f"Updated {args.heaters}")
+    elif not args.json:
+        print("Run again with --apply to write these changes")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,137 @@
+"""
+Server-Sent Events broadcaster shared by every connected dashboard.
+"""
+
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+# Stream tuning
+EVENT_HISTORY = 256  # recent events kept for clients reconnecting with Last-Event-ID
+SUBSCRIBER_BUFFER = 100  # events buffered per client before it is told to resync
+HEARTBEAT_INTERVAL = 15  # seconds between keep-alive comments
+RETRY_MILLISECONDS = 3000  # reconnect delay suggested to EventSource clients
+
+
+def format_event(event):
+    """
+    Format an event dict as a Server-Sent Events message.
+    Events without an id do not move the client's Last-Event-ID.
+    """
+    id_line = f"id: {event['id']}\n" if event.get("id") is not None else ""
+    return f"{id_line}event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+# Tells a client it missed events and should reload its state
+RESYNC_EVENT = {"id": None, "type": "resync", "data": {}}
+
+
+class _Subscriber:
+    def __init__(self, buffer_size):
+        self.events = deque()
+        self.buffer_size = buffer_size
+        self.overflowed = False
+        self.ready = threading.Condition()
+
+    def push(self, event):
+        with self.ready:
+            if len(self.events) >= self.buffer_size:
+                # The client is not keeping up; drop its backlog and ask it to resync
+                self.events.clear()
+                self.overflowed = True
+            else:
+                self.events.append(event)
+            self.ready.notify()
+
+    def drain(self, timeout):
+        with self.ready:
+            if not self.events and not self.overflowed:
+                self.ready.wait(timeout)
+            events, self.events = list(self.events), deque()
+            overflowed, self.overflowed = self.overflowed, False
+            return events, overflowed
+
+
+class EventBroadcaster:
+    """
+    Fans published events out to every open /events stream.
+
+    Each event gets an increasing id. The last EVENT_HISTORY events are kept so a
+    client reconnecting with a Last-Event-ID header receives what it missed; if
+    that is no longer possible, or the client falls SUBSCRIBER_BUFFER events
+    behind, it receives a 'resync' event telling it to reload its state.
+    """
+
+    def __init__(self, history=EVENT_HISTORY, buffer_size=SUBSCRIBER_BUFFER,
+                 heartbeat_interval=HEARTBEAT_INTERVAL):
+        self.buffer_size = buffer_size
+        self.heartbeat_interval = heartbeat_interval
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+
+    def publish(self, event_type, data):
+        """
+        Send an event to every subscriber and return it.
+        """
+        with self._lock:
+            event = {"id": next(self._ids), "type": event_type, "data": data, "time": time.time()}
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.push(event)
+        return event
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def _subscribe(self, last_event_id):
+        subscriber = _Subscriber(self.buffer_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            history = list(self._history)
+
+        if last_event_id is None:
+            return subscriber, [], False
+        missed = [event for event in history if event["id"] > last_event_id]
+        # Events between last_event_id and the oldest kept event were lost, or the
+        # id comes from before a server restart
+        lost = bool(history) and (history[0]["id"] > last_event_id + 1 or history[-1]["id"] < last_event_id)
+        return subscriber, missed, lost
+
+    def stream(self, last_event_id=None, on_heartbeat=None):
+        """
+        Generate Server-Sent Events text for one client until it disconnects.
+
+        :param last_event_id: Last event id the client saw, from the Last-Event-ID header.
+        :param on_heartbeat: Optional callable run on every heartbeat tick.
+        """
+        subscriber, missed, lost = self._subscribe(last_event_id)
+        try:
+            yield f"retry: {RETRY_MILLISECONDS}\n\n"
+            if lost:
+                yield format_event(RESYNC_EVENT)
+            for event in missed:
+                yield format_event(event)
+
+            last_heartbeat = time.monotonic()
+            while True:
+                events, overflowed = subscriber.drain(self.heartbeat_interval)
+                if overflowed:
+                    yield format_event(RESYNC_EVENT)
+                for event in events:
+                    yield format_event(event)
+
+                if time.monotonic() - last_heartbeat >= self.heartbeat_interval:
+                    last_heartbeat = time.monotonic()
+                    if on_heartbeat is not None:
+                        on_heartbeat()
+                    yield ": heartbeat\n\n"
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
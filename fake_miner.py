@@ -0,0 +1,303 @@
+"""
+In-process stand-in for a fleet of bosminer heaters, for benchmarks and tests.
+
+Each FakeMiner is a paramiko SSH server on 127.0.0.1 that accepts public key
+authentication, serves SFTP from memory and answers the commands the service
+runs ('/etc/init.d/bosminer start|stop|restart', 'pidof bosminer', 'echo' and
+'cat /proc/sys/kernel/hostname'), plus 'logread -f', which prints a log line
+every log_interval seconds until the client closes the channel. Latency, failure
+rate and SFTP bandwidth are configurable so the service can be measured against
+slow or flaky miners without touching real hardware.
+"""
+
+import io
+import logging
+import os
+import random
+import shlex
+import socket
+import threading
+import time
+
+import paramiko
+
+logger = logging.getLogger(__name__)
+
+LISTEN_ADDRESS = "127.0.0.1"
+HOST_KEY_BITS = 2048
+
+BOSMINER_COMMANDS = {
+    "/etc/init.d/bosminer start": True,
+    "/etc/init.d/bosminer restart": True,
+    "/etc/init.d/bosminer stop": False
+}
+FOLLOW_LOG_COMMAND = "logread -f"
+HOSTNAME_COMMAND = "cat /proc/sys/kernel/hostname"
+
+
+class _MemoryHandle(paramiko.SFTPHandle):
+    def __init__(self, miner, path, flags):
+        super().__init__(flags)
+        self.miner = miner
+        self.path = path
+        self.writable = bool(flags & (os.O_WRONLY | os.O_RDWR))
+        self.buffer = io.BytesIO(b"" if self.writable else miner.files[path])
+
+    def read(self, offset, length):
+        self.buffer.seek(offset)
+        return self.buffer.read(length)
+
+    def write(self, offset, data):
+        self.miner.throttle(len(data))
+        self.buffer.seek(offset)
+        self.buffer.write(data)
+        return paramiko.SFTP_OK
+
+    def stat(self):
+        attributes = paramiko.SFTPAttributes()
+        attributes.st_size = len(self.buffer.getvalue())
+        attributes.st_mode = 0o100644
+        return attributes
+
+    def close(self):
+        if self.writable:
+            with self.miner.lock:
+                self.miner.files[self.path] = self.buffer.getvalue()
+        super().close()
+
+
+class _MemorySFTPServer(paramiko.SFTPServerInterface):
+    def __init__(self, server, miner):
+        super().__init__(server)
+        self.miner = miner
+
+    def open(self, path, flags, attr):
+        self.miner.delay()
+        if self.miner.fails():
+            return paramiko.SFTP_FAILURE
+        if not flags & (os.O_WRONLY | os.O_RDWR) and path not in self.miner.files:
+            return paramiko.SFTP_NO_SUCH_FILE
+        return _MemoryHandle(self.miner, path, flags)
+
+    def stat(self, path):
+        content = self.miner.files.get(path)
+        if content is None:
+            return paramiko.SFTP_NO_SUCH_FILE
+        attributes = paramiko.SFTPAttributes()
+        attributes.st_size = len(content)
+        attributes.st_mode = 0o100644
+        return attributes
+
+    lstat = stat
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    def __init__(self, miner):
+        self.miner = miner
+
+    def get_allowed_auths(self, username):
+        return "publickey"
+
+    def check_auth_publickey(self, username, key):
+        if self.miner.authorized_keys is None or key in self.miner.authorized_keys:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.miner.run_command, args=(channel, command.decode()), daemon=True).start()
+        return True
+
+
+class FakeMiner:
+    """
+    One fake heater listening for SSH on 127.0.0.1.
+
+    :param host_key: Server host key; generated if not given.
+    :param authorized_keys: Public keys allowed to log in, or None to accept any key.
+    :param latency: Seconds added to every command and SFTP open.
+    :param failure_rate: Probability (0-1) that a command or SFTP open fails.
+    :param bandwidth: SFTP write speed in bytes per second, or None for unlimited.
+    :param log_interval: Seconds between the lines 'logread -f' prints.
+    :param hostname: Name reported by 'cat /proc/sys/kernel/hostname'.
+    """
+
+    def __init__(self, host_key=None, authorized_keys=None, latency=0.0, failure_rate=0.0,
+                 bandwidth=None, port=0, log_interval=0.01, hostname="fake-miner"):
+        self.host_key = host_key or paramiko.RSAKey.generate(HOST_KEY_BITS)
+        self.authorized_keys = authorized_keys
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.bandwidth = bandwidth
+        self.log_interval = log_interval
+        self.hostname = hostname
+
+        self.lock = threading.Lock()
+        self.files = {}  # remote path -> bytes
+        self.running = True
+        self.commands = []  # commands received, in order
+        self.connections = 0
+        self.log_lines_sent = 0  # lines sent by 'logread -f'
+        self.followers_hung_up = 0  # 'logread -f' commands ended by the client
+
+        self._listener = socket.create_server((LISTEN_ADDRESS, port))
+        self.port = self._listener.getsockname()[1]
+        self._transports = []
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def address(self):
+        return LISTEN_ADDRESS, self.port
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, name=f"fake-miner-{self.port}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._listener.close()
+        for transport in list(self._transports):
+            transport.close()
+
+    def _serve(self):
+        while not self._stopped.is_set():
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(sock)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _MemorySFTPServer, self)
+            try:
+                transport.start_server(server=_ServerInterface(self))
+            except (paramiko.SSHException, EOFError) as e:
+                logger.debug(f"Fake miner on port {self.port} rejected a connection: {str(e)}")
+                continue
+            with self.lock:
+                self.connections += 1
+            self._transports.append(transport)
+
+    def delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def fails(self):
+        return self.failure_rate and random.random() < self.failure_rate
+
+    def throttle(self, size):
+        if self.bandwidth:
+            time.sleep(size / self.bandwidth)
+
+    def follow_log(self, channel):
+        """
+        Print log lines until the client closes the channel. sendall blocks
+        while the client's window is full, like a real slow reader.
+        """
+        line = 0
+        while not self._stopped.is_set():
+            try:
+                channel.sendall(f"bosminer: log line {line}\n".encode())
+            except OSError:
+                break
+            line += 1
+            with self.lock:
+                self.log_lines_sent += 1
+            time.sleep(self.log_interval)
+        with self.lock:
+            self.followers_hung_up += 1
+
+    def run_command(self, channel, command):
+        self.delay()
+        if command == FOLLOW_LOG_COMMAND:
+            with self.lock:
+                self.commands.append(command)
+            self.follow_log(channel)
+            return
+        with self.lock:
+            self.commands.append(command)
+            if self.fails():
+                exit_code, output, error = 1, "", "simulated failure"
+            elif command in BOSMINER_COMMANDS:
+                self.running = BOSMINER_COMMANDS[command]
+                exit_code, output, error = 0, "", ""
+            elif command == "pidof bosminer":
+                exit_code, output, error = (0, "1234", "") if self.running else (1, "", "")
+            elif command == HOSTNAME_COMMAND:
+                exit_code, output, error = 0, self.hostname, ""
+            elif command.startswith("echo "):
+                exit_code, output, error = 0, " ".join(shlex.split(command)[1:]), ""
+            else:
+                exit_code, output, error = 127, "", f"sh: {command}: not found"
+        if output:
+            channel.sendall(output.encode() + b"\n")
+        if error:
+            channel.sendall_stderr(error.encode() + b"\n")
+        channel.send_exit_status(exit_code)
+        # Send EOF rather than closing: this may run before the exec request was
+        # acknowledged, and a close would fail the client's exec_command. The
+        # client closes the channel once it has read the output.
+        channel.shutdown_write()
+
+
+class FakeFleet:
+    """
+    N fake miners sharing one host key, with a matching heaters.json fleet.
+
+    Each miner is listed under an unroutable hostname and IP address; addresses()
+    maps both to the miner's local port for SSHConnectionPool(addresses=...).
+    """
+
+    def __init__(self, size, **miner_options):
+        host_key = miner_options.pop("host_key", None) or paramiko.RSAKey.generate(HOST_KEY_BITS)
+        self.miners = [FakeMiner(host_key=host_key, hostname=f"fake-miner-{index + 1}", **miner_options)
+                       for index in range(size)]
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        for miner in self.miners:
+            miner.start()
+        return self
+
+    def stop(self):
+        for miner in self.miners:
+            miner.stop()
+
+    def heaters(self):
+        """
+        Return heaters.json entries for the fleet.
+        """
+        return [
+            {
+                "heaterName": f"fake-{index + 1}",
+                "hostname": f"fake-miner-{index + 1}",
+                "type": "standard",
+                "location": "Bench",
+                "ipAddress": f"192.0.2.{index + 1}",
+                "limitPower": False
+            }
+            for index in range(len(self.miners))
+        ]
+
+    def addresses(self):
+        """
+        Return {host: (address, port)} for every name the service may use for a miner.
+        """
+        addresses = {}
+        for heater, miner in zip(self.heaters(), self.miners):
+            addresses[f"{heater['hostname']}.local"] = miner.address
+            addresses[heater["ipAddress"]] = miner.address
+        return addresses
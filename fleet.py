@@ -0,0 +1,78 @@
+"""
+Helpers for operating on several heaters at once.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Default and maximum number of heaters worked on in parallel
+BATCH_CONCURRENCY = 8
+BATCH_MAX_CONCURRENCY = 32
+
+# heaters.json fields that may be used in a selector
+SELECTOR_FIELDS = ("heaterName", "hostname", "type", "location", "ipAddress", "limitPower")
+
+
+def matches_selector(heater, selector):
+    """
+    Check whether a heater matches every field of a selector.
+
+    Each selector value is either a single value or a list of accepted values,
+    e.g. {"location": "Basement", "type": ["standard", "quiet"]}.
+
+    :param heater: Heater entry from heaters.json.
+    :param selector: Mapping of heaters.json field names to accepted values.
+    """
+    for field, expected in selector.items():
+        accepted = expected if isinstance(expected, list) else [expected]
+        if field not in heater or heater[field] not in accepted:
+            return False
+    return True
+
+
+def select_heaters(heaters, names=None, selector=None):
+    """
+    Pick the heaters addressed by a list of names and/or a selector.
+
+    :param heaters: List of heater entries from heaters.json.
+    :param names: Optional list of heaterName values.
+    :param selector: Optional selector, see matches_selector.
+    :return: Tuple of (selected heaters in heaters.json order, names that were not found).
+    """
+    if selector:
+        unknown_fields = [field for field in selector if field not in SELECTOR_FIELDS]
+        if unknown_fields:
+            raise ValueError(f"Unknown selector field(s): {unknown_fields}. Valid fields: {list(SELECTOR_FIELDS)}")
+
+    wanted = set(names) if names is not None else None
+    selected = [
+        heater for heater in heaters
+        if (wanted is None or heater.get("heaterName") in wanted)
+        and (not selector or matches_selector(heater, selector))
+    ]
+
+    known = {heater.get("heaterName") for heater in heaters}
+    missing = [name for name in (names or []) if name not in known]
+    return selected, missing
+
+
+def run_parallel(items, operation, concurrency=BATCH_CONCURRENCY):
+    """
+    Call operation(item) for every item using at most concurrency worker threads.
+
+    Exceptions raised by operation are returned in place of its result so one
+    failing heater never aborts the rest of the batch.
+
+    :return: List of (item, result, exception) tuples in the same order as items.
+    """
+    if not items:
+        return []
+
+    workers = max(1, min(concurrency, BATCH_MAX_CONCURRENCY, len(items)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fleet") as executor:
+        futures = [executor.submit(operation, item) for item in items]
+
+    outcomes = []
+    for item, future in zip(items, futures):
+        error = future.exception()
+        outcomes.append((item, None if error else future.result(), error))
+    return outcomes
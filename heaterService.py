@@ -1,9 +1,30 @@
-from flask import Flask, request, jsonify, send_from_directory
-import paramiko
+from flask import Flask, request, jsonify, url_for, Response, g
 import logging
 import os
+import functools
 import json
-from utils import transfer_file_to_remote_host  # Import the utility function
+import threading
+import time
+from circuit_breaker import HostUnreachableError, tcp_probe
+from command_stream import CommandStream
+from events import EventBroadcaster, format_event
+from fleet import run_parallel, BATCH_CONCURRENCY
+from heater_registry import get_registry
+from heater_status import StatusCache, probe_heater, STATUS_MAX_AGE
+from http_cache import CachedBody, FileBodyCache, VersionedBodyCache
+from history import HistoryStore, HISTORY_DB_PATH, PROBE, STATE
+from host_resolver import get_resolver, heater_addresses
+from jobs import JobQueue, QueueFullError
+from metrics import REGISTRY, http_request_duration
+from power_budget import plan_power, load_power_targets, heater_efficiencies, OBJECTIVES
+from reconciler import DesiredStateStore, Reconciler
+from shared_state import SharedState, LeaseHeldError, IN_MEMORY
+from remote_engine import get_bridge
+from telemetry import TelemetryStore, TelemetryCollector
+from tracing import span, start_span
+import tracing
+from utils import config_file_for, push_config, apply_config, config_activated, forget_remote_hash, use_hash_store, PUSH_UNCHANGED, BOSMINER_RESTART_COMMAND  # Import the utility functions
+from ssh_pool import get_pool, ssh_phase
 
 app = Flask(__name__)
 
@@ -11,38 +32,288 @@ app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# SSH Configuration
-SSH_USERNAME = "root"  # Replace with your SSH username
-SSH_KEY_PATH = os.path.expanduser("~/.ssh/id_rsa")  # Path to your SSH private key
-
 # Named commands
 NAMED_COMMANDS = {
     "start": "/etc/init.d/bosminer start",
-    "stop": "/etc/init.d/bosminer stop"
+    "stop": "/etc/init.d/bosminer stop",
+    "restart": BOSMINER_RESTART_COMMAND
+}
+
+# Read-only commands whose output can be followed with /execute/stream. Commands
+# that change a heater go through /execute, which takes the heater's lease and
+# records its new state; the stream endpoint also answers plain GETs.
+STREAM_COMMANDS = {
+    "logs": "logread -f",
+    "bosminer_logs": "logread -f -e bosminer"
 }
 
+# Remote command engine: "pool" runs commands on the paramiko SSH pool in the
+# request thread, "async" runs them on the asyncio engine (see remote_engine.py)
+REMOTE_ENGINE = os.environ.get("HEATER_REMOTE_ENGINE", "pool")
+
+# Load paramiko and the SSH key in the background once the server is listening
+# (set HEATER_SSH_PREWARM=0 to load them on the first remote operation instead)
+SSH_PREWARM = os.environ.get("HEATER_SSH_PREWARM", "1") != "0"
+
+# Write a span timeline of every request and remote operation to TRACE_PATH
+# (set HEATER_TRACE=1); GET /debug/traces lists the slowest recent traces
+TRACE_ENABLED = os.environ.get("HEATER_TRACE", "0") == "1"
+TRACE_PATH = os.environ.get("HEATER_TRACE_FILE", tracing.TRACE_PATH)
+
+# SQLite database shared by every worker process and instance (set HEATER_STATE_DB
+# to a path on local disk); by default the state is private to this process
+SHARED_STATE_PATH = os.environ.get("HEATER_STATE_DB", IN_MEMORY)
+
 # Path to the heaters JSON file
 HEATERS_JSON_PATH = "./heaters.json"
 
-def execute_remote_command(host, command):
+# Browser caching: clients always revalidate, which costs a 304 with no body
+# and no JSON work while the dashboard or fleet is unchanged
+INDEX_CACHE_CONTROL = "no-cache"
+HEATERS_CACHE_CONTROL = "no-cache"
+
+# Seconds a heater's live status (/heaters?include=status) may be old when served
+HEATER_STATUS_MAX_AGE = float(os.environ.get("HEATER_STATUS_MAX_AGE", STATUS_MAX_AGE))
+
+# Path to the desired heater levels and schedules kept by the reconciler
+DESIRED_STATE_PATH = "./desired_state.json"
+
+# Heater configuration levels and the remote bosminer config path
+HEATER_ACTIONS = ("low", "medium", "high")
+REMOTE_CONFIG_PATH = "/etc/bosminer.toml"
+
+# Live updates for connected dashboards
+events = EventBroadcaster()
+
+if TRACE_ENABLED:
+    tracing.enable(TRACE_PATH)
+
+# Pre-compressed bodies for the dashboard page and the heaters list
+index_cache = FileBodyCache(os.path.join(app.root_path, "index.html"), "text/html; charset=utf-8")
+heaters_cache = VersionedBodyCache()
+heaters_status_cache = VersionedBodyCache()
+
+# Heater leases, job results, heater states and config hashes shared between workers
+shared_state = SharedState(SHARED_STATE_PATH)
+if SHARED_STATE_PATH != IN_MEMORY:
+    use_hash_store(shared_state)
+
+def job_changed(job):
     """
-    Execute a command on a remote host using SSH key authentication.
+    Publish a job's new state and store it so any worker can report it.
+    """
+    body = job.to_dict()
+    events.publish("job", body)
+    shared_state.save_job(body)
+
+# Background jobs for remote operations, serialized per heater
+job_queue = JobQueue(listener=job_changed)
+
+# Heater performance metrics collected in the background from the bosminer API
+telemetry_store = TelemetryStore()
+telemetry_collector = TelemetryCollector(lambda: heater_registry().snapshot().heaters, telemetry_store)
+
+# Live heater status over SSH, refreshed in the background; concurrent requests share probes
+status_cache = StatusCache(
+    lambda heater: probe_heater(heater, heater_command_host(heater)),
+    heaters=lambda: heater_registry().snapshot().heaters,
+    max_age=HEATER_STATUS_MAX_AGE
+)
+
+# Probe results and heater state changes over time, shared with test_connectivity.py
+history_store = HistoryStore(HISTORY_DB_PATH)
+
+def observed_heater_state(heater_name):
+    """
+    Return a copy of the last known state of a heater, or None if it is unknown.
+    """
+    return shared_state.heater_state(heater_name)
+
+def leased(heater_key_of):
+    """
+    Run a heater operation while holding the heater's lease, so no other thread,
+    worker or instance operates on the same heater meanwhile. The operation
+    returns a (body, status code) tuple; 409 is returned if the heater stays busy.
+
+    :param heater_key_of: Callable mapping the operation's arguments to the heater's key.
+    """
+    def decorate(operation):
+        @functools.wraps(operation)
+        def run(*args, **kwargs):
+            try:
+                with shared_state.lease(f"heater:{heater_key_of(*args, **kwargs)}"):
+                    return operation(*args, **kwargs)
+            except LeaseHeldError as e:
+                logger.warning(str(e))
+                return {"error": str(e), "retryAfter": e.retry_after}, 409
+        return run
+    return decorate
+
+def reconcile_heater(heater, level):
+    """
+    Bring a heater to a desired level: apply the level's config, or stop bosminer for 'off'.
+    """
+    if level == "off":
+        return run_named_command(heater_command_host(heater), "stop")
+    return apply_heater_level(heater, level)
+
+# Pushes desired levels (set directly or by schedule) to heaters that drifted from them
+desired_state = DesiredStateStore(DESIRED_STATE_PATH, shared_state=shared_state)
+reconciler = Reconciler(
+    desired_state,
+    heaters=lambda: heater_registry().snapshot().heaters,
+    observe=observed_heater_state,
+    apply=lambda heater, level: reconcile_heater(heater, level),
+    listener=lambda summary: events.publish("reconcile", summary)
+)
+
+def publish_fleet(snapshot):
+    """
+    Tell dashboards that heaters.json changed.
     """
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    events.publish("fleet", list(snapshot.heaters))
 
+def heater_registry():
+    """
+    Return the registry serving the heaters JSON file.
+    """
+    registry = get_registry(HEATERS_JSON_PATH)
+    if publish_fleet not in registry.listeners:
+        registry.listeners.append(publish_fleet)
+    return registry
+
+def update_heater_state(heater_name, **changes):
+    """
+    Record a heater's level and/or bosminer state, and publish a 'heater' event
+    and append it to the history if it changed.
+    """
+    snapshot = shared_state.update_heater_state(heater_name, changes)
+    if snapshot is None:
+        return
+    status_cache.invalidate(heater_name)
+    events.publish("heater", snapshot)
     try:
-        # Connect to the host
-        client.connect(
-            hostname=host,
-            username=SSH_USERNAME,
-            key_filename=SSH_KEY_PATH,
-            timeout=10
-        )
+        hostname = heater_registry().snapshot().by_name.get(heater_name, {}).get("hostname")
+    except (OSError, ValueError):
+        hostname = None
+    history_store.record_state(heater_name, hostname, timestamp=snapshot["updated"], **changes)
+
+def heater_key(host):
+    """
+    Return the key jobs for a host are serialized on: the heater's name when the
+    host is a known heater name, hostname or IP address, otherwise the host itself.
+    """
+    try:
+        heater = heater_registry().snapshot().find(host)
+    except (OSError, ValueError):
+        heater = None
+    return heater["heaterName"] if heater else host
+
+def wants_async(data):
+    """
+    Check whether the client asked for the operation to run as a background job,
+    via "async": true in the body or ?async=1 in the query string.
+    """
+    return bool(data.get("async")) or request.args.get("async", "").lower() in ("1", "true", "yes")
+
+def enqueue_job(key, description, operation):
+    """
+    Queue operation as a background job and return a 202 response pointing at its status.
+    """
+    try:
+        job = job_queue.submit(key, description, operation)
+    except QueueFullError as e:
+        logger.error(str(e))
+        return jsonify({"error": str(e)}), 503
 
+    status_url = url_for("get_job", job_id=job.id)
+    response = jsonify({"jobId": job.id, "state": job.state, "statusUrl": status_url})
+    response.headers["Location"] = status_url
+    return response, 202
+
+def cached_response(cached, cache_control):
+    """
+    Serve a CachedBody: 304 Not Modified if the client's validators match,
+    otherwise the best encoding the client accepts.
+    """
+    encoding, body, etag = cached.variant(request.headers.get("Accept-Encoding"))
+    if cached.not_modified(request.if_none_match, request.if_modified_since):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, status=200, content_type=cached.content_type)
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = cached.last_modified_header
+    response.headers["Cache-Control"] = cache_control
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+def json_response(body, status_code):
+    """
+    Return a JSON response, with a Retry-After header when the body says a
+    heater is unreachable for a while.
+    """
+    response = jsonify(body)
+    if body.get("retryAfter"):
+        response.headers["Retry-After"] = str(body["retryAfter"])
+    return response, status_code
+
+def heater_command_host(heater):
+    """
+    Return the address used to run commands on a heater.
+    Matches the dashboard, which sends the heater's IP address as 'host'.
+    """
+    return heater.get("ipAddress") or f"{heater['hostname']}.local"
+
+def known_heater_addresses(host):
+    """
+    Return every address the heater behind host can be reached at, so a new SSH
+    connection races its IP address and mDNS name (see host_resolver.py).
+    Hosts that are not a known heater are connected to as given.
+    """
+    try:
+        heater = heater_registry().snapshot().find(host)
+    except (OSError, ValueError):
+        heater = None
+    if heater is None:
+        return [host]
+    return heater_addresses(heater.get("hostname"), heater.get("ipAddress")) or [host]
+
+get_resolver().aliases = known_heater_addresses
+
+def heater_hostname(host):
+    """
+    Return the hostname of the heater behind host, which config hashes are kept under.
+    """
+    try:
+        heater = heater_registry().snapshot().find(host)
+    except (OSError, ValueError):
+        heater = None
+    return heater["hostname"] if heater else host.removesuffix(".local")
+
+def forget_heater_config(host):
+    """
+    Forget the remembered config hash for the heater behind host, so the next
+    config push re-checks the heater instead of reporting it unchanged.
+    """
+    forget_remote_hash(heater_hostname(host))
+
+def execute_remote_command(host, command):
+    """
+    Execute a command on a remote host using SSH key authentication.
+    The connection is drawn from the shared SSH connection pool, or the command
+    is handed to the asyncio engine when REMOTE_ENGINE is "async".
+    """
+    if REMOTE_ENGINE == "async":
+        return get_bridge().execute_remote_command(host, command)
+
+    def run_command(client):
         # Execute the command
-        stdin, stdout, stderr = client.exec_command(command)
-        exit_code = stdout.channel.recv_exit_status()
+        with ssh_phase("exec", host):
+            stdin, stdout, stderr = client.exec_command(command)
+        with ssh_phase("exit_wait", host):
+            exit_code = stdout.channel.recv_exit_status()
 
         # Capture output and errors
         output = stdout.read().decode().strip()
@@ -56,26 +327,62 @@ def execute_remote_command(host, command):
             "error": error
         }
 
-    except paramiko.AuthenticationException:
+    try:
+        return get_pool().run(host, run_command)
+    except Exception as e:
+        return remote_error(host, e)
+
+def remote_error(host, error):
+    """
+    Log a failed SSH operation on host and return the error body for it.
+    """
+    import paramiko
+
+    if isinstance(error, HostUnreachableError):
+        logger.warning(str(error))
+        return {"error": str(error), "retryAfter": error.retry_after}
+    if isinstance(error, paramiko.AuthenticationException):
         logger.error(f"Authentication failed for {host}")
         return {"error": "Authentication failed"}
-    except paramiko.SSHException as e:
-        logger.error(f"SSH connection failed to {host}: {str(e)}")
-        return {"error": f"SSH connection failed: {str(e)}"}
-    except Exception as e:
-        logger.error(f"Error connecting to {host}: {str(e)}")
-        return {"error": f"Connection error: {str(e)}"}
-    finally:
-        client.close()
+    if isinstance(error, paramiko.SSHException):
+        logger.error(f"SSH connection failed to {host}: {str(error)}")
+        return {"error": f"SSH connection failed: {str(error)}"}
+    logger.error(f"Error connecting to {host}: {str(error)}")
+    return {"error": f"Connection error: {str(error)}"}
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.request_span = start_span("http_request", method=request.method, path=request.path)
+
+@app.after_request
+def record_request_duration(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        # Label by route template so /telemetry/<heater_name> is one series
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        http_request_duration.observe(time.perf_counter() - started, route=route,
+                                      method=request.method, status=response.status_code)
+    request_span = g.get("request_span")
+    if request_span is not None:
+        request_span.set(status=response.status_code)
+    return response
+
+@app.teardown_request
+def finish_request_span(error):
+    request_span = g.pop("request_span", None)
+    if request_span is not None:
+        request_span.finish(error)
 
 @app.route("/")
 def index():
-    return send_from_directory('.', 'index.html')
+    return cached_response(index_cache.get(), INDEX_CACHE_CONTROL)
 
 @app.route("/execute", methods=["POST"])
 def execute_command():
     """
     API endpoint to execute a command on a remote host.
+    With "async": true the command runs as a background job and 202 is returned.
     """
     data = request.json
 
@@ -92,6 +399,23 @@ def execute_command():
             "error": f"Invalid command. Available commands: {list(NAMED_COMMANDS.keys())}"
         }), 400
 
+    if wants_async(data):
+        return enqueue_job(heater_key(host), f"{command_name} on {host}", lambda: run_named_command(host, command_name))
+
+    body, status_code = run_named_command(host, command_name)
+    return json_response(body, status_code)
+
+def command_failed(result):
+    """
+    Check whether a remote command could not run or exited non-zero.
+    """
+    return bool(result.get("error")) or result.get("exit_code", 0) != 0
+
+@leased(lambda host, command_name: heater_key(host))
+def run_named_command(host, command_name):
+    """
+    Run a named command on a host and return a (response body, status code) tuple.
+    """
     # Get the actual command to execute
     command = NAMED_COMMANDS[command_name]
     logger.info(f"Executing command on {host}: {command}")
@@ -99,11 +423,121 @@ def execute_command():
     # Execute the command
     result = execute_remote_command(host, command)
 
-    # Only return 500 if there's an actual error message
+    # A stopped or failed bosminer no longer runs its last pushed config; a restarted one runs the pushed config
+    if command_name == "stop" or command_failed(result):
+        forget_heater_config(host)
+    elif command_name == "restart":
+        config_activated(heater_hostname(host))
+
+    heater_name = heater_key(host)
+    events.publish("command", {
+        "heaterName": heater_name,
+        "host": host,
+        "command": command_name,
+        "exitCode": result.get("exit_code"),
+        "error": result.get("error", "")
+    })
+
+    # Only return an error status if there's an actual error message
     if result.get("error"):  # Check if "error" key has a non-empty value
-        return jsonify(result), 500
+        return result, 503 if "retryAfter" in result else 500
+
+    if command_name in ("start", "stop", "restart"):
+        update_heater_state(heater_name, running=command_name != "stop")
+    return result, 200
+
+@app.route("/execute/stream", methods=["GET", "POST"])
+def stream_command():
+    """
+    API endpoint to run a command on a remote host and stream its output as it is produced.
+    Takes 'host' and 'command' from the JSON body, or from the query string so an
+    EventSource can connect. Clients accepting text/event-stream get 'output' events,
+    heartbeats and a final 'end' event; others get the output as chunked plain text.
+    Disconnecting hangs up the remote command.
+    """
+    data = request.get_json(silent=True) if request.method == "POST" else request.args
 
-    return jsonify(result), 200
+    # Validate input
+    if not data or "host" not in data or "command" not in data:
+        return jsonify({"error": "Missing 'host' or 'command' in request"}), 400
+
+    host = data["host"]
+    command_name = data["command"]
+    if command_name not in STREAM_COMMANDS:
+        return jsonify({
+            "error": f"Invalid command. Available commands: {list(STREAM_COMMANDS.keys())}"
+        }), 400
+
+    command = STREAM_COMMANDS[command_name]
+    logger.info(f"Streaming command on {host}: {command}")
+
+    # Connect before the response starts, so failures still get a JSON error and status
+    stream = CommandStream(get_pool(), host, command)
+    try:
+        stream.open()
+    except Exception as e:
+        body = remote_error(host, e)
+        return json_response(body, 503 if "retryAfter" in body else 500)
+
+    if request.accept_mimetypes.best == "text/event-stream":
+        def body():
+            for event_type, event_data in stream.events():
+                if event_type == "heartbeat":
+                    yield ": heartbeat\n\n"
+                elif event_type == "output":
+                    yield format_event({"type": "output", "data": {"text": event_data}})
+                else:
+                    yield format_event({"type": "end", "data": dict(event_data, host=host, command=command_name)})
+        mimetype = "text/event-stream"
+    else:
+        def body():
+            for event_type, event_data in stream.events():
+                if event_type == "output":
+                    yield event_data
+                elif event_type == "end" and event_data["reason"] != "exited":
+                    yield f"\n[stream {event_data['reason'].replace('_', ' ')} after {event_data['bytes']} bytes]\n"
+        mimetype = "text/plain"
+
+    response = Response(body(), mimetype=mimetype, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Runs when the response finishes or the client goes away, even before the first chunk
+    response.call_on_close(stream.close)
+    return response
+
+@app.route("/events", methods=["GET"])
+def event_stream():
+    """
+    Server-Sent Events stream of job progress, config pushes, bosminer commands
+    and heater state changes. Reconnecting clients send Last-Event-ID to receive
+    the events they missed.
+    """
+    try:
+        last_event_id = int(request.headers.get("Last-Event-ID", ""))
+    except ValueError:
+        last_event_id = None
+
+    def check_fleet():
+        # Heartbeats double as the poll that notices edits to heaters.json
+        try:
+            heater_registry().snapshot()
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading heaters data: {str(e)}")
+
+    return Response(
+        events.stream(last_event_id, on_heartbeat=check_fleet),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """
+    API endpoint to get the state and result of a background job.
+    """
+    job = job_queue.get(job_id)
+    body = job.to_dict() if job is not None else shared_state.job(job_id)
+    if body is None:
+        return jsonify({"error": f"Job '{job_id}' not found"}), 404
+    return jsonify(body), 200
 
 @app.route("/commands", methods=["GET"])
 def list_commands():
@@ -118,12 +552,30 @@ def list_commands():
 def list_heaters():
     """
     API endpoint to list available heaters from the JSON file.
+    With ?include=status each heater also gets its live "status" (reachable,
+    bosminer running, configured level), at most maxAge seconds old
+    (default HEATER_STATUS_MAX_AGE).
     """
+    include = request.args.get("include", "").split(",")
+    try:
+        max_age = float(request.args.get("maxAge", HEATER_STATUS_MAX_AGE))
+    except ValueError:
+        return jsonify({"error": "'maxAge' must be a number of seconds"}), 400
+
     try:
-        # Load the heaters JSON file
-        with open(HEATERS_JSON_PATH, 'r') as file:
-            heaters = json.load(file)
-        return jsonify(heaters), 200
+        fleet = heater_registry().snapshot()
+        if "status" in include:
+            statuses = status_cache.statuses(fleet.heaters, max_age)
+            version = f"{fleet.version[:16]}-{status_cache.version}"
+            cached = heaters_status_cache.get(version, lambda: CachedBody(
+                json.dumps([dict(heater, status=statuses.get(heater["heaterName"])) for heater in fleet.heaters]).encode(),
+                "application/json", time.time(), version))
+            return cached_response(cached, HEATERS_CACHE_CONTROL)
+
+        # Serve the pre-serialized, pre-compressed heaters for the current fleet version
+        cached = heaters_cache.get(fleet.version, lambda: CachedBody(
+            fleet.json_bytes, "application/json", fleet.loaded_at, fleet.version))
+        return cached_response(cached, HEATERS_CACHE_CONTROL)
     except FileNotFoundError:
         logger.error(f"Heaters JSON file not found at {HEATERS_JSON_PATH}")
         return jsonify({"error": "Heaters data not found"}), 404
@@ -138,60 +590,563 @@ def list_heaters():
 def set_heater():
     """
     API endpoint to set the heater configuration based on the selected action and miner type.
+    With "start": true bosminer is restarted onto the config after the push unless the
+    heater already ran it; without it the config is only uploaded, and the heater's level
+    is recorded once bosminer is restarted. With "async": true the push runs as a background job and 202 is returned.
     """
     data = request.json
+    selected_heater, action, error = resolve_heater_request(data)
+    if error is not None:
+        return error
+
+    heater_name = selected_heater["heaterName"]
+    force = bool(data.get("force", False))
+    start = bool(data.get("start", False))
+
+    if wants_async(data):
+        return enqueue_job(heater_name, f"set {heater_name} to {action}",
+                           lambda: apply_heater_config(selected_heater, action, force, start))
+
+    body, status_code = apply_heater_config(selected_heater, action, force, start)
+    return json_response(body, status_code)
+
+@app.route("/apply", methods=["POST"])
+def apply_heater():
+    """
+    API endpoint to switch a heater to a level in one step: the config is uploaded,
+    verified and bosminer restarted over a single SSH session. The response lists
+    how long each step took. Accepts "force" and "async" like /set_heater.
+    """
+    data = request.json
+    selected_heater, action, error = resolve_heater_request(data)
+    if error is not None:
+        return error
+
+    heater_name = selected_heater["heaterName"]
+    force = bool(data.get("force", False))
 
+    if wants_async(data):
+        return enqueue_job(heater_name, f"apply {action} to {heater_name}",
+                           lambda: apply_heater_level(selected_heater, action, force))
+
+    body, status_code = apply_heater_level(selected_heater, action, force)
+    return json_response(body, status_code)
+
+def resolve_heater_request(data):
+    """
+    Validate a {"heaterName", "action"} request body and look up the heater.
+
+    Returns a tuple of (heater, action, error response).
+    error response is None when the request is valid.
+    """
     # Validate input
     if not data or "heaterName" not in data or "action" not in data:
-        return jsonify({"error": "Missing 'heaterName' or 'action' in request body"}), 400
+        return None, None, (jsonify({"error": "Missing 'heaterName' or 'action' in request body"}), 400)
 
     heater_name = data["heaterName"]
     action = data["action"]
 
-    # Load the heaters JSON file to get the heater details
+    # Load the heaters from the registry to get the heater details
     try:
-        with open(HEATERS_JSON_PATH, 'r') as file:
-            heaters = json.load(file)
+        with span("registry_lookup", heater=heater_name):
+            fleet = heater_registry().snapshot()
     except FileNotFoundError:
         logger.error(f"Heaters JSON file not found at {HEATERS_JSON_PATH}")
-        return jsonify({"error": "Heaters data not found"}), 404
+        return None, None, (jsonify({"error": "Heaters data not found"}), 404)
     except json.JSONDecodeError:
         logger.error(f"Invalid JSON format in {HEATERS_JSON_PATH}")
-        return jsonify({"error": "Invalid heaters data format"}), 500
+        return None, None, (jsonify({"error": "Invalid heaters data format"}), 500)
     except Exception as e:
         logger.error(f"Error reading heaters data: {str(e)}")
-        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+        return None, None, (jsonify({"error": f"Internal server error: {str(e)}"}), 500)
 
     # Find the selected heater
-    selected_heater = next((heater for heater in heaters if heater["heaterName"] == heater_name), None)
+    selected_heater = fleet.by_name.get(heater_name)
     if not selected_heater:
-        return jsonify({"error": f"Heater '{heater_name}' not found"}), 404
+        return None, None, (jsonify({"error": f"Heater '{heater_name}' not found"}), 404)
 
-    # Determine the local file path based on the action and miner type
-    miner_type = selected_heater.get("type", "default")  # Default to 'default' if type is not specified
-    if action == "low":
-        local_file_path = f"bosminerConfig/bosminer-{miner_type}-low.toml"
-    elif action == "medium":
-        local_file_path = f"bosminerConfig/bosminer-{miner_type}-medium.toml"
-    elif action == "high":
-        local_file_path = f"bosminerConfig/bosminer-{miner_type}-high.toml"
+    if action not in HEATER_ACTIONS:
+        return None, None, (jsonify({"error": "Invalid action. Valid actions are 'low', 'medium', 'high'"}), 400)
+
+    return selected_heater, action, None
+
+@leased(lambda heater, *args, **kwargs: heater["heaterName"])
+def apply_heater_level(heater, action, force=False):
+    """
+    Upload, verify and activate the config for a level over one SSH session and
+    return a (response body, status code) tuple with per-step timings.
+    """
+    heater_name = heater["heaterName"]
+    miner_type = heater.get("type", "default")
+    host = heater_command_host(heater)
+
+    try:
+        result = apply_config(
+            local_file_path=config_file_for(miner_type, action),
+            remote_file_path=REMOTE_CONFIG_PATH,
+            hostname=heater["hostname"],
+            host=host,
+            force=force
+        )
+    except HostUnreachableError as e:
+        logger.warning(str(e))
+        events.publish("config", {"heaterName": heater_name, "action": action, "error": str(e)})
+        return {"error": str(e), "retryAfter": e.retry_after}, 503
+    except Exception as e:
+        logger.error(f"Error applying '{action}' to heater '{heater_name}': {str(e)}")
+        events.publish("config", {"heaterName": heater_name, "action": action, "error": str(e)})
+        return {"error": f"Failed to apply heater configuration: {str(e)}"}, 500
+
+    status, restart = result["status"], result["restart"]
+    events.publish("config", {"heaterName": heater_name, "action": action, "status": status})
+    update_heater_state(heater_name, level=action)
+
+    if status == PUSH_UNCHANGED:
+        message = f"Heater '{heater_name}' already runs '{action}' mode for type '{miner_type}'"
     else:
-        return jsonify({"error": "Invalid action. Valid actions are 'low', 'medium', 'high'"}), 400
+        message = f"Heater '{heater_name}' switched to '{action}' mode for type '{miner_type}'"
+    body = dict(result, message=message)
+
+    if restart is not None:
+        events.publish("command", {
+            "heaterName": heater_name,
+            "host": host,
+            "command": "restart",
+            "exitCode": restart["exit_code"],
+            "error": restart["error"] if restart["exit_code"] else ""
+        })
+        if restart["exit_code"] != 0:
+            body["error"] = f"bosminer restart failed: {restart['error'] or restart['exit_code']}"
+            update_heater_state(heater_name, running=False)
+            return body, 500
+    update_heater_state(heater_name, running=True)
+    return body, 200
+
+@leased(lambda heater, *args, **kwargs: heater["heaterName"])
+def apply_heater_config(heater, action, force=False, start=False):
+    """
+    Push the config for a level to a heater and return a (response body, status code) tuple.
+    With start, bosminer is started afterwards unless the heater already ran the config.
+    """
+    heater_name = heater["heaterName"]
+
+    # Determine the local file path based on the action and miner type
+    miner_type = heater.get("type", "default")  # Default to 'default' if type is not specified
+    local_file_path = config_file_for(miner_type, action)
 
     # Set the remote file path
-    remote_file_path = "/etc/bosminer.toml"
+    remote_file_path = REMOTE_CONFIG_PATH
 
-    # Call the transfer_file_to_remote_host function
+    # Push the config unless the heater already runs it (or 'force' is set)
     try:
-        transfer_file_to_remote_host(
+        status = push_config(
             local_file_path=local_file_path,
             remote_file_path=remote_file_path,
-            hostname=selected_heater["hostname"]
+            hostname=heater["hostname"],
+            host=heater_command_host(heater),
+            force=force
         )
-        return jsonify({"message": f"Heater '{heater_name}' configuration updated to '{action}' mode for type '{miner_type}'"}), 200
+    except HostUnreachableError as e:
+        logger.warning(str(e))
+        events.publish("config", {"heaterName": heater_name, "action": action, "error": str(e)})
+        return {"error": str(e), "retryAfter": e.retry_after}, 503
     except Exception as e:
         logger.error(f"Error transferring file to heater '{heater_name}': {str(e)}")
-        return jsonify({"error": f"Failed to update heater configuration: {str(e)}"}), 500
+        events.publish("config", {"heaterName": heater_name, "action": action, "error": str(e)})
+        return {"error": f"Failed to update heater configuration: {str(e)}"}, 500
+
+    events.publish("config", {"heaterName": heater_name, "action": action, "status": status})
+    if status == PUSH_UNCHANGED:
+        update_heater_state(heater_name, level=action)
+        return {"message": f"Heater '{heater_name}' already runs '{action}' mode for type '{miner_type}'",
+                "status": status}, 200
+    if not start:
+        # bosminer keeps running its previous config until it is restarted, so the level is not recorded yet
+        return {"message": f"Heater '{heater_name}' configuration for '{action}' mode uploaded for type "
+                           f"'{miner_type}'; restart bosminer to switch to it", "status": status}, 200
+
+    # A restart also starts a stopped bosminer, and makes a running one load the new config
+    body = {"status": status}
+    body["start"], start_status = run_named_command(heater_command_host(heater), "restart")
+    if start_status != 200 or command_failed(body["start"]):
+        body["error"] = body["start"].get("error") or f"bosminer restart exited with {body['start'].get('exit_code')}"
+        if "retryAfter" in body["start"]:
+            body["retryAfter"] = body["start"]["retryAfter"]
+        return body, start_status if start_status != 200 else 500
+    update_heater_state(heater_name, level=action)
+    body["message"] = f"Heater '{heater_name}' switched to '{action}' mode for type '{miner_type}'"
+    return body, 200
+
+def parse_batch_request(data):
+    """
+    Resolve the heaters addressed by a batch request body.
+
+    Returns a tuple of (heaters, missing names, concurrency, error response).
+    error response is None when the request is valid.
+    """
+    names = data.get("heaterNames")
+    selector = data.get("selector")
+    if names is None and not selector:
+        return None, None, None, (jsonify({"error": "Provide 'heaterNames' and/or 'selector' in request body"}), 400)
+    if names is not None and not isinstance(names, list):
+        return None, None, None, (jsonify({"error": "'heaterNames' must be a list"}), 400)
+    if selector is not None and not isinstance(selector, dict):
+        return None, None, None, (jsonify({"error": "'selector' must be an object"}), 400)
+
+    try:
+        concurrency = int(data.get("concurrency", BATCH_CONCURRENCY))
+    except (TypeError, ValueError):
+        return None, None, None, (jsonify({"error": "'concurrency' must be an integer"}), 400)
+
+    try:
+        fleet = heater_registry().snapshot()
+    except FileNotFoundError:
+        logger.error(f"Heaters JSON file not found at {HEATERS_JSON_PATH}")
+        return None, None, None, (jsonify({"error": "Heaters data not found"}), 404)
+    except json.JSONDecodeError:
+        logger.error(f"Invalid JSON format in {HEATERS_JSON_PATH}")
+        return None, None, None, (jsonify({"error": "Invalid heaters data format"}), 500)
+
+    try:
+        selected, missing = fleet.select(names, selector)
+    except ValueError as e:
+        return None, None, None, (jsonify({"error": str(e)}), 400)
+    return selected, missing, concurrency, None
+
+def batch_response(outcomes, missing, started):
+    """
+    Build the per-heater response for a batch operation.
+    Returns 200 when every heater succeeded and 207 (Multi-Status) otherwise.
+    """
+    results = []
+    for heater, result, error in outcomes:
+        if error is not None:
+            logger.error(f"Batch operation failed for heater '{heater['heaterName']}': {str(error)}")
+            result = {"error": f"Operation failed: {str(error)}"}
+        result = dict(result, heaterName=heater["heaterName"])
+        result["ok"] = not result.get("error")
+        results.append(result)
+    results.extend({"heaterName": name, "ok": False, "error": f"Heater '{name}' not found"} for name in missing)
+
+    succeeded = sum(1 for result in results if result["ok"])
+    body = {
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "elapsed": round(time.monotonic() - started, 3)
+    }
+    return jsonify(body), 200 if succeeded == len(results) else 207
+
+@app.route("/batch/set_heater", methods=["POST"])
+def batch_set_heater():
+    """
+    API endpoint to set the configuration level of several heaters in parallel.
+
+    Heaters are addressed by 'heaterNames' (a list) and/or a 'selector' over
+    heaters.json fields, e.g. {"location": "Basement", "type": "standard"}.
+    With 'start': true bosminer is restarted on each heater after its config push,
+    except on heaters that already run the requested config ('force' overrides).
+    """
+    started = time.monotonic()
+    data = request.json
+
+    if not data or "action" not in data:
+        return jsonify({"error": "Missing 'action' in request body"}), 400
+    action = data["action"]
+    if action not in HEATER_ACTIONS:
+        return jsonify({"error": "Invalid action. Valid actions are 'low', 'medium', 'high'"}), 400
+    start = bool(data.get("start", False))
+    force = bool(data.get("force", False))
+
+    heaters, missing, concurrency, error = parse_batch_request(data)
+    if error:
+        return error
+
+    def apply(heater):
+        # The same path as /set_heater, so each heater's state, config hash and events are kept up to date
+        body, _ = apply_heater_config(heater, action, force=force, start=start)
+        return dict(body, action=action, type=heater.get("type", "default"))
+
+    logger.info(f"Batch set_heater '{action}' on {len(heaters)} heater(s)")
+    return batch_response(run_parallel(heaters, apply, concurrency), missing, started)
+
+@app.route("/batch/execute", methods=["POST"])
+def batch_execute():
+    """
+    API endpoint to run a named command on several heaters in parallel.
+    Heaters are addressed the same way as for /batch/set_heater.
+    """
+    started = time.monotonic()
+    data = request.json
+
+    if not data or "command" not in data:
+        return jsonify({"error": "Missing 'command' in request body"}), 400
+    command_name = data["command"]
+    if command_name not in NAMED_COMMANDS:
+        return jsonify({
+            "error": f"Invalid command. Available commands: {list(NAMED_COMMANDS.keys())}"
+        }), 400
+
+    heaters, missing, concurrency, error = parse_batch_request(data)
+    if error:
+        return error
+
+    logger.info(f"Batch executing on {len(heaters)} heater(s): {NAMED_COMMANDS[command_name]}")
+    def execute(heater):
+        # The same path as /execute, so each heater's state, config hash and events are kept up to date
+        result, _ = run_named_command(heater_command_host(heater), command_name)
+        return result
+
+    outcomes = run_parallel(heaters, execute, concurrency)
+    for heater, result, error in outcomes:
+        if error is not None:
+            forget_remote_hash(heater["hostname"])
+    return batch_response(outcomes, missing, started)
+
+@app.route("/telemetry", methods=["GET"])
+def latest_telemetry():
+    """
+    API endpoint to get the most recent metrics sample of every heater.
+    """
+    return jsonify(telemetry_store.latest()), 200
+
+@app.route("/telemetry/<heater_name>", methods=["GET"])
+def query_telemetry(heater_name):
+    """
+    API endpoint to get one metric of a heater over a time range.
+
+    Query parameters: metric (default hashrate_ths), start and end as epoch
+    seconds (default: the last hour) and resolution (raw, 1m, 1h or auto).
+    """
+    metric = request.args.get("metric", "hashrate_ths")
+    resolution = request.args.get("resolution", "auto")
+    try:
+        end = float(request.args.get("end", time.time()))
+        start = float(request.args.get("start", end - 3600))
+    except ValueError:
+        return jsonify({"error": "'start' and 'end' must be epoch seconds"}), 400
+
+    try:
+        resolution, points = telemetry_store.query(heater_name, metric, start, end, resolution)
+    except KeyError:
+        return jsonify({"error": f"No '{metric}' telemetry for heater '{heater_name}'"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "heaterName": heater_name,
+        "metric": metric,
+        "resolution": resolution,
+        "start": start,
+        "end": end,
+        "points": points
+    }), 200
+
+@app.route("/desired", methods=["GET"])
+def get_desired_state():
+    """
+    API endpoint to get the desired heater levels and schedules, and the level
+    each heater should be at right now.
+    """
+    try:
+        heaters = heater_registry().snapshot().heaters
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading heaters data: {str(e)}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+    body = desired_state.get()
+    body["effective"] = desired_state.desired_levels(heaters)
+    return jsonify(body), 200
+
+@app.route("/desired", methods=["PUT", "POST"])
+def set_desired_state():
+    """
+    API endpoint to change the desired state. "heaters" maps heater names to
+    'low', 'medium', 'high', 'off' or null (no longer managed); "schedules", if
+    given, replaces the schedule list. The change is reconciled right away.
+    """
+    data = request.json
+    if not data or ("heaters" not in data and "schedules" not in data):
+        return jsonify({"error": "Missing 'heaters' or 'schedules' in request body"}), 400
+    heaters, schedules = data.get("heaters"), data.get("schedules")
+    if heaters is not None and not isinstance(heaters, dict):
+        return jsonify({"error": "'heaters' must map heater names to levels"}), 400
+    if schedules is not None and not isinstance(schedules, list):
+        return jsonify({"error": "'schedules' must be a list"}), 400
+
+    try:
+        fleet = heater_registry().snapshot()
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading heaters data: {str(e)}")
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+    unknown = [name for name in heaters or {} if name not in fleet.by_name]
+    if unknown:
+        return jsonify({"error": f"Heater(s) not found: {unknown}"}), 404
+
+    try:
+        state = desired_state.update(heaters, schedules)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if wants_async(data):
+        return enqueue_job("reconcile", "reconcile desired state", reconcile_now)
+    state["reconcile"], status_code = reconcile_now()
+    return jsonify(state), status_code
+
+@app.route("/reconcile", methods=["POST"])
+def run_reconcile():
+    """
+    API endpoint to run a reconcile pass now. With "full": true every managed
+    heater is checked, not just those whose desired level changed, which also
+    undoes manual changes. With "dryRun": true nothing is changed and the
+    response lists the heaters that would be.
+    """
+    data = request.get_json(silent=True) or {}
+    summary, status_code = reconcile_now(full=bool(data.get("full")), dry_run=bool(data.get("dryRun")))
+    return jsonify(summary), status_code
+
+def reconcile_now(full=False, dry_run=False):
+    """
+    Run a reconcile pass and return a (summary, status code) tuple; 500 if any heater failed.
+    """
+    summary = reconciler.reconcile(full=full, dry_run=dry_run)
+    failed = any(not result["ok"] for result in summary["results"])
+    return summary, 500 if failed else 200
+
+@app.route("/power_budget", methods=["POST"])
+def power_budget():
+    """
+    API endpoint to plan heater levels that get the most out of a power budget.
+
+    Body: "budgetWatts" (required), "priorities" ({location: weight}, default 1),
+    "objective" ('heat' or 'hashrate'), and optionally "heaterNames" and/or
+    "selector" to plan a subset of the fleet. With "apply": true the plan is
+    stored as the desired state and pushed to the heaters that need to change;
+    it is refused with 409 if a schedule covers any of the planned heaters.
+    """
+    data = request.json or {}
+    budget = data.get("budgetWatts")
+    if isinstance(budget, bool) or not isinstance(budget, (int, float)):
+        return jsonify({"error": "Missing or invalid 'budgetWatts' in request body"}), 400
+    priorities = data.get("priorities") or {}
+    if not isinstance(priorities, dict):
+        return jsonify({"error": "'priorities' must map locations to weights"}), 400
+    objective = data.get("objective", "heat")
+    if objective not in OBJECTIVES:
+        return jsonify({"error": f"Invalid objective '{objective}'. Valid objectives: {list(OBJECTIVES)}"}), 400
+
+    if "heaterNames" in data or "selector" in data:
+        heaters, missing, _, error = parse_batch_request(data)
+        if error:
+            return error
+        if missing:
+            return jsonify({"error": f"Heater(s) not found: {missing}"}), 404
+    else:
+        try:
+            heaters = heater_registry().snapshot().heaters
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading heaters data: {str(e)}")
+            return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+    try:
+        power_targets = load_power_targets(heater.get("type", "default") for heater in heaters)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading power targets: {str(e)}")
+        return jsonify({"error": f"Failed to read power targets: {str(e)}"}), 500
+    efficiencies = heater_efficiencies(heaters, telemetry_store.latest()) if objective == "hashrate" else None
+
+    try:
+        plan = plan_power(heaters, budget, power_targets, priorities, objective, efficiencies)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    logger.info(f"Power plan for {len(heaters)} heater(s): {plan['totalWatts']} W of {budget} W")
+
+    if not data.get("apply"):
+        return jsonify(plan), 200
+    # Schedules win over desired levels, so one covering a planned heater could push the fleet over budget
+    scheduled = desired_state.scheduled_heaters(heaters)
+    if scheduled:
+        return jsonify({"error": f"Schedules override the plan for heater(s): {scheduled}. "
+                                 "Remove those schedules before applying a power plan.",
+                        "scheduled": scheduled, "plan": plan}), 409
+    desired_state.update(plan["assignments"])
+    if wants_async(data):
+        return enqueue_job("reconcile", "apply power plan", reconcile_now)
+    plan["reconcile"], status_code = reconcile_now()
+    return jsonify(plan), status_code
+
+@app.route("/history", methods=["GET"])
+def query_history():
+    """
+    API endpoint to get connectivity uptime and latency per heater over a time range.
+
+    Query parameters: heater (heater name or hostname; default: every heater),
+    start and end as epoch seconds (default: the last 7 days). With events=probe,
+    events=state or events=all the matching history rows are listed as well,
+    newest first, up to limit (default 500).
+    """
+    heater = request.args.get("heater") or None
+    kind = request.args.get("events")
+    try:
+        end = float(request.args.get("end", time.time()))
+        start = float(request.args.get("start", end - 7 * 86400))
+        limit = int(request.args.get("limit", 500))
+    except ValueError:
+        return jsonify({"error": "'start' and 'end' must be epoch seconds and 'limit' a number"}), 400
+    if kind not in (None, PROBE, STATE, "all"):
+        return jsonify({"error": f"Invalid events '{kind}'. Use '{PROBE}', '{STATE}' or 'all'"}), 400
+
+    body = {"start": start, "end": end, "heaters": history_store.uptime(start, end, heater)}
+    if kind is not None:
+        body["events"] = history_store.events(start, end, heater, None if kind == "all" else kind, limit)
+    return jsonify(body), 200
+
+@app.route("/debug/traces", methods=["GET"])
+def debug_traces():
+    """
+    API endpoint listing the slowest recent traces with their span timelines.
+    Accepts 'limit' (default 20) and 'min_ms' query parameters.
+    """
+    try:
+        limit = int(request.args.get("limit", 20))
+        min_ms = float(request.args.get("min_ms", 0))
+    except ValueError:
+        return jsonify({"error": "'limit' and 'min_ms' must be numbers"}), 400
+    return jsonify({
+        "enabled": tracing.enabled(),
+        "traces": tracing.slowest_traces(limit, min_ms)
+    }), 200
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Prometheus scrape endpoint: request latencies, SSH phase timings, SSH
+    errors by type and pooled connection reuse.
+    """
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+def prewarm_ssh_when_listening(port, timeout=30):
+    """
+    Wait in the background until the HTTP server accepts connections, then load
+    paramiko and the SSH key so the first remote operation does not pay for them.
+    """
+    def prewarm():
+        deadline = time.monotonic() + timeout
+        while not tcp_probe("127.0.0.1", port, timeout=1):
+            if time.monotonic() >= deadline:
+                logger.warning(f"Server did not start listening on port {port}; skipping SSH prewarm")
+                return
+            time.sleep(0.1)
+        get_pool().prewarm()
+
+    thread = threading.Thread(target=prewarm, name="ssh-prewarm", daemon=True)
+    thread.start()
+    return thread
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
+    port = 5000
+    telemetry_collector.start()
+    status_cache.start()
+    reconciler.start()
+    if SSH_PREWARM:
+        prewarm_ssh_when_listening(port)
+    app.run(host="0.0.0.0", port=port)
\ No newline at end of file
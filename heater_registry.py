@@ -0,0 +1,157 @@
+"""
+In-memory, indexed view of heaters.json that reloads only when the file changes.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from fleet import select_heaters
+
+logger = logging.getLogger(__name__)
+
+
+class FleetSnapshot:
+    """
+    One fully parsed and indexed version of heaters.json.
+
+    Snapshots are never modified after construction; a reload builds a new
+    snapshot and swaps it in, so a request holding a snapshot always sees a
+    consistent fleet. The heater dicts are shared between requests and must be
+    treated as read-only.
+    """
+
+    def __init__(self, heaters, version):
+        self.heaters = tuple(heaters)
+        self.version = version
+        self.loaded_at = time.time()
+
+        self.by_name = {heater.get("heaterName"): heater for heater in self.heaters}
+        self.by_hostname = {heater.get("hostname"): heater for heater in self.heaters}
+        self.by_ip = {heater.get("ipAddress"): heater for heater in self.heaters}
+        self.by_location = self._group_by("location")
+        self.by_type = self._group_by("type")
+        self._position = {id(heater): index for index, heater in enumerate(self.heaters)}
+
+        # Pre-serialized body for GET /heaters
+        self.json_bytes = json.dumps(list(self.heaters)).encode("utf-8")
+
+    def _group_by(self, field):
+        groups = {}
+        for heater in self.heaters:
+            groups.setdefault(heater.get(field), []).append(heater)
+        return {key: tuple(value) for key, value in groups.items()}
+
+    def find(self, host):
+        """
+        Look up a heater by name, hostname, hostname.local or IP address.
+        """
+        if host in self.by_name:
+            return self.by_name[host]
+        if host in self.by_ip:
+            return self.by_ip[host]
+        if host.endswith(".local"):
+            host = host[:-len(".local")]
+        return self.by_hostname.get(host)
+
+    def select(self, names=None, selector=None):
+        """
+        Select heaters by name and/or selector using the indexes where possible.
+
+        :return: Tuple of (selected heaters in heaters.json order, names that were not found).
+        """
+        candidates = self.heaters
+        if names is not None:
+            candidates = [self.by_name[name] for name in dict.fromkeys(names) if name in self.by_name]
+        elif selector:
+            for field, index in (("location", self.by_location), ("type", self.by_type)):
+                if field in selector:
+                    values = selector[field] if isinstance(selector[field], list) else [selector[field]]
+                    candidates = [heater for value in values for heater in index.get(value, ())]
+                    break
+        candidates = sorted(candidates, key=lambda heater: self._position[id(heater)])
+
+        selected, _ = select_heaters(candidates, None, selector)
+        missing = [name for name in (names or []) if name not in self.by_name]
+        return selected, missing
+
+
+class HeaterRegistry:
+    """
+    Loads heaters.json once and serves indexed snapshots of it.
+
+    Every snapshot() call does a cheap os.stat(); the file is only re-read when
+    its mtime or size changed, and only re-parsed when its content hash changed.
+    A file that fails to parse after a good load is logged and ignored so the
+    last good fleet keeps being served while the file is being edited.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.listeners = []  # called with the new snapshot after each reload
+        self._snapshot = None
+        self._stat_key = None
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """
+        Return the current FleetSnapshot, reloading it if the file changed.
+
+        :raises FileNotFoundError: If the heaters file does not exist.
+        :raises json.JSONDecodeError: If the file is invalid and no earlier version was loaded.
+        """
+        stat = os.stat(self.path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if self._snapshot is not None and stat_key == self._stat_key:
+            return self._snapshot
+
+        with self._lock:
+            if self._snapshot is not None and stat_key == self._stat_key:
+                return self._snapshot
+
+            with open(self.path, 'rb') as file:
+                raw = file.read()
+            version = hashlib.sha256(raw).hexdigest()
+
+            if self._snapshot is None or version != self._snapshot.version:
+                try:
+                    heaters = json.loads(raw)
+                except json.JSONDecodeError:
+                    if self._snapshot is None:
+                        raise
+                    logger.error(f"Invalid JSON format in {self.path}; keeping the previously loaded heaters")
+                    return self._snapshot
+                reloaded = self._snapshot is not None
+                self._snapshot = FleetSnapshot(heaters, version)
+                logger.info(f"Loaded {len(self._snapshot.heaters)} heaters from {self.path} (version {version[:12]})")
+                if reloaded:
+                    self._notify(self._snapshot)
+
+            self._stat_key = stat_key
+            return self._snapshot
+
+    def _notify(self, snapshot):
+        for listener in self.listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error(f"Heater registry listener failed: {str(e)}")
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(path):
+    """
+    Return the shared registry for a heaters JSON path, creating it on first use.
+    """
+    path = os.path.abspath(path)
+    with _registries_lock:
+        registry = _registries.get(path)
+        if registry is None:
+            registry = _registries[path] = HeaterRegistry(path)
+        return registry
@@ -0,0 +1,226 @@
+"""
+Live heater status for /heaters?include=status, served from a cache.
+
+A probe opens (or reuses) the pooled SSH connection to a heater, checks
+whether bosminer is running and reads the power_target of the remote
+/etc/bosminer.toml, which tells which level's config the heater runs. Probes
+cost an SSH round trip, so results are cached and a request only probes
+heaters whose status is older than its staleness bound. A background refresher
+keeps the cache warm so requests usually find every heater fresh.
+
+Requests that need the same heater at the same time share one probe: the
+first starts it and the others wait for its result, so 20 open dashboards
+still cause one SSH session per heater.
+"""
+
+import io
+import logging
+import threading
+import time
+from functools import lru_cache
+
+from circuit_breaker import HostUnreachableError
+from fleet import run_parallel, BATCH_CONCURRENCY
+from power_budget import LEVELS, load_power_targets, parse_power_target
+from utils import BOSMINER_RUNNING_COMMAND
+from ssh_pool import get_pool, ssh_phase
+
+logger = logging.getLogger(__name__)
+
+STATUS_MAX_AGE = 30  # seconds a cached status may be old when served
+PROBE_WAIT = 30  # seconds a request waits for a probe another request started
+REMOTE_CONFIG_PATH = "/etc/bosminer.toml"
+
+
+@lru_cache(maxsize=None)
+def template_power_targets(miner_type):
+    """
+    Return {level: watts} of a miner type's config templates, read once.
+    """
+    return load_power_targets([miner_type])[miner_type]
+
+
+def level_for_power_target(miner_type, watts):
+    """
+    Return the level whose config template has this power target, or None.
+    """
+    targets = template_power_targets(miner_type)
+    for level in LEVELS:
+        if targets[level] == watts:
+            return level
+    return None
+
+
+def probe_heater(heater, host, pool=None):
+    """
+    Check over SSH whether bosminer is running on a heater and which level it is configured for.
+
+    :return: Dict with "reachable", "running", "level", "powerTarget" and "error".
+    """
+    status = {"reachable": False, "running": None, "level": None, "powerTarget": None, "error": None}
+
+    def check(ssh):
+        with ssh_phase("exec", host):
+            stdin, stdout, stderr = ssh.exec_command(BOSMINER_RUNNING_COMMAND)
+            running = stdout.channel.recv_exit_status() == 0
+        with ssh_phase("sftp_open", host):
+            sftp = ssh.open_sftp()
+        try:
+            with ssh_phase("sftp_read", host):
+                buffer = io.BytesIO()
+                sftp.getfo(REMOTE_CONFIG_PATH, buffer)
+            return running, buffer.getvalue()
+        except FileNotFoundError:
+            return running, None
+        finally:
+            sftp.close()
+
+    try:
+        running, config = (pool or get_pool()).run(host, check, idempotent=True)
+    except HostUnreachableError as e:
+        status["error"] = str(e)
+        return status
+    except Exception as e:
+        logger.debug(f"Status probe of {heater['heaterName']} failed: {str(e)}")
+        status["error"] = f"Probe failed: {str(e)}"
+        return status
+
+    status.update(reachable=True, running=running)
+    if config is None:
+        status["error"] = f"No config at {REMOTE_CONFIG_PATH}"
+        return status
+    try:
+        status["powerTarget"] = parse_power_target(config, REMOTE_CONFIG_PATH)
+        status["level"] = level_for_power_target(heater.get("type", "default"), status["powerTarget"])
+    except (OSError, ValueError, KeyError) as e:
+        status["error"] = f"Unknown config: {str(e)}"
+    return status
+
+
+class _Probe:
+    __slots__ = ("done", "status")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.status = None
+
+
+class StatusCache:
+    """
+    Last probed status per heater, refreshed on demand and in the background.
+
+    :param probe: Callable(heater) returning a status dict; it is called at most
+                  once at a time per heater.
+    :param heaters: Callable returning the current list of heater entries, for
+                    the background refresher.
+    :param refresh_interval: Seconds between background refreshes; defaults to
+                             two thirds of max_age, so statuses are renewed before they go stale.
+    """
+
+    def __init__(self, probe, heaters=None, max_age=STATUS_MAX_AGE, refresh_interval=None,
+                 concurrency=BATCH_CONCURRENCY):
+        self.probe = probe
+        self.heaters = heaters
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval or max_age * 2 / 3
+        self.concurrency = concurrency
+        self.version = 0  # increases whenever a status is probed or dropped
+
+        self._lock = threading.Lock()
+        self._entries = {}  # heater name -> status dict with "checkedAt"
+        self._in_flight = {}  # heater name -> _Probe
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _fresh(self, name, max_age, now):
+        # Must be called with self._lock held
+        entry = self._entries.get(name)
+        return entry is not None and now - entry["checkedAt"] <= max_age
+
+    def status(self, heater, max_age=None):
+        """
+        Return the status of one heater, probing it unless a status at most max_age seconds old is cached.
+        """
+        name = heater["heaterName"]
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            if self._fresh(name, max_age, time.time()):
+                return dict(self._entries[name])
+            probe = self._in_flight.get(name)
+            leader = probe is None
+            if leader:
+                probe = self._in_flight[name] = _Probe()
+
+        if not leader:
+            # Another request is probing this heater already; share its result
+            if probe.done.wait(PROBE_WAIT) and probe.status is not None:
+                return dict(probe.status)
+            with self._lock:
+                entry = self._entries.get(name)
+            return dict(entry) if entry else {"reachable": False, "error": "Status probe timed out"}
+
+        try:
+            status = self.probe(heater)
+        except Exception as e:
+            logger.error(f"Status probe of {name} failed: {str(e)}")
+            status = {"reachable": False, "running": None, "level": None, "powerTarget": None,
+                      "error": f"Probe failed: {str(e)}"}
+        status["checkedAt"] = time.time()
+        with self._lock:
+            self._entries[name] = status
+            self.version += 1
+            del self._in_flight[name]
+        probe.status = status
+        probe.done.set()
+        return dict(status)
+
+    def statuses(self, heaters, max_age=None):
+        """
+        Return {heaterName: status} for heaters, probing the stale ones in parallel.
+        """
+        max_age = self.max_age if max_age is None else max_age
+        statuses, stale = {}, []
+        now = time.time()
+        with self._lock:
+            for heater in heaters:
+                if self._fresh(heater["heaterName"], max_age, now):
+                    statuses[heater["heaterName"]] = dict(self._entries[heater["heaterName"]])
+                else:
+                    stale.append(heater)
+
+        for heater, result, error in run_parallel(stale, lambda heater: self.status(heater, max_age), self.concurrency):
+            statuses[heater["heaterName"]] = result if error is None else {"reachable": False, "error": str(error)}
+        return statuses
+
+    def invalidate(self, heater_name):
+        """
+        Drop a heater's cached status, e.g. after the service changed its level.
+        """
+        with self._lock:
+            if self._entries.pop(heater_name, None) is not None:
+                self.version += 1
+
+    def refresh(self):
+        """
+        Probe every heater whose status is about to go stale.
+        """
+        self.statuses(self.heaters(), max_age=max(0, self.max_age - self.refresh_interval))
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Status refresh failed: {str(e)}")
+            self._stop.wait(max(0, self.refresh_interval - (time.monotonic() - started)))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="status-refresher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,252 @@
+"""
+Append-only history of connectivity probes and heater state changes.
+
+Every probe result (from test_connectivity.py) and every level or bosminer
+state change seen by the service is appended to a local SQLite database as it
+happens. Rows are indexed by heater and by hostname on time, so uptime and
+latency for one host or the whole fleet over a time range is an index range
+scan rather than a read of the whole history.
+
+Retention: raw rows are kept for RAW_RETENTION_DAYS. Compaction rolls older
+probe rows up into one row per heater and hour (probe count, successes and
+latency sum/max), which is kept for ROLLUP_RETENTION_DAYS, and deletes the raw
+rows. Uptime queries combine both, so old ranges are answered to the hour.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DB_PATH = "./heater_history.db"
+
+# Retention
+RAW_RETENTION_DAYS = 14  # days of individual probes and state changes
+ROLLUP_RETENTION_DAYS = 365  # days of hourly probe rollups
+COMPACT_INTERVAL = 3600  # seconds between automatic compactions
+
+PROBE = "probe"
+STATE = "state"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    ts REAL NOT NULL,
+    heater TEXT NOT NULL,
+    hostname TEXT,
+    kind TEXT NOT NULL,
+    ok INTEGER,
+    latency_ms REAL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS samples_heater_ts ON samples (heater, ts);
+CREATE INDEX IF NOT EXISTS samples_hostname_ts ON samples (hostname, ts);
+CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts);
+CREATE TABLE IF NOT EXISTS probe_hourly (
+    hour INTEGER NOT NULL,
+    heater TEXT NOT NULL,
+    hostname TEXT,
+    probes INTEGER NOT NULL,
+    up INTEGER NOT NULL,
+    latency_sum REAL NOT NULL,
+    latency_count INTEGER NOT NULL,
+    latency_max REAL,
+    PRIMARY KEY (heater, hour)
+);
+"""
+
+
+class HistoryStore:
+    """
+    Thread-safe probe and state history in a SQLite file.
+    The database is created on first use.
+    """
+
+    def __init__(self, path, raw_retention_days=RAW_RETENTION_DAYS,
+                 rollup_retention_days=ROLLUP_RETENTION_DAYS, compact_interval=COMPACT_INTERVAL):
+        self.path = path
+        self.raw_retention = raw_retention_days * 86400
+        self.rollup_retention = rollup_retention_days * 86400
+        self.compact_interval = compact_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._last_compact = None
+
+    def _connection(self):
+        # Must be called with self._lock held
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            # auto_vacuum only takes effect before the first table is created
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ---------------------------------------------------------------- writing
+
+    def _append(self, rows):
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO samples (ts, heater, hostname, kind, ok, latency_ms, detail) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                if self._last_compact is None:
+                    self._last_compact = now
+                elif now - self._last_compact >= self.compact_interval:
+                    self._compact(conn, now)
+        except sqlite3.Error as e:
+            # History is best effort; never fail the probe or request that produced it
+            logger.error(f"Error writing history to {self.path}: {str(e)}")
+
+    def record_probe(self, heater, hostname, ok, latency_ms=None, method=None, error=None, timestamp=None):
+        """
+        Append one connectivity probe result.
+
+        :param method: How the heater answered ('hostname' or 'ip'), if it did.
+        """
+        detail = json.dumps({"method": method, "error": error}) if method or error else None
+        self._append([(timestamp or time.time(), heater, hostname, PROBE, int(bool(ok)), latency_ms, detail)])
+
+    def record_state(self, heater, hostname=None, timestamp=None, **changes):
+        """
+        Append a heater state change, such as level='high' or running=False.
+        """
+        self._append([(timestamp or time.time(), heater, hostname, STATE, None, None, json.dumps(changes))])
+
+    # ------------------------------------------------------------ compaction
+
+    def compact(self, now=None):
+        """
+        Roll probes older than the raw retention up into hourly rows, delete
+        the raw rows and drop rollups older than the rollup retention.
+
+        :return: Number of raw rows deleted.
+        """
+        with self._lock:
+            return self._compact(self._connection(), now or time.time())
+
+    def _compact(self, conn, now):
+        # Must be called with self._lock held
+        cutoff = now - self.raw_retention
+        with conn:
+            conn.execute(
+                "INSERT INTO probe_hourly (hour, heater, hostname, probes, up, latency_sum, latency_count, latency_max) "
+                "SELECT CAST(ts / 3600 AS INTEGER) * 3600, heater, MAX(hostname), COUNT(*), SUM(ok), "
+                "TOTAL(latency_ms), COUNT(latency_ms), MAX(latency_ms) "
+                "FROM samples WHERE kind = ? AND ts < ? GROUP BY 1, 2 "
+                "ON CONFLICT (heater, hour) DO UPDATE SET "
+                "probes = probes + excluded.probes, up = up + excluded.up, "
+                "latency_sum = latency_sum + excluded.latency_sum, "
+                "latency_count = latency_count + excluded.latency_count, "
+                "latency_max = MAX(COALESCE(latency_max, excluded.latency_max), COALESCE(excluded.latency_max, latency_max))",
+                (PROBE, cutoff))
+            deleted = conn.execute("DELETE FROM samples WHERE ts < ?", (cutoff,)).rowcount
+            conn.execute("DELETE FROM probe_hourly WHERE hour < ?", (now - self.rollup_retention,))
+        conn.execute("PRAGMA incremental_vacuum")
+        self._last_compact = now
+        if deleted:
+            logger.info(f"Compacted {deleted} history rows older than {self.raw_retention // 86400:g} days")
+        return deleted
+
+    # --------------------------------------------------------------- queries
+
+    def uptime(self, start, end, heater=None):
+        """
+        Summarize probes per heater between start and end (epoch seconds).
+        heater may be a heater name or hostname; without it every heater is summarized.
+
+        :return: {heaterName: {"hostname", "probes", "up", "uptime", "avgLatencyMs",
+                  "maxLatencyMs", "lastProbe", "lastOk"}}
+        """
+        host_filter, host_args = "", ()
+        if heater is not None:
+            host_filter, host_args = " AND (heater = ? OR hostname = ?)", (heater, heater)
+
+        with self._lock:
+            conn = self._connection()
+            raw = conn.execute(
+                "SELECT heater, MAX(hostname), COUNT(*), SUM(ok), TOTAL(latency_ms), COUNT(latency_ms), "
+                "MAX(latency_ms), MAX(ts) FROM samples "
+                f"WHERE kind = ? AND ts >= ? AND ts < ?{host_filter} GROUP BY heater",
+                (PROBE, start, end) + host_args).fetchall()
+            rolled = conn.execute(
+                "SELECT heater, MAX(hostname), SUM(probes), SUM(up), SUM(latency_sum), SUM(latency_count), "
+                "MAX(latency_max), NULL FROM probe_hourly "
+                f"WHERE hour >= ? AND hour < ?{host_filter} GROUP BY heater",
+                (int(start // 3600) * 3600, end) + host_args).fetchall()
+            last = dict(conn.execute(
+                "SELECT heater, ok FROM samples AS s "
+                f"WHERE kind = ? AND ts >= ? AND ts < ?{host_filter} "
+                "AND ts = (SELECT MAX(ts) FROM samples WHERE heater = s.heater AND kind = s.kind AND ts >= ? AND ts < ?)",
+                (PROBE, start, end) + host_args + (start, end)).fetchall())
+
+        totals = {}
+        for name, hostname, probes, up, latency_sum, latency_count, latency_max, last_ts in rolled + raw:
+            entry = totals.setdefault(name, {"hostname": hostname, "probes": 0, "up": 0, "latency_sum": 0.0,
+                                             "latency_count": 0, "maxLatencyMs": None, "lastProbe": None})
+            entry["hostname"] = hostname or entry["hostname"]
+            entry["probes"] += probes
+            entry["up"] += up or 0
+            entry["latency_sum"] += latency_sum or 0.0
+            entry["latency_count"] += latency_count or 0
+            if latency_max is not None:
+                entry["maxLatencyMs"] = max(latency_max, entry["maxLatencyMs"] or latency_max)
+            if last_ts is not None:
+                entry["lastProbe"] = last_ts
+
+        summary = {}
+        for name, entry in totals.items():
+            summary[name] = {
+                "hostname": entry["hostname"],
+                "probes": entry["probes"],
+                "up": entry["up"],
+                "uptime": round(entry["up"] / entry["probes"], 4) if entry["probes"] else None,
+                "avgLatencyMs": round(entry["latency_sum"] / entry["latency_count"], 1) if entry["latency_count"] else None,
+                "maxLatencyMs": entry["maxLatencyMs"],
+                "lastProbe": entry["lastProbe"],
+                "lastOk": bool(last[name]) if name in last else None
+            }
+        return summary
+
+    def events(self, start, end, heater=None, kind=None, limit=1000):
+        """
+        Return the raw rows between start and end, newest first.
+        """
+        query = "SELECT ts, heater, hostname, kind, ok, latency_ms, detail FROM samples WHERE ts >= ? AND ts < ?"
+        args = [start, end]
+        if heater is not None:
+            query += " AND (heater = ? OR hostname = ?)"
+            args += [heater, heater]
+        if kind is not None:
+            query += " AND kind = ?"
+            args.append(kind)
+        query += " ORDER BY ts DESC LIMIT ?"
+        args.append(limit)
+
+        with self._lock:
+            rows = self._connection().execute(query, args).fetchall()
+        return [
+            {
+                "timestamp": ts,
+                "heaterName": name,
+                "hostname": hostname,
+                "kind": row_kind,
+                "ok": None if ok is None else bool(ok),
+                "latencyMs": latency_ms,
+                **(json.loads(detail) if detail else {})
+            }
+            for ts, name, hostname, row_kind, ok, latency_ms, detail in rows
+        ]
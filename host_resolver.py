@@ -0,0 +1,384 @@
+"""
+Connecting to a heater through whichever of its addresses answers first.
+
+A heater can be reached by its mDNS name (<hostname>.local) or by the
+ipAddress recorded in heaters.json, and either may be broken: the name may
+not resolve on the machine running the service, and the address may have
+drifted since heaters.json was written. Trying one and falling back to the
+other after a full connect timeout made a broken first choice cost seconds
+on every new connection.
+
+HostResolver.connect() instead races the addresses, happy-eyeballs style
+(RFC 8305): it starts with the address that won last time, starts the next one
+after HEDGE_DELAY (or as soon as the first fails), keeps the first connection
+that succeeds and closes the others. Name lookups are cached for DNS_TTL
+seconds, and failed lookups for NEGATIVE_TTL, so a name that does not resolve
+is not looked up again on every attempt.
+
+Connect timeouts adapt per address. An exponentially weighted moving average
+of the connect latency and its deviation (as for TCP's retransmission timer,
+RFC 6298) gives timeout = srtt + 4 * rttvar, clamped between MIN_TIMEOUT and
+the caller's cap. A miner that answers in milliseconds is given up on after
+MIN_TIMEOUT rather than the whole cap, and each timeout doubles the address's
+next timeout until it answers again.
+"""
+
+import asyncio
+import contextvars
+import ipaddress
+import logging
+import queue
+import socket
+import threading
+import time
+
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Racing
+HEDGE_DELAY = 0.25  # seconds before the next address is tried alongside a slow one
+WINNER_TTL = 600  # seconds the address that won a race is tried first
+
+# Name cache
+DNS_TTL = 300  # seconds a resolved name is reused
+NEGATIVE_TTL = 30  # seconds a name that failed to resolve is not looked up again
+
+# Adaptive connect timeouts
+INITIAL_TIMEOUT = 2  # seconds, for an address without latency samples yet
+MIN_TIMEOUT = 1.5  # seconds; leaves room for one lost SYN, which is resent after 1 s
+MAX_TIMEOUT = 10  # seconds, unless the caller caps it lower
+EWMA_GAIN = 0.125  # weight of a new sample in the smoothed latency
+DEVIATION_GAIN = 0.25  # weight of a new sample in the latency deviation
+DEVIATIONS = 4  # deviations added to the smoothed latency
+MAX_BACKOFF = 8  # factor the timeout grows to after repeated timeouts
+
+
+def heater_addresses(hostname, ip_address):
+    """
+    Return the addresses a heater can be reached at: its recorded IP address, then its mDNS name.
+    """
+    addresses = [ip_address, f"{hostname}.local" if hostname else None]
+    return [address for address in dict.fromkeys(addresses) if address]
+
+
+def _phase(name, host):
+    return span(name, host=host)
+
+
+class _Latency:
+    __slots__ = ("srtt", "rttvar", "backoff", "samples")
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.backoff = 1
+        self.samples = 0
+
+
+class LatencyTracker:
+    """
+    Smoothed connect latency per address, and the connect timeout derived from it.
+    """
+
+    def __init__(self, initial=INITIAL_TIMEOUT, minimum=MIN_TIMEOUT, maximum=MAX_TIMEOUT):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self._lock = threading.Lock()
+        self._addresses = {}  # address -> _Latency
+
+    def observe(self, address, seconds):
+        """
+        Record the latency of a successful connect.
+        """
+        with self._lock:
+            entry = self._addresses.setdefault(address, _Latency())
+            if entry.srtt is None:
+                entry.srtt, entry.rttvar = seconds, seconds / 2
+            else:
+                entry.rttvar += DEVIATION_GAIN * (abs(entry.srtt - seconds) - entry.rttvar)
+                entry.srtt += EWMA_GAIN * (seconds - entry.srtt)
+            entry.backoff = 1
+            entry.samples += 1
+
+    def timed_out(self, address):
+        """
+        Double the address's next timeout, up to MAX_BACKOFF times its usual one.
+        """
+        with self._lock:
+            entry = self._addresses.setdefault(address, _Latency())
+            entry.backoff = min(MAX_BACKOFF, entry.backoff * 2)
+
+    def timeout(self, address, cap=None):
+        """
+        Return the connect timeout for address, at most cap (default: the maximum).
+        """
+        cap = min(cap, self.maximum) if cap is not None else self.maximum
+        with self._lock:
+            entry = self._addresses.get(address)
+            if entry is None:
+                return min(cap, self.initial)
+            base = self.initial if entry.srtt is None else entry.srtt + DEVIATIONS * entry.rttvar
+            return min(cap, max(self.minimum, base) * entry.backoff)
+
+    def stats(self):
+        with self._lock:
+            entries = dict(self._addresses)
+        return {
+            address: {
+                "latencyMs": round(entry.srtt * 1000, 1) if entry.srtt is not None else None,
+                "samples": entry.samples,
+                "timeout": round(self.timeout(address), 3)
+            }
+            for address, entry in entries.items()
+        }
+
+
+class AddressCache:
+    """
+    getaddrinfo results per name, kept for a TTL. IP literals are not cached.
+    """
+
+    def __init__(self, ttl=DNS_TTL, negative_ttl=NEGATIVE_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # (name, port) -> (expires, addrinfo list or gaierror args)
+
+    def resolve(self, name, port):
+        """
+        Return getaddrinfo's TCP results for name and port.
+
+        :raises socket.gaierror: If the name does not resolve (now, or within the last negative_ttl seconds).
+        """
+        try:
+            ipaddress.ip_address(name)
+        except ValueError:
+            pass
+        else:
+            return socket.getaddrinfo(name, port, type=socket.SOCK_STREAM, flags=socket.AI_NUMERICHOST)
+
+        key = (name, port)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            if isinstance(entry[1], tuple):
+                raise socket.gaierror(*entry[1])
+            return entry[1]
+
+        try:
+            addresses = socket.getaddrinfo(name, port, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            with self._lock:
+                self._entries[key] = (time.monotonic() + self.negative_ttl, e.args)
+            raise
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    def forget(self, name, port):
+        with self._lock:
+            self._entries.pop((name, port), None)
+
+
+class HostResolver:
+    """
+    Races a host's addresses and remembers which one won.
+
+    :param aliases: Optional callable(host) returning every address host can be
+                    reached at, e.g. a heater's IP address and mDNS name. Hosts
+                    it does not know are connected to as given.
+    """
+
+    def __init__(self, aliases=None, hedge_delay=HEDGE_DELAY, winner_ttl=WINNER_TTL,
+                 latency=None, cache=None):
+        self.aliases = aliases
+        self.hedge_delay = hedge_delay
+        self.winner_ttl = winner_ttl
+        self.latency = latency or LatencyTracker()
+        self.cache = cache or AddressCache()
+        self._lock = threading.Lock()
+        self._winners = {}  # host -> (address, expires)
+
+    def candidates(self, host):
+        """
+        Return the addresses to race for host, the last winner first.
+        """
+        addresses = None
+        if self.aliases is not None:
+            try:
+                addresses = self.aliases(host)
+            except Exception as e:
+                logger.error(f"Could not look up the addresses of {host}: {str(e)}")
+        return self._ordered(host, list(addresses or [host]))
+
+    def _ordered(self, host, addresses):
+        with self._lock:
+            winner = self._winners.get(host)
+        if winner is not None and winner[1] > time.monotonic() and winner[0] in addresses:
+            addresses.remove(winner[0])
+            addresses.insert(0, winner[0])
+        return addresses
+
+    def winner(self, host):
+        with self._lock:
+            winner = self._winners.get(host)
+        return winner[0] if winner is not None and winner[1] > time.monotonic() else None
+
+    def _attempt(self, host, address, port, cap, phase):
+        """
+        Resolve address (through the cache) and connect to it with its adaptive timeout.
+        """
+        with phase("resolve", host):
+            infos = self.cache.resolve(address, port)
+
+        with phase("connect", host):
+            last_error = None
+            for family, socktype, proto, _, sockaddr in infos:
+                sock = socket.socket(family, socktype, proto)
+                sock.settimeout(self.latency.timeout(address, cap))
+                started = time.perf_counter()
+                try:
+                    sock.connect(sockaddr)
+                except OSError as e:
+                    sock.close()
+                    if isinstance(e, socket.timeout):
+                        self.latency.timed_out(address)
+                    last_error = e
+                    continue
+                self.latency.observe(address, time.perf_counter() - started)
+                sock.settimeout(cap)
+                return sock
+            # The name may point somewhere else by now
+            self.cache.forget(address, port)
+            raise last_error
+
+    def connect(self, host, targets, cap=MAX_TIMEOUT, phase=_phase):
+        """
+        Connect to whichever target answers first.
+
+        :param host: Name the winner is remembered under.
+        :param targets: List of (address, connect address, port); the first is
+                        the address reported as the winner, the others say
+                        where to connect (see SSHConnectionPool.addresses).
+        :param cap: Upper bound for each connect timeout; also set on the returned socket.
+        :param phase: Context manager factory phase(name, host) wrapped around each
+                      resolve and connect, e.g. ssh_pool.ssh_phase.
+        :return: Tuple of (connected socket, winning address).
+        :raises OSError: The first target's error, if every target fails.
+        """
+        order = self._ordered(host, [target[0] for target in targets])
+        targets = sorted(targets, key=lambda target: order.index(target[0]))
+        if len(targets) == 1:
+            address, connect_address, port = targets[0]
+            return self._attempt(host, connect_address, port, cap, phase), address
+
+        results = queue.SimpleQueue()
+
+        def attempt(index):
+            _, connect_address, port = targets[index]
+            try:
+                results.put((index, self._attempt(host, connect_address, port, cap, phase), None))
+            except Exception as e:
+                results.put((index, None, e))
+
+        started, pending, errors = 0, 0, {}
+        next_start = time.monotonic()
+        while True:
+            if started < len(targets) and (pending == 0 or time.monotonic() >= next_start):
+                # Each attempt runs in a copy of this context, so its spans join the current trace
+                context = contextvars.copy_context()
+                threading.Thread(target=context.run, args=(attempt, started),
+                                 name=f"connect-{targets[started][0]}", daemon=True).start()
+                started += 1
+                pending += 1
+                next_start = time.monotonic() + self.hedge_delay
+
+            wait = max(0, next_start - time.monotonic()) if started < len(targets) else None
+            try:
+                index, sock, error = results.get(timeout=wait)
+            except queue.Empty:
+                continue
+            pending -= 1
+
+            if sock is not None:
+                if pending:
+                    threading.Thread(target=self._close_late, args=(results, pending), daemon=True).start()
+                address = targets[index][0]
+                with self._lock:
+                    self._winners[host] = (address, time.monotonic() + self.winner_ttl)
+                if index:
+                    logger.info(f"Connected to {host} through {address}")
+                return sock, address
+
+            errors[index] = error
+            if pending == 0 and started == len(targets):
+                for index in sorted(errors)[1:]:
+                    logger.debug(f"Connecting to {host} through {targets[index][0]} failed: {str(errors[index])}")
+                raise errors[min(errors)]
+
+    @staticmethod
+    def _close_late(results, pending):
+        # Close connections that succeeded after another address had already won
+        for _ in range(pending):
+            _, sock, _ = results.get()
+            if sock is not None:
+                sock.close()
+
+    def stats(self):
+        """
+        Return each host's winning address and each address's latency and timeout.
+        """
+        now = time.monotonic()
+        with self._lock:
+            winners = {host: address for host, (address, expires) in self._winners.items() if expires > now}
+        return {"winners": winners, "latency": self.latency.stats()}
+
+
+_default_resolver = None
+_default_resolver_lock = threading.Lock()
+
+
+def get_resolver():
+    """
+    Return the process-wide resolver, creating it on first use.
+    """
+    global _default_resolver
+    if _default_resolver is None:
+        with _default_resolver_lock:
+            if _default_resolver is None:
+                _default_resolver = HostResolver()
+    return _default_resolver
+
+
+async def race_async(addresses, attempt, succeeded, hedge_delay=HEDGE_DELAY):
+    """
+    The asyncio counterpart of HostResolver.connect for whole operations: run
+    attempt(address) for the first address, start the next one after
+    hedge_delay seconds or as soon as an attempt fails, and cancel the rest once
+    one succeeds.
+
+    :param succeeded: Callable(result) telling whether an attempt succeeded.
+    :return: Tuple of (address, result) of the first success, or of the first address if every attempt failed.
+    """
+    pending, failures = {}, {}
+    for index, address in enumerate(addresses):
+        pending[asyncio.ensure_future(attempt(address))] = address
+        last = index == len(addresses) - 1
+        while pending:
+            done, _ = await asyncio.wait(pending, timeout=None if last else hedge_delay,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                done_address = pending.pop(task)
+                result = task.result()
+                if succeeded(result):
+                    for other in pending:
+                        other.cancel()
+                    return done_address, result
+                failures[done_address] = result
+            if not last:
+                break
+    first = next(address for address in addresses if address in failures)
+    return first, failures[first]
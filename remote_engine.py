@@ -0,0 +1,214 @@
+"""
+asyncio front end for running commands and uploading configs on many heaters at once.
+
+A RemoteEngine lets asyncio code (the connectivity tool, discovery) drive any
+number of hosts with at most `concurrency` operations in flight and a timeout
+on every operation. It offers the same operations as
+heaterService.execute_remote_command and utils.transfer_file_to_remote_host,
+with the same result shapes.
+
+It is a threaded bridge, not a non-blocking SSH transport: PoolBackend runs
+each operation on the shared paramiko connection pool in a bounded worker
+pool, one thread per operation in flight, so operations go through the same
+circuit breaker, address racing, cached key and metrics as the rest of the
+service. When an operation times out, its connection is closed (see
+ssh_pool.CancelScope), which ends the blocking call and frees its thread.
+
+Synchronous code (the Flask routes, the connectivity tool) uses the engine
+through SyncBridge, which runs the event loop on a background thread.
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from circuit_breaker import HostUnreachableError
+from ssh_pool import get_pool, ssh_phase, CancelScope
+from utils import push_config
+
+logger = logging.getLogger(__name__)
+
+# Engine tuning
+ENGINE_CONCURRENCY = 64  # remote operations in flight at once
+OPERATION_TIMEOUT = 30  # seconds per command or upload, including connecting
+
+
+class PoolBackend:
+    """
+    Runs operations on the shared paramiko SSH pool from a bounded thread pool.
+
+    A timed-out or cancelled operation returns to the caller immediately, and
+    the connection it was using is closed so its worker thread is freed too.
+    """
+
+    name = "pool"
+
+    def __init__(self, workers=ENGINE_CONCURRENCY):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="remote-engine")
+
+    async def _call(self, function, *args):
+        scope = CancelScope()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, scope.run, function, *args)
+        except asyncio.CancelledError:
+            # Cancelled by the engine's timeout: abort the blocking call rather than leave it holding a thread
+            scope.cancel()
+            raise
+
+    async def run(self, host, command):
+        return await self._call(self._run, host, command)
+
+    async def push(self, local_file_path, remote_file_path, hostname, host, force):
+        return await self._call(push_config, local_file_path, remote_file_path, hostname, host, force)
+
+    @staticmethod
+    def _run(host, command):
+        def run_command(client):
+            with ssh_phase("exec", host):
+                stdin, stdout, stderr = client.exec_command(command)
+            with ssh_phase("exit_wait", host):
+                exit_code = stdout.channel.recv_exit_status()
+            return exit_code, stdout.read().decode().strip(), stderr.read().decode().strip()
+        return get_pool().run(host, run_command)
+
+    async def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def default_backend():
+    """
+    Return the backend RemoteEngine uses when none is given.
+    """
+    return PoolBackend()
+
+
+def _error_result(host, error, timeout):
+    """
+    Map an exception to the error dict execute_remote_command returns.
+    """
+    import paramiko
+
+    if isinstance(error, asyncio.TimeoutError):
+        return {"error": f"Operation on {host} timed out after {timeout:g}s"}
+    if isinstance(error, HostUnreachableError):
+        return {"error": str(error), "retryAfter": error.retry_after}
+    if isinstance(error, paramiko.AuthenticationException):
+        logger.error(f"Authentication failed for {host}")
+        return {"error": "Authentication failed"}
+    if isinstance(error, paramiko.SSHException):
+        logger.error(f"SSH connection failed to {host}: {str(error)}")
+        return {"error": f"SSH connection failed: {str(error)}"}
+    logger.error(f"Error connecting to {host}: {str(error)}")
+    return {"error": f"Connection error: {str(error)}"}
+
+
+class RemoteEngine:
+    """
+    Bounded-concurrency remote operations on an asyncio event loop.
+
+    :param concurrency: Maximum operations in flight across all hosts.
+    :param timeout: Default seconds allowed per operation.
+    :param backend: Runs the operations; PoolBackend if not given.
+    """
+
+    def __init__(self, concurrency=ENGINE_CONCURRENCY, timeout=OPERATION_TIMEOUT, backend=None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.backend = backend or default_backend()
+        self._semaphore = None  # created on first use, inside the engine's event loop
+
+    async def _bounded(self, coroutine, timeout):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            return await asyncio.wait_for(coroutine, timeout)
+
+    async def execute(self, host, command, timeout=None):
+        """
+        Run a command on a host.
+
+        :return: The same dict as heaterService.execute_remote_command: host, command,
+                 exit_code, output and error, or just an error on failure.
+        """
+        timeout = timeout or self.timeout
+        try:
+            exit_code, output, error = await self._bounded(self.backend.run(host, command), timeout)
+        except Exception as e:
+            return _error_result(host, e, timeout)
+        return {"host": host, "command": command, "exit_code": exit_code, "output": output, "error": error}
+
+    async def execute_many(self, hosts, command, timeout=None):
+        """
+        Run a command on every host concurrently and return the results in host order.
+        """
+        return await asyncio.gather(*(self.execute(host, command, timeout) for host in hosts))
+
+    async def transfer(self, local_file_path, remote_file_path, hostname, host=None, timeout=None, force=False):
+        """
+        Render a config template for hostname and push it with utils.push_config,
+        which skips the upload if the host already has the same config.
+
+        :param host: Address to connect to. Defaults to '<hostname>.local'.
+        :param force: Always upload the file, skipping the comparison.
+        :return: True if the host has the config, False if an error occurred.
+        """
+        timeout = timeout or self.timeout
+        try:
+            await self._bounded(self.backend.push(local_file_path, remote_file_path, hostname, host, force), timeout)
+        except Exception as e:
+            message = _error_result(host or f"{hostname}.local", e, timeout)["error"]
+            print(f"An error occurred (HostName: {hostname}): {message}")
+            return False
+        return True
+
+    async def close(self):
+        await self.backend.close()
+
+
+class SyncBridge:
+    """
+    Runs a RemoteEngine on a background event loop for synchronous callers.
+    Every method blocks the calling thread until the operation finishes.
+    """
+
+    def __init__(self, engine=None):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="remote-engine-loop", daemon=True)
+        self._thread.start()
+        self.engine = engine or RemoteEngine()
+
+    def call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def execute_remote_command(self, host, command, timeout=None):
+        return self.call(self.engine.execute(host, command, timeout))
+
+    def execute_many(self, hosts, command, timeout=None):
+        return self.call(self.engine.execute_many(hosts, command, timeout))
+
+    def transfer_file_to_remote_host(self, local_file_path, remote_file_path, hostname, host=None, timeout=None,
+                                     force=False):
+        return self.call(self.engine.transfer(local_file_path, remote_file_path, hostname, host, timeout, force))
+
+    def close(self):
+        self.call(self.engine.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+_default_bridge = None
+_default_bridge_lock = threading.Lock()
+
+
+def get_bridge():
+    """
+    Return the process-wide SyncBridge, starting its event loop on first use.
+    """
+    global _default_bridge
+    if _default_bridge is None:
+        with _default_bridge_lock:
+            if _default_bridge is None:
+                _default_bridge = SyncBridge()
+    return _default_bridge
@@ -0,0 +1,274 @@
+"""
+State shared by every worker process and instance of the heater service.
+
+With one process, the in-memory job table, heater states and config hashes are
+enough. Under a multi-worker WSGI server, or with a second controller for
+redundancy, each process would only see its own, and two of them could push to
+the same heater at once. Pointing every process at the same SQLite database
+(in WAL mode, on a local disk) gives them:
+
+- host leases: an operation on a heater first takes the heater's lease, so
+  only one process (and one thread) works on a heater at a time. Leases
+  expire after LEASE_TTL, so a crashed worker cannot block a heater for good;
+- jobs: job states and results, so GET /jobs/<id> works on any worker;
+- heater states: the last known level and bosminer state of each heater;
+- config hashes: which config each heater is known to run (see utils.py).
+
+The default ":memory:" database is private to the process, which keeps leases
+between threads of a single process without touching the disk.
+"""
+
+import json
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+IN_MEMORY = ":memory:"
+
+# Leases
+LEASE_TTL = 300  # seconds before a lease that was never released expires
+LEASE_WAIT = 30  # seconds an operation waits for a heater another worker is busy with
+LEASE_POLL_INTERVAL = 0.1  # seconds between attempts while waiting
+BUSY_TIMEOUT_MS = 5000  # how long a write waits for another process's write
+
+JOB_RETENTION_SECONDS = 3600  # how long finished jobs are kept
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    token TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    state TEXT NOT NULL,
+    finished REAL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished);
+CREATE TABLE IF NOT EXISTS heater_states (
+    heater TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS config_hashes (
+    hostname TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    recorded REAL NOT NULL
+);
+"""
+
+
+class LeaseHeldError(Exception):
+    """Raised when a lease is still held by someone else after waiting for it."""
+
+    def __init__(self, key, owner, retry_after):
+        super().__init__(f"'{key}' is busy with another operation (held by {owner}); retry in {retry_after} s")
+        self.key = key
+        self.owner = owner
+        self.retry_after = retry_after
+
+
+class SharedState:
+    """
+    Leases, jobs, heater states and config hashes in a SQLite database that
+    several processes can use at once. The database is created on first use.
+
+    :param owner: Name recorded on the leases this process takes; defaults to
+                  '<host name>:<pid>'.
+    """
+
+    def __init__(self, path=IN_MEMORY, owner=None, lease_ttl=LEASE_TTL, lease_wait=LEASE_WAIT,
+                 job_retention=JOB_RETENTION_SECONDS):
+        self.path = path
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_ttl = lease_ttl
+        self.lease_wait = lease_wait
+        self.job_retention = job_retention
+        self._lock = threading.Lock()
+        self._conn = None
+        self._held = threading.local()  # keys this thread holds a lease on
+
+    def _connection(self):
+        # Must be called with self._lock held
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run the block inside a write transaction (BEGIN IMMEDIATE) and yield the
+        connection. No other thread or process can write to the database until
+        the block ends, so a read-modify-write in it cannot lose another's update.
+        It is committed when the block ends and rolled back if the block raises.
+        """
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ---------------------------------------------------------------- leases
+
+    def try_acquire(self, key, ttl=None):
+        """
+        Take the lease on key if it is free or expired.
+
+        :return: (token, None) when acquired, or (None, (owner, expires)) of the current holder.
+        """
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            # Insert, or take over an expired lease, in one atomic statement
+            cursor = conn.execute(
+                "INSERT INTO leases (key, owner, token, expires) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, token = excluded.token, "
+                "expires = excluded.expires WHERE leases.expires <= ?",
+                (key, self.owner, token, now + (ttl or self.lease_ttl), now))
+            if cursor.rowcount:
+                return token, None
+            row = conn.execute("SELECT owner, expires FROM leases WHERE key = ?", (key,)).fetchone()
+        return None, row
+
+    def release(self, key, token):
+        """
+        Release a lease, unless it expired and was taken by someone else meanwhile.
+        """
+        self._execute("DELETE FROM leases WHERE key = ? AND token = ?", (key, token))
+
+    @contextmanager
+    def lease(self, key, wait=None, ttl=None):
+        """
+        Hold the lease on key for the duration of the block, waiting up to wait
+        seconds for it. A thread that already holds the lease enters directly.
+
+        :raises LeaseHeldError: If the lease is still held by someone else after waiting.
+        """
+        held = self._held.__dict__.setdefault("keys", set())
+        if key in held:
+            yield
+            return
+
+        wait = self.lease_wait if wait is None else wait
+        deadline = time.monotonic() + wait
+        while True:
+            token, holder = self.try_acquire(key, ttl)
+            if token is not None:
+                break
+            if holder is None:
+                continue  # released between the two statements
+            if time.monotonic() >= deadline:
+                owner, expires = holder
+                raise LeaseHeldError(key, owner, max(1, math.ceil(expires - time.time())))
+            time.sleep(LEASE_POLL_INTERVAL)
+
+        held.add(key)
+        try:
+            yield
+        finally:
+            held.discard(key)
+            try:
+                self.release(key, token)
+            except sqlite3.Error as e:
+                # The lease expires by itself
+                logger.error(f"Error releasing lease '{key}': {str(e)}")
+
+    def leases(self):
+        """
+        Return {key: {"owner", "expires"}} of the unexpired leases.
+        """
+        rows = self._execute("SELECT key, owner, expires FROM leases WHERE expires > ?", (time.time(),))
+        return {key: {"owner": owner, "expires": expires} for key, owner, expires in rows}
+
+    # ------------------------------------------------------------------ jobs
+
+    def save_job(self, job):
+        """
+        Store the dict of a job (see jobs.Job.to_dict) and drop expired finished jobs.
+        """
+        finished = job.get("finished")
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO jobs (id, key, state, finished, body) VALUES (?, ?, ?, ?, ?)",
+                         (job["jobId"], job["key"], job["state"], finished, json.dumps(job, default=str)))
+            if finished is not None:
+                conn.execute("DELETE FROM jobs WHERE finished < ?", (time.time() - self.job_retention,))
+
+    def job(self, job_id):
+        """
+        Return the stored dict of a job, or None if it is unknown or expired.
+        """
+        rows = self._execute("SELECT body FROM jobs WHERE id = ?", (job_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    # --------------------------------------------------------- heater states
+
+    def heater_state(self, heater):
+        rows = self._execute("SELECT state FROM heater_states WHERE heater = ?", (heater,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def update_heater_state(self, heater, changes, timestamp=None):
+        """
+        Apply changes to a heater's state.
+
+        :return: The new state, or None if nothing changed.
+        """
+        with self.transaction() as conn:
+            row = conn.execute("SELECT state FROM heater_states WHERE heater = ?", (heater,)).fetchone()
+            state = json.loads(row[0]) if row else {"heaterName": heater, "level": None, "running": None}
+            if all(state.get(field) == value for field, value in changes.items()):
+                return None
+            state.update(changes, updated=timestamp or time.time())
+            conn.execute("INSERT OR REPLACE INTO heater_states (heater, state) VALUES (?, ?)",
+                         (heater, json.dumps(state)))
+        return state
+
+    # -------------------------------------------------------- config hashes
+
+    def remember_hash(self, hostname, remote_file_path, digest):
+        self._execute("INSERT OR REPLACE INTO config_hashes (hostname, path, digest, recorded) VALUES (?, ?, ?, ?)",
+                      (hostname, remote_file_path, digest, time.time()))
+
+    def remembered_hash(self, hostname):
+        """
+        Return (remote_file_path, digest, epoch seconds recorded) for a host, or None.
+        """
+        rows = self._execute("SELECT path, digest, recorded FROM config_hashes WHERE hostname = ?", (hostname,))
+        return rows[0] if rows else None
+
+    def forget_hash(self, hostname):
+        self._execute("DELETE FROM config_hashes WHERE hostname = ?", (hostname,))
+
+    def clear_hashes(self):
+        self._execute("DELETE FROM config_hashes")
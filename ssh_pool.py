@@ -0,0 +1,598 @@
+"""
+Persistent per-host SSH connection pool.
+
+Both the command path (heaterService.execute_remote_command) and the SFTP path
+(utils.transfer_file_to_remote_host) draw connections from the shared pool
+returned by get_pool(), so repeated operations against the same miner reuse one
+authenticated transport instead of paying a full TCP, key-exchange and auth
+handshake every time.
+
+paramiko, and the cryptography library behind it, is imported on first use
+rather than with this module, so processes that never open an SSH connection
+(or have not yet) start without loading it.
+"""
+
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from circuit_breaker import CircuitBreaker, PROBE_TIMEOUT
+from host_resolver import get_resolver
+from metrics import ssh_phase_duration, ssh_errors, ssh_connections
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# SSH Configuration
+SSH_USERNAME = "root"  # Replace with your SSH username
+SSH_KEY_PATH = os.path.expanduser("~/.ssh/id_rsa")  # Path to your SSH private key
+SSH_PORT = 22
+
+# Pool tuning
+CONNECT_TIMEOUT = 10  # seconds; cap of the adaptive connect timeout, and the handshake timeout
+KEEPALIVE_INTERVAL = 30  # seconds between SSH keepalive packets
+IDLE_TIMEOUT = 300  # seconds an unused connection is kept open
+MAX_CONNECTIONS = 16  # maximum number of hosts with an open connection
+
+# Failure types that mean the host itself cannot be reached (see classify_ssh_error)
+UNREACHABLE_ERRORS = ("name_resolution", "timeout", "refused", "network")
+
+# paramiko key classes tried, in order, when loading the private key
+KEY_TYPES = ("RSAKey", "Ed25519Key", "ECDSAKey")
+
+
+class PoolExhaustedError(Exception):
+    """Raised when every pooled connection is in use and the cap is reached."""
+
+
+class OperationCancelledError(Exception):
+    """Raised by pooled operations run under a CancelScope that was cancelled."""
+
+
+# CancelScope of the pooled operations running in this thread, if any
+_cancel_scope = ContextVar("ssh_cancel_scope", default=None)
+
+
+class CancelScope:
+    """
+    Lets another thread abort the pooled operations run under it.
+
+    A blocking paramiko call cannot be interrupted, so cancel() closes the
+    connections the operations are using, which makes the call fail at once
+    and frees the thread running it. Closed connections are dropped from the
+    pool, and operations that have not got a connection yet do not start.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._clients = set()
+        self._lock = threading.Lock()
+
+    def run(self, function, *args, **kwargs):
+        """
+        Call function in this thread with its pooled operations under this scope.
+        """
+        token = _cancel_scope.set(self)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _cancel_scope.reset(token)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            clients, self._clients = list(self._clients), set()
+        for client in clients:
+            client.close()
+
+    def _attach(self, client):
+        with self._lock:
+            if self.cancelled:
+                raise OperationCancelledError("Operation was cancelled")
+            self._clients.add(client)
+
+    def _detach(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+
+def classify_ssh_error(error):
+    """
+    Map an exception from an SSH or SFTP operation to a short failure type.
+    """
+    import paramiko
+
+    if isinstance(error, socket.gaierror):
+        return "name_resolution"
+    if isinstance(error, (socket.timeout, TimeoutError)):
+        return "timeout"
+    if isinstance(error, paramiko.AuthenticationException):
+        return "auth"
+    if isinstance(error, (ConnectionRefusedError, paramiko.ssh_exception.NoValidConnectionsError)):
+        return "refused"
+    if isinstance(error, (paramiko.SSHException, EOFError)):
+        return "ssh"
+    if isinstance(error, OSError):
+        return "network"
+    return "other"
+
+
+@contextmanager
+def ssh_phase(phase, host):
+    """
+    Time one phase of an SSH or SFTP operation and count it as an error if it raises.
+    The phase is also a span of the current trace when tracing is enabled.
+    """
+    started = time.perf_counter()
+    try:
+        with span(phase, host=host):
+            yield
+    except Exception as e:
+        ssh_errors.inc(phase=phase, host=host, kind=classify_ssh_error(e))
+        raise
+    finally:
+        ssh_phase_duration.observe(time.perf_counter() - started, phase=phase, host=host)
+
+
+class _PooledConnection:
+    __slots__ = ("host", "client", "created", "last_used", "leases")
+
+    def __init__(self, host, client):
+        self.host = host
+        self.client = client
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.leases = 0
+
+
+class SSHConnectionPool:
+    """
+    Thread-safe pool holding at most one authenticated SSH connection per host.
+
+    A paramiko transport multiplexes channels, so several threads can run
+    commands or SFTP sessions over the same pooled connection at once.
+    Connections are health-checked before reuse, kept alive with SSH keepalive
+    packets, closed after IDLE_TIMEOUT seconds without use and evicted in
+    least-recently-used order when MAX_CONNECTIONS is reached.
+
+    Hosts that repeatedly cannot be reached are marked down by a circuit
+    breaker, so connecting to them fails fast with HostUnreachableError until a
+    background probe finds them reachable again.
+
+    New connections go through a HostResolver (see host_resolver.py), which
+    races every address a host is known by and adapts the connect timeout to
+    each address's latency.
+    """
+
+    def __init__(self, username=SSH_USERNAME, key_path=SSH_KEY_PATH, port=SSH_PORT,
+                 max_connections=MAX_CONNECTIONS, idle_timeout=IDLE_TIMEOUT,
+                 keepalive_interval=KEEPALIVE_INTERVAL, connect_timeout=CONNECT_TIMEOUT,
+                 breaker=None, addresses=None, resolver=None):
+        self.username = username
+        self.key_path = key_path
+        self.port = port
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.connect_timeout = connect_timeout
+        self.addresses = dict(addresses or {})  # host -> (address, port) overrides, like /etc/hosts
+        self.resolver = resolver  # the process-wide resolver when None
+        self.breaker = breaker or CircuitBreaker(probe=self._probe)
+
+        self._lock = threading.Lock()
+        self._connections = {}  # host -> _PooledConnection
+        self._host_locks = {}  # host -> lock serializing connection setup
+        self._private_key = None
+        self._host_key_policy = None
+        self._key_lock = threading.Lock()
+        self._reaper = None
+        self._closed = threading.Event()
+
+    # ------------------------------------------------------------------ keys
+
+    def private_key(self):
+        """
+        Load the private key once and cache it for every later connection.
+        """
+        if self._private_key is None:
+            with self._key_lock:
+                if self._private_key is None:
+                    self._private_key = self._load_private_key()
+        return self._private_key
+
+    def _load_private_key(self):
+        import paramiko
+
+        errors = []
+        for key_type in KEY_TYPES:
+            try:
+                return getattr(paramiko, key_type).from_private_key_file(self.key_path)
+            except (paramiko.SSHException, ValueError, TypeError) as e:
+                # Not a key of this type, or one paramiko cannot parse as it; try the next type
+                errors.append(f"{key_type}: {e}")
+        raise paramiko.SSHException(f"Cannot load private key {self.key_path} as any of {', '.join(KEY_TYPES)} "
+                                    f"({'; '.join(errors) or 'no key types'})")
+
+    def host_key_policy(self):
+        """
+        Return the policy for unknown host keys, created once and shared by every connection.
+        """
+        if self._host_key_policy is None:
+            import paramiko
+            self._host_key_policy = paramiko.AutoAddPolicy()
+        return self._host_key_policy
+
+    def prewarm(self):
+        """
+        Import paramiko and load the private key ahead of the first connection,
+        so the first remote operation does not pay for them.
+
+        :return: Seconds spent, or None if the key could not be loaded.
+        """
+        started = time.perf_counter()
+        try:
+            self.private_key()
+            self.host_key_policy()
+        except Exception as e:
+            logger.warning(f"Could not pre-load SSH key {self.key_path}: {str(e)}")
+            return None
+        elapsed = time.perf_counter() - started
+        logger.info(f"SSH key and crypto loaded in {elapsed * 1000:.0f} ms")
+        return elapsed
+
+    # ------------------------------------------------------------ lifecycle
+
+    def _host_lock(self, host):
+        with self._lock:
+            lock = self._host_locks.get(host)
+            if lock is None:
+                lock = self._host_locks[host] = threading.Lock()
+            return lock
+
+    def address_for(self, host):
+        """
+        Return the (address, port) to connect to for host.
+        """
+        return self.addresses.get(host, (host, self.port))
+
+    def _targets(self, resolver, host):
+        return [(address, *self.address_for(address)) for address in resolver.candidates(host)]
+
+    def _open_socket(self, host, exclude=()):
+        """
+        Open a TCP connection to the SSH port of whichever of host's addresses answers
+        first, leaving out the addresses in exclude. Returns (socket, address).
+
+        :raises LookupError: If exclude leaves no address to try.
+        """
+        resolver = self.resolver or get_resolver()
+        targets = [target for target in self._targets(resolver, host) if target[0] not in exclude]
+        if not targets:
+            raise LookupError(f"No other address to try for {host}")
+        return resolver.connect(host, targets, self.connect_timeout, phase=ssh_phase)
+
+    def _probe(self, host):
+        """
+        Return True if any of host's addresses accepts a TCP connection; used by the circuit breaker.
+        """
+        resolver = self.resolver or get_resolver()
+        try:
+            sock, _ = resolver.connect(host, self._targets(resolver, host), PROBE_TIMEOUT)
+        except OSError:
+            return False
+        sock.close()
+        return True
+
+    def _connect(self, host):
+        import paramiko
+
+        sock, address = self._open_socket(host)
+        try:
+            client = self._handshake(host, sock)
+        except paramiko.AuthenticationException:
+            # The host's sshd answered and refused the key; its other addresses reach the same sshd
+            raise
+        except (paramiko.SSHException, OSError) as error:
+            # The address that answered first may be a half-started miner or another device
+            # that took its IP address; give the host's other addresses one chance
+            try:
+                sock, other = self._open_socket(host, exclude=(address,))
+            except (LookupError, OSError):
+                raise error
+            logger.warning(f"SSH handshake with {host} at {address} failed ({error}); retrying at {other}")
+            client = self._handshake(host, sock)
+
+        transport = client.get_transport()
+        if transport is not None and self.keepalive_interval:
+            transport.set_keepalive(self.keepalive_interval)
+        logger.info(f"Opened pooled SSH connection to {host}")
+        return client
+
+    def _handshake(self, host, sock):
+        """
+        Log in over a connected socket and return the SSHClient; the socket is closed on failure.
+        """
+        import paramiko
+
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(self.host_key_policy())
+        try:
+            # Key exchange and public key authentication
+            with ssh_phase("handshake", host):
+                client.connect(
+                    hostname=host,
+                    port=self.address_for(host)[1],
+                    username=self.username,
+                    pkey=self.private_key(),
+                    sock=sock,
+                    timeout=self.connect_timeout,
+                    banner_timeout=self.connect_timeout,
+                    auth_timeout=self.connect_timeout
+                )
+        except Exception:
+            client.close()
+            sock.close()
+            raise
+        return client
+
+    def _connect_checked(self, host):
+        """
+        Connect to host through the circuit breaker, recording whether it was reachable.
+        """
+        self.breaker.check(host)
+        try:
+            client = self._connect(host)
+        except Exception as e:
+            if classify_ssh_error(e) in UNREACHABLE_ERRORS:
+                self.breaker.record_failure(host, e)
+            else:
+                self.breaker.end_trial(host, e)
+            raise
+        self.breaker.record_success(host)
+        return client
+
+    @staticmethod
+    def _is_healthy(conn):
+        transport = conn.client.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        try:
+            transport.send_ignore()
+        except Exception:
+            return False
+        return True
+
+    def _make_room(self):
+        """
+        Close the least recently used idle connection if the pool is full.
+        Must be called with self._lock held.
+        """
+        if len(self._connections) < self.max_connections:
+            return None
+        idle = [conn for conn in self._connections.values() if conn.leases == 0]
+        if not idle:
+            raise PoolExhaustedError(
+                f"All {self.max_connections} pooled SSH connections are in use"
+            )
+        victim = min(idle, key=lambda conn: conn.last_used)
+        del self._connections[victim.host]
+        return victim
+
+    def acquire(self, host):
+        """
+        Lease a connected paramiko.SSHClient for host, connecting if needed.
+
+        Every acquire must be paired with a release(). Returns a tuple of
+        (client, reused) where reused tells whether the connection existed
+        before this call.
+
+        :raises HostUnreachableError: If host is marked down by the circuit breaker.
+        """
+        with span("acquire", host=host) as acquiring:
+            client, reused = self._lease(host)
+            acquiring.set(reused=reused)
+            return client, reused
+
+    def _lease(self, host):
+        if self._closed.is_set():
+            raise RuntimeError("SSH connection pool is closed")
+
+        self.evict_idle()
+        with self._lock:
+            pooled = host in self._connections
+        if not pooled:
+            # Fail fast instead of queueing behind a connect that will time out;
+            # the trial itself is taken by _connect_checked
+            self.breaker.fail_fast(host)
+
+        with self._host_lock(host):
+            with self._lock:
+                conn = self._connections.get(host)
+
+            if conn is not None and conn.leases == 0 and not self._is_healthy(conn):
+                logger.info(f"Pooled SSH connection to {host} is no longer healthy; reconnecting")
+                self.discard(host, conn.client)
+                conn = None
+
+            reused = conn is not None
+            if conn is None:
+                with self._lock:
+                    victim = self._make_room()
+                if victim is not None:
+                    victim.client.close()
+                conn = _PooledConnection(host, self._connect_checked(host))
+                with self._lock:
+                    self._connections[host] = conn
+                self._start_reaper()
+
+            with self._lock:
+                conn.leases += 1
+                conn.last_used = time.monotonic()
+            ssh_connections.inc(host=host, reused=str(reused).lower())
+            return conn.client, reused
+
+    def release(self, host, client):
+        """
+        Return a leased client to the pool.
+        """
+        with self._lock:
+            conn = self._connections.get(host)
+            if conn is not None and conn.client is client:
+                conn.leases = max(0, conn.leases - 1)
+                conn.last_used = time.monotonic()
+
+    def discard(self, host, client=None):
+        """
+        Close and forget the pooled connection for host.
+
+        When client is given, only that exact connection is discarded, so a
+        connection that was already replaced by another thread stays open.
+        """
+        with self._lock:
+            conn = self._connections.get(host)
+            if conn is None or (client is not None and conn.client is not client):
+                conn = None
+            else:
+                del self._connections[host]
+        if conn is not None:
+            conn.client.close()
+        elif client is not None:
+            client.close()
+
+    @contextmanager
+    def connection(self, host):
+        """
+        Context manager leasing a pooled client for the duration of the block.
+        """
+        client, _ = self.acquire(host)
+        try:
+            yield client
+        finally:
+            self.release(host, client)
+
+    def run(self, host, operation, idempotent=False):
+        """
+        Call operation(client) on a pooled connection to host and return its result.
+
+        If a reused connection turns out to be broken mid-operation, it is
+        discarded. An idempotent operation is then retried once on a fresh
+        connection; any other is not, since the remote side may already have
+        run part of it (a restart, say) before the connection broke.
+        """
+        with span("ssh_operation", host=host):
+            return self._run(host, operation, idempotent)
+
+    def _run(self, host, operation, idempotent):
+        scope = _cancel_scope.get()
+        retried = False
+        while True:
+            client, reused = self.acquire(host)
+            try:
+                if scope is not None:
+                    scope._attach(client)
+                return operation(client)
+            except Exception as e:
+                transport = client.get_transport()
+                if transport is not None and transport.is_active():
+                    raise
+                self.discard(host, client)
+                if not idempotent or not reused or retried or (scope is not None and scope.cancelled):
+                    raise
+                retried = True
+                logger.warning(f"Pooled SSH connection to {host} broke ({e}); retrying on a new connection")
+            finally:
+                if scope is not None:
+                    scope._detach(client)
+                self.release(host, client)
+
+    def evict_idle(self):
+        """
+        Close connections that have not been used for idle_timeout seconds.
+        """
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            stale = [conn for conn in self._connections.values()
+                     if conn.leases == 0 and conn.last_used < cutoff]
+            for conn in stale:
+                del self._connections[conn.host]
+        for conn in stale:
+            logger.info(f"Closing idle SSH connection to {conn.host}")
+            conn.client.close()
+
+    def _start_reaper(self):
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap, name="ssh-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap(self):
+        interval = max(1.0, self.idle_timeout / 2)
+        while not self._closed.wait(interval):
+            self.evict_idle()
+
+    def close_all(self):
+        """
+        Close every pooled connection and stop the idle reaper.
+        """
+        self._closed.set()
+        self.breaker.stop()
+        with self._lock:
+            conns = list(self._connections.values())
+            self._connections.clear()
+        for conn in conns:
+            conn.client.close()
+
+    def stats(self):
+        """
+        Return a snapshot of the pooled connections for diagnostics.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "max_connections": self.max_connections,
+                "connections": [
+                    {
+                        "host": conn.host,
+                        "leases": conn.leases,
+                        "age": round(now - conn.created, 1),
+                        "idle": round(now - conn.last_used, 1)
+                    }
+                    for conn in self._connections.values()
+                ],
+                "unreachable": self.breaker.stats(),
+                "addresses": (self.resolver or get_resolver()).stats()
+            }
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Return the process-wide connection pool, creating it on first use.
+    """
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = SSHConnectionPool()
+                atexit.register(_default_pool.close_all)
+    return _default_pool
+
+
+def set_pool(pool):
+    """
+    Replace the process-wide connection pool, e.g. to point the service at
+    stand-in miners, and return the previous one. The caller closes it.
+    """
+    global _default_pool
+    with _default_pool_lock:
+        previous, _default_pool = _default_pool, pool
+    return previous
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Report how long the heater service takes to start.
+
+Each run starts a fresh Python process and measures how long importing
+heaterService takes and how long the first /heaters and / requests take
+after that. It also measures the one-time SSH setup (importing paramiko and
+loading the private key) that the first remote operation pays unless it was
+prewarmed. The "lazy" mode is the service as it ships. The "eager" mode
+imports paramiko up front, as the service used to, for comparison.
+
+Example:
+    python startup_report.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+MODES = ("lazy", "eager")
+HEAVY_MODULES = ("paramiko", "cryptography")
+CLIENT_KEY_BITS = 2048
+
+# Runs in a fresh interpreter: argv[1] is the mode, argv[2] the private key path
+_CHILD = r"""
+import json, sys, time
+started = time.perf_counter()
+if sys.argv[1] == "eager":
+    import paramiko
+import heaterService
+imported = time.perf_counter()
+
+client = heaterService.app.test_client()
+client.get("/heaters")
+first_request = time.perf_counter()
+client.get("/")
+second_request = time.perf_counter()
+loaded = [name for name in %(heavy)r if name in sys.modules]
+
+from ssh_pool import SSHConnectionPool
+pool = SSHConnectionPool(key_path=sys.argv[2])
+ssh_setup = pool.prewarm()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_request_ms": (first_request - imported) * 1000,
+    "index_request_ms": (second_request - first_request) * 1000,
+    "ssh_setup_ms": ssh_setup * 1000 if ssh_setup is not None else None,
+    "heavy_modules_at_startup": loaded
+}))
+""" % {"heavy": HEAVY_MODULES}
+
+
+def measure(mode, key_path, cwd=None):
+    """
+    Start the service in a fresh interpreter and return its timings.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}'. Valid modes: {', '.join(MODES)}")
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run([sys.executable, "-c", _CHILD, mode, key_path], cwd=cwd,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(mode, samples):
+    """
+    Return the median of each timing over several runs.
+    """
+    summary = {"mode": mode, "runs": len(samples), "heavy_modules_at_startup": samples[-1]["heavy_modules_at_startup"]}
+    for field in ("import_ms", "first_request_ms", "index_request_ms", "ssh_setup_ms"):
+        values = [sample[field] for sample in samples if sample[field] is not None]
+        summary[field] = round(statistics.median(values), 1) if values else None
+    return summary
+
+
+def run_report(runs=3, modes=MODES):
+    """
+    Measure every mode runs times and return one summary per mode.
+    """
+    import paramiko
+
+    with tempfile.TemporaryDirectory() as workdir:
+        key_path = os.path.join(workdir, "id_rsa")
+        paramiko.RSAKey.generate(CLIENT_KEY_BITS).write_private_key_file(key_path)
+        return [summarize(mode, [measure(mode, key_path) for _ in range(runs)]) for mode in modes]
+
+
+def print_report(results):
+    print(f"{'mode':<8}{'import ms':>12}{'1st req ms':>12}{'index ms':>10}{'ssh setup ms':>14}  loaded at startup")
+    for result in results:
+        print(f"{result['mode']:<8}{result['import_ms']:>12}{result['first_request_ms']:>12}"
+              f"{result['index_request_ms']:>10}{str(result['ssh_setup_ms']):>14}  "
+              f"{', '.join(result['heavy_modules_at_startup']) or '-'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure heater service import and first-request times.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh processes per mode (default: 3)")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = run_report(args.runs)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
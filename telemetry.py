@@ -0,0 +1,375 @@
+"""
+Background fleet telemetry: polls every heater's bosminer API and keeps
+fixed-size time series of its hashrate, temperatures, fan speed and power.
+
+bosminer exposes a cgminer-compatible JSON API on TCP port 4028. Each request
+is a JSON object such as {"command": "summary"} and the miner answers with a
+JSON document (terminated by a NUL byte) before closing the connection.
+
+Samples are stored per heater and metric in array-backed ring buffers, and are
+rolled up into 1-minute and 1-hour buckets as they arrive, so a time-range
+query is a binary search over the matching resolution instead of a scan of the
+raw samples.
+"""
+
+import json
+import logging
+import math
+import socket
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# bosminer API
+MINER_API_PORT = 4028
+MINER_API_TIMEOUT = 3  # seconds per API request
+
+# Collector
+POLL_INTERVAL = 30  # seconds between fleet polls
+POLL_WORKERS = 16  # heaters polled in parallel
+
+# Retention per heater and metric
+RAW_SAMPLES = 720  # 6 hours at the default poll interval
+MINUTE_BUCKETS = 24 * 60  # 1 day of 1-minute rollups
+HOUR_BUCKETS = 30 * 24  # 30 days of 1-hour rollups
+
+METRICS = ("up", "hashrate_ths", "temp_board_c", "temp_chip_c", "fan_rpm", "power_w")
+RESOLUTIONS = {"raw": None, "1m": 60, "1h": 3600}
+
+
+class MinerAPIError(Exception):
+    """Raised when the bosminer API cannot be reached or returns an error."""
+
+
+def query_miner_api(host, command, port=MINER_API_PORT, timeout=MINER_API_TIMEOUT):
+    """
+    Send one command to a miner's bosminer API and return the decoded response.
+    """
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            sock.sendall(json.dumps({"command": command}).encode("utf-8"))
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                if chunk.endswith(b"\0"):
+                    break
+    except OSError as e:
+        raise MinerAPIError(f"{host}:{port} {command}: {str(e)}") from e
+    return decode_miner_response(host, port, command, b"".join(chunks))
+
+
+def decode_miner_response(host, port, command, raw):
+    """
+    Decode the NUL-terminated JSON answer of the bosminer API.
+
+    :raises MinerAPIError: If the answer is not a JSON object or reports an error.
+    """
+    try:
+        response = json.loads(raw.rstrip(b"\0").decode("utf-8"))
+        status = (response.get("STATUS") or [{}])[0]
+        failed = status.get("STATUS") == "E"
+    except (ValueError, TypeError, AttributeError, LookupError) as e:
+        raise MinerAPIError(f"{host}:{port} {command}: invalid response") from e
+    if failed:
+        raise MinerAPIError(f"{host}:{port} {command}: {status.get('Msg', 'error')}")
+    return response
+
+
+def read_miner_metrics(host, port=MINER_API_PORT, timeout=MINER_API_TIMEOUT):
+    """
+    Read the current metrics of one miner.
+
+    :return: Dict of metric name to value; metrics the miner does not report are omitted.
+    :raises MinerAPIError: If the miner cannot be queried or answers in an unexpected shape.
+    """
+    try:
+        return _read_metrics(host, port, timeout)
+    except (ValueError, TypeError, AttributeError, LookupError) as e:
+        raise MinerAPIError(f"{host}:{port}: unexpected metrics: {str(e)}") from e
+
+
+def _read_metrics(host, port, timeout):
+    metrics = {"up": 1.0}
+
+    summary = (query_miner_api(host, "summary", port, timeout).get("SUMMARY") or [{}])[0]
+    mhs = summary.get("MHS 5s", summary.get("MHS av"))
+    if mhs is not None:
+        metrics["hashrate_ths"] = float(mhs) / 1e6
+
+    temps = query_miner_api(host, "temps", port, timeout).get("TEMPS") or []
+    board = [float(t["Board"]) for t in temps if t.get("Board") is not None]
+    chip = [float(t["Chip"]) for t in temps if t.get("Chip") is not None]
+    if board:
+        metrics["temp_board_c"] = max(board)
+    if chip:
+        metrics["temp_chip_c"] = max(chip)
+
+    fans = [float(f["RPM"]) for f in query_miner_api(host, "fans", port, timeout).get("FANS") or []
+            if f.get("RPM") is not None]
+    if fans:
+        metrics["fan_rpm"] = sum(fans) / len(fans)
+
+    try:
+        tuner = (query_miner_api(host, "tunerstatus", port, timeout).get("TUNERSTATUS") or [{}])[0]
+    except MinerAPIError:
+        tuner = {}  # Older bosminer releases have no tuner status
+    power = tuner.get("ApproximateMinerPowerConsumption")
+    if power is not None:
+        metrics["power_w"] = float(power)
+
+    return metrics
+
+
+def _bisect(length, key_at, target):
+    """
+    Return the first logical index whose key is >= target.
+    """
+    low, high = 0, length
+    while low < high:
+        middle = (low + high) // 2
+        if key_at(middle) < target:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class RingBuffer:
+    """
+    Fixed-capacity series of (timestamp, value) samples in two array('d')s.
+    Once full, each new sample overwrites the oldest one.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        self.start = 0  # physical index of the oldest sample
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _physical(self, index):
+        return (self.start + index) % self.capacity
+
+    def append(self, timestamp, value):
+        if self.size < self.capacity:
+            position = self._physical(self.size)
+            self.size += 1
+        else:
+            position = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.times[position] = timestamp
+        self.values[position] = value
+
+    def last(self):
+        if not self.size:
+            return None
+        position = self._physical(self.size - 1)
+        return self.times[position], self.values[position]
+
+    def range(self, start, end):
+        """
+        Return [(timestamp, value), ...] with start <= timestamp < end.
+        Timestamps are appended in order, so both ends are found by binary search.
+        """
+        key_at = lambda index: self.times[self._physical(index)]
+        first = _bisect(self.size, key_at, start)
+        stop = _bisect(self.size, key_at, end)
+        return [(self.times[self._physical(i)], self.values[self._physical(i)]) for i in range(first, stop)]
+
+
+class Rollup:
+    """
+    Fixed-capacity series of time buckets holding count, sum, min and max.
+    """
+
+    def __init__(self, bucket_seconds, capacity):
+        self.bucket_seconds = bucket_seconds
+        self.starts = RingBuffer(capacity)
+        self.counts = array("d", bytes(8 * capacity))
+        self.sums = array("d", bytes(8 * capacity))
+        self.mins = array("d", bytes(8 * capacity))
+        self.maxs = array("d", bytes(8 * capacity))
+
+    def add(self, timestamp, value):
+        bucket = math.floor(timestamp / self.bucket_seconds) * self.bucket_seconds
+        last = self.starts.last()
+        if last is None or last[0] < bucket:
+            self.starts.append(bucket, 0.0)
+            position = self.starts._physical(len(self.starts) - 1)
+            self.counts[position] = 0
+            self.sums[position] = 0.0
+            self.mins[position] = value
+            self.maxs[position] = value
+        elif last[0] > bucket:
+            return  # Late sample for a bucket that was already closed
+        position = self.starts._physical(len(self.starts) - 1)
+        self.counts[position] += 1
+        self.sums[position] += value
+        self.mins[position] = min(self.mins[position], value)
+        self.maxs[position] = max(self.maxs[position], value)
+
+    def range(self, start, end):
+        """
+        Return bucket summaries for buckets starting in [start, end).
+        """
+        starts = self.starts
+        key_at = lambda index: starts.times[starts._physical(index)]
+        first = _bisect(len(starts), key_at, math.floor(start / self.bucket_seconds) * self.bucket_seconds)
+        stop = _bisect(len(starts), key_at, end)
+        points = []
+        for index in range(first, stop):
+            position = starts._physical(index)
+            count = self.counts[position]
+            points.append({
+                "t": starts.times[position],
+                "avg": self.sums[position] / count,
+                "min": self.mins[position],
+                "max": self.maxs[position],
+                "count": int(count)
+            })
+        return points
+
+
+class Series:
+    """
+    Raw samples plus 1-minute and 1-hour rollups for one heater metric.
+    """
+
+    def __init__(self, raw_samples=RAW_SAMPLES, minute_buckets=MINUTE_BUCKETS, hour_buckets=HOUR_BUCKETS):
+        self.raw = RingBuffer(raw_samples)
+        self.rollups = {"1m": Rollup(60, minute_buckets), "1h": Rollup(3600, hour_buckets)}
+
+    def add(self, timestamp, value):
+        last = self.raw.last()
+        if last is not None and timestamp < last[0]:
+            return  # Keep the raw series ordered
+        self.raw.append(timestamp, value)
+        for rollup in self.rollups.values():
+            rollup.add(timestamp, value)
+
+    def range(self, start, end, resolution):
+        if resolution == "raw":
+            return [{"t": t, "value": v} for t, v in self.raw.range(start, end)]
+        return self.rollups[resolution].range(start, end)
+
+
+class TelemetryStore:
+    """
+    Thread-safe collection of Series keyed by heater name and metric.
+    """
+
+    def __init__(self, raw_samples=RAW_SAMPLES):
+        self.raw_samples = raw_samples
+        self._lock = threading.Lock()
+        self._series = {}  # heater name -> metric -> Series
+        self._latest = {}  # heater name -> (timestamp, metrics)
+
+    def record(self, heater_name, metrics, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            series = self._series.setdefault(heater_name, {})
+            for metric, value in metrics.items():
+                if metric not in series:
+                    series[metric] = Series(self.raw_samples)
+                series[metric].add(timestamp, value)
+            self._latest[heater_name] = (timestamp, dict(metrics))
+
+    def latest(self):
+        """
+        Return the most recent sample of every heater.
+        """
+        with self._lock:
+            return {name: {"t": t, "metrics": metrics} for name, (t, metrics) in self._latest.items()}
+
+    def choose_resolution(self, start, end):
+        """
+        Pick the finest resolution whose retention still covers the range.
+        """
+        span = end - start
+        if span <= self.raw_samples * POLL_INTERVAL:
+            return "raw"
+        if span <= MINUTE_BUCKETS * 60:
+            return "1m"
+        return "1h"
+
+    def query(self, heater_name, metric, start, end, resolution="auto"):
+        """
+        Return the points of one heater metric between start and end (epoch seconds).
+
+        :raises KeyError: If nothing was recorded for the heater or metric.
+        :raises ValueError: If the resolution is unknown.
+        """
+        if resolution == "auto":
+            resolution = self.choose_resolution(start, end)
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Invalid resolution. Valid resolutions: {['auto'] + list(RESOLUTIONS)}")
+        with self._lock:
+            series = self._series[heater_name][metric]
+            return resolution, series.range(start, end, resolution)
+
+
+class TelemetryCollector:
+    """
+    Polls every heater concurrently on a fixed interval and records the results.
+
+    :param heaters: Callable returning the current list of heater entries.
+    :param store: TelemetryStore receiving the samples.
+    """
+
+    def __init__(self, heaters, store, interval=POLL_INTERVAL, port=MINER_API_PORT,
+                 timeout=MINER_API_TIMEOUT, workers=POLL_WORKERS):
+        self.heaters = heaters
+        self.store = store
+        self.interval = interval
+        self.port = port
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="telemetry")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll_heater(self, heater):
+        host = heater.get("ipAddress") or f"{heater['hostname']}.local"
+        try:
+            metrics = read_miner_metrics(host, self.port, self.timeout)
+        except MinerAPIError as e:
+            logger.debug(f"Telemetry poll failed for {heater['heaterName']}: {str(e)}")
+            metrics = {"up": 0.0}
+        self.store.record(heater["heaterName"], metrics)
+        return metrics
+
+    def poll_once(self):
+        """
+        Poll the whole fleet in parallel and return {heater name: metrics}.
+        """
+        heaters = list(self.heaters())
+        results = self._executor.map(self.poll_heater, heaters)
+        return {heater["heaterName"]: metrics for heater, metrics in zip(heaters, results)}
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.error(f"Telemetry poll failed: {str(e)}")
+            self._stop.wait(max(0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="telemetry-collector", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=False)
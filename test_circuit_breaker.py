@@ -0,0 +1,123 @@
+import socket
+import threading
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+import paramiko
+from circuit_breaker import CircuitBreaker, HostUnreachableError, OPEN, HALF_OPEN
+from ssh_pool import SSHConnectionPool
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=2, base_backoff=30, max_backoff=100)
+        self.addCleanup(self.breaker.stop)
+
+    def test_host_is_marked_down_after_threshold(self):
+        self.breaker.record_failure('miner1')
+        self.breaker.check('miner1')
+
+        self.breaker.record_failure('miner1')
+        with self.assertRaises(HostUnreachableError) as caught:
+            self.breaker.check('miner1')
+        self.assertEqual(caught.exception.retry_after, 30)
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure('miner1')
+        self.breaker.record_success('miner1')
+        self.breaker.record_failure('miner1')
+        self.breaker.check('miner1')
+
+    def test_one_trial_after_backoff_then_doubling(self):
+        self.breaker.record_failure('miner1')
+        self.breaker.record_failure('miner1')
+
+        with patch('circuit_breaker.time.monotonic', return_value=time.monotonic() + 31):
+            self.breaker.check('miner1')  # trial goes through
+            with self.assertRaises(HostUnreachableError):
+                self.breaker.check('miner1')  # others keep failing fast
+
+        self.breaker.record_failure('miner1')
+        self.assertAlmostEqual(self.breaker.retry_after('miner1'), 60, delta=1)
+
+    def test_backoff_is_capped(self):
+        for _ in range(10):
+            self.breaker.record_failure('miner1')
+        self.assertLessEqual(self.breaker.retry_after('miner1'), 100)
+
+    def test_background_probe_marks_host_up(self):
+        probed = threading.Event()
+
+        def probe(host):
+            probed.set()
+            return True
+
+        breaker = CircuitBreaker(failure_threshold=1, base_backoff=0.01, probe=probe)
+        self.addCleanup(breaker.stop)
+        breaker.record_failure('miner1')
+
+        self.assertTrue(probed.wait(2))
+        for _ in range(100):
+            if not breaker.stats():
+                break
+            time.sleep(0.01)
+        breaker.check('miner1')
+
+    def test_stats_lists_down_hosts(self):
+        self.breaker.record_failure('miner1', OSError('no route'))
+        self.breaker.record_failure('miner1', OSError('no route'))
+
+        [entry] = self.breaker.stats()
+        self.assertEqual((entry['host'], entry['state'], entry['lastError']), ('miner1', OPEN, 'no route'))
+
+class TestBreakerThroughPool(unittest.TestCase):
+    """Drives trials after the backoff through SSHConnectionPool.acquire."""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=1, base_backoff=0.05)
+        self.pool = SSHConnectionPool(breaker=self.breaker)
+        self.addCleanup(self.pool.close_all)
+        connect_patcher = patch.object(SSHConnectionPool, '_connect')
+        self.mock_connect = connect_patcher.start()
+        self.addCleanup(connect_patcher.stop)
+
+    def mark_down(self):
+        self.mock_connect.side_effect = socket.timeout('timed out')
+        with self.assertRaises(socket.timeout):
+            self.pool.acquire('miner1')
+        with self.assertRaises(HostUnreachableError):
+            self.pool.acquire('miner1')
+        time.sleep(0.06)
+
+    def test_trial_after_backoff_connects_and_closes_breaker(self):
+        self.mark_down()
+        states = []
+
+        def connect(host):
+            states.append(self.breaker.stats()[0]['state'])
+            return MagicMock()
+        self.mock_connect.side_effect = connect
+
+        client, reused = self.pool.acquire('miner1')
+        self.pool.release('miner1', client)
+
+        self.assertEqual(states, [HALF_OPEN])
+        self.assertEqual(self.mock_connect.call_count, 2)
+        self.assertEqual(self.breaker.stats(), [])
+
+    def test_trial_failing_for_another_reason_reopens(self):
+        self.mark_down()
+        self.mock_connect.side_effect = paramiko.AuthenticationException()
+        with self.assertRaises(paramiko.AuthenticationException):
+            self.pool.acquire('miner1')
+        self.assertEqual(self.breaker.stats()[0]['state'], OPEN)
+
+        # The next trial after the doubled backoff goes through again
+        time.sleep(0.11)
+        self.mock_connect.side_effect = None
+        self.mock_connect.return_value = MagicMock()
+        self.pool.acquire('miner1')
+        self.assertEqual(self.breaker.stats(), [])
+
+if __name__ == '__main__':
+    unittest.main()
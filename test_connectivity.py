@@ -4,20 +4,32 @@ Connectivity test tool for Bitcoin heater miners.
 Tests SSH access to each miner defined in heaters.json.
 """
 
+import argparse
+import asyncio
 import json
 import paramiko
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from datetime import datetime
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
+
+from history import HistoryStore, HISTORY_DB_PATH
+from host_resolver import get_resolver, heater_addresses, race_async
 
 # SSH Configuration
 SSH_USERNAME = "root"
 SSH_KEY_PATH = os.path.expanduser("~/.ssh/id_rsa")
-CONNECTION_TIMEOUT = 5  # seconds
+SSH_PORT = 22
+CONNECTION_TIMEOUT = 5  # seconds; cap of the adaptive connect timeout, and the SSH banner timeout
+DEFAULT_CONCURRENCY = 10  # miners probed in parallel
 
-def test_ssh_connection(hostname: str, ip_address: str) -> Dict:
+def test_ssh_connection(hostname: str, ip_address: str, timeout: float = CONNECTION_TIMEOUT) -> Dict:
     """
-    Test SSH connection to a miner using both hostname.local and IP address.
+    Test SSH connection to a miner, racing hostname.local and the IP address
+    (see host_resolver.py) and logging in through whichever connects first;
+    if that login fails for any reason but a refused key, the other address is tried once. Connect timeouts adapt to each address's latency, up to timeout seconds.
 
     Returns:
         Dictionary with connection status and details
@@ -30,49 +42,34 @@ def test_ssh_connection(hostname: str, ip_address: str) -> Dict:
         "error": None,
         "auth_method": None
     }
+    # hostname.local gets the head start, so a working mDNS name is reported as such
+    addresses = heater_addresses(hostname, ip_address)[::-1]
+    if not addresses:
+        result["error"] = "No hostname or IP address"
+        return result
+    refused = []  # addresses whose sshd refused the key
+
+    def log_in(targets: List[str]) -> Optional[str]:
+        # Connect to whichever target answers first, log in and run a test command;
+        # returns the address that answered, and records the outcome in result
+        try:
+            sock, address = get_resolver().connect(hostname or ip_address,
+                                                   [(target, target, SSH_PORT) for target in targets], timeout)
+        except Exception as e:
+            result["error"] = result["error"] or f"Connection error: {str(e)}"
+            return None
 
-    # Try hostname.local first
-    try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-        client.connect(
-            hostname=f"{hostname}.local",
-            username=SSH_USERNAME,
-            key_filename=SSH_KEY_PATH,
-            timeout=CONNECTION_TIMEOUT,
-            banner_timeout=CONNECTION_TIMEOUT
-        )
-
-        # Test command execution
-        stdin, stdout, stderr = client.exec_command("echo 'test'")
-        exit_code = stdout.channel.recv_exit_status()
-
-        if exit_code == 0:
-            result["hostname_status"] = "SUCCESS"
-            result["auth_method"] = "SSH Key"
-
-        client.close()
-
-    except paramiko.AuthenticationException:
-        result["error"] = "Authentication failed - SSH key not authorized"
-    except paramiko.SSHException as e:
-        result["error"] = f"SSH error: {str(e)}"
-    except Exception as e:
-        result["error"] = f"Connection error: {str(e)}"
-
-    # Try IP address if hostname failed
-    if result["hostname_status"] == "FAIL":
         try:
             client = paramiko.SSHClient()
             client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
             client.connect(
-                hostname=ip_address,
+                hostname=address,
                 username=SSH_USERNAME,
                 key_filename=SSH_KEY_PATH,
-                timeout=CONNECTION_TIMEOUT,
-                banner_timeout=CONNECTION_TIMEOUT
+                sock=sock,
+                timeout=timeout,
+                banner_timeout=timeout
             )
 
             # Test command execution
@@ -80,29 +77,43 @@ def test_ssh_connection(hostname: str, ip_address: str) -> Dict:
             exit_code = stdout.channel.recv_exit_status()
 
             if exit_code == 0:
-                result["ip_status"] = "SUCCESS"
+                result["ip_status" if address == ip_address else "hostname_status"] = "SUCCESS"
                 result["auth_method"] = "SSH Key"
-                result["error"] = None  # Clear error if IP works
+                result["error"] = None
 
             client.close()
 
+        except paramiko.AuthenticationException:
+            result["error"] = "Authentication failed - SSH key not authorized"
+            refused.append(address)
+        except paramiko.SSHException as e:
+            result["error"] = f"SSH error: {str(e)}"
         except Exception as e:
-            # Keep the original error if both fail
-            if result["error"] is None:
-                result["error"] = f"IP connection error: {str(e)}"
+            result["error"] = f"Connection error: {str(e)}"
+        finally:
+            sock.close()
+        return address
+
+    address = log_in(addresses)
+    # The address that answered first may be a half-started miner or another device
+    # that took its IP address; give the other address one chance. A refused key
+    # is not retried, as the other address reaches the same sshd
+    others = [other for other in addresses if other != address]
+    if address is not None and result["error"] and not refused and others:
+        log_in(others)
 
     return result
 
-def test_all_miners(heaters_json_path: str = "./heaters.json") -> List[Dict]:
+def load_heaters(heaters_json_path: str = "./heaters.json") -> List[Dict]:
     """
-    Test connectivity to all miners defined in heaters.json.
+    Load the miner definitions from heaters.json.
 
     Returns:
-        List of test results for each miner
+        List of heater entries, or an empty list if the file cannot be read
     """
     try:
         with open(heaters_json_path, 'r') as file:
-            heaters = json.load(file)
+            return json.load(file)
     except FileNotFoundError:
         print(f"ERROR: Heaters JSON file not found at {heaters_json_path}")
         return []
@@ -110,7 +121,213 @@ def test_all_miners(heaters_json_path: str = "./heaters.json") -> List[Dict]:
         print(f"ERROR: Invalid JSON format in {heaters_json_path}")
         return []
 
-    results = []
+def probe_miner(heater: Dict, timeout: float = CONNECTION_TIMEOUT) -> Dict:
+    """
+    Run the SSH connectivity test for a single heater entry.
+
+    Returns:
+        Test result annotated with the heater's name, location, type and
+        the time the test took in milliseconds
+    """
+    started = time.monotonic()
+    result = test_ssh_connection(heater.get("hostname", ""), heater.get("ipAddress", ""), timeout)
+    result["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+    result["heater_name"] = heater.get("heaterName", "Unknown")
+    result["location"] = heater.get("location", "Unknown")
+    result["type"] = heater.get("type", "Unknown")
+    return result
+
+def budget_exceeded_result(heater: Dict, budget: float) -> Dict:
+    """
+    Build a failed result for a miner that did not finish within the time budget.
+    """
+    return {
+        "hostname": heater.get("hostname", ""),
+        "ip_address": heater.get("ipAddress", ""),
+        "hostname_status": "FAIL",
+        "ip_status": "FAIL",
+        "error": f"Time budget of {budget:g}s exceeded",
+        "auth_method": None,
+        "latency_ms": None,
+        "heater_name": heater.get("heaterName", "Unknown"),
+        "location": heater.get("location", "Unknown"),
+        "type": heater.get("type", "Unknown")
+    }
+
+def print_miner_result(heater: Dict, result: Dict):
+    """
+    Print the details and outcome of a single miner test.
+    """
+    print(f"Testing: {result['heater_name']} ({result['location']})")
+    print(f"  Type: {result['type']}")
+    print(f"  Hostname: {heater.get('hostname', '')}.local")
+    print(f"  IP Address: {heater.get('ipAddress', '')}")
+
+    if result["hostname_status"] == "SUCCESS":
+        print(f"  ✓ Status: SUCCESS (via hostname)")
+    elif result["ip_status"] == "SUCCESS":
+        print(f"  ✓ Status: SUCCESS (via IP address)")
+    else:
+        print(f"  ✗ Status: FAILED")
+        if result["error"]:
+            print(f"    Error: {result['error']}")
+
+    print()
+
+def record_result(history: HistoryStore, result: Dict):
+    """
+    Append a miner's test result to the connectivity history.
+    """
+    if result["hostname_status"] == "SUCCESS":
+        method = "hostname"
+    elif result["ip_status"] == "SUCCESS":
+        method = "ip"
+    else:
+        method = None
+    history.record_probe(result["heater_name"], result["hostname"], method is not None,
+                         result.get("latency_ms"), method, result["error"])
+
+def scan_fleet(heaters: List[Dict], concurrency: int = DEFAULT_CONCURRENCY,
+               budget: Optional[float] = None, on_result: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """
+    Probe every miner in parallel with at most concurrency connections in flight.
+
+    Each result is printed (and passed to on_result, if given) as soon as its
+    miner finishes. When budget is given,
+    the scan stops waiting after that many seconds and every miner still
+    outstanding is reported as failed; connection timeouts are also clamped to
+    the remaining budget so stragglers exit promptly.
+
+    Returns:
+        List of test results in the same order as heaters
+    """
+    results: List[Optional[Dict]] = [None] * len(heaters)
+    print_lock = threading.Lock()
+    deadline = time.monotonic() + budget if budget is not None else None
+
+    def run_probe(heater):
+        timeout = CONNECTION_TIMEOUT
+        if deadline is not None:
+            timeout = max(0.1, min(timeout, deadline - time.monotonic()))
+        return probe_miner(heater, timeout)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(heaters) or 1)))
+    try:
+        futures = {executor.submit(run_probe, heater): index for index, heater in enumerate(heaters)}
+        remaining = None if deadline is None else max(0, deadline - time.monotonic())
+        try:
+            for future in as_completed(futures, timeout=remaining):
+                index = futures[future]
+                results[index] = future.result()
+                with print_lock:
+                    print_miner_result(heaters[index], results[index])
+                    if on_result is not None:
+                        on_result(results[index])
+        except FuturesTimeoutError:
+            pass
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    for index, heater in enumerate(heaters):
+        if results[index] is None:
+            results[index] = budget_exceeded_result(heater, budget)
+            print_miner_result(heater, results[index])
+            if on_result is not None:
+                on_result(results[index])
+
+    return results
+
+def scan_fleet_async(heaters: List[Dict], concurrency: int = DEFAULT_CONCURRENCY,
+                     budget: Optional[float] = None, on_result: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """
+    Probe every miner from one asyncio event loop using the remote engine
+    (see remote_engine.py), with at most concurrency operations in flight.
+
+    Behaves like scan_fleet: results are printed as miners finish, and miners
+    still outstanding when the budget runs out are reported as failed.
+
+    Returns:
+        List of test results in the same order as heaters
+    """
+    from remote_engine import RemoteEngine, SyncBridge
+
+    results: List[Optional[Dict]] = [None] * len(heaters)
+    timeout = CONNECTION_TIMEOUT if budget is None else max(0.1, min(CONNECTION_TIMEOUT, budget))
+    bridge = SyncBridge(RemoteEngine(concurrency=max(1, concurrency), timeout=timeout))
+
+    async def probe(index, heater):
+        hostname, ip_address = heater.get("hostname", ""), heater.get("ipAddress", "")
+        result = {
+            "hostname": hostname,
+            "ip_address": ip_address,
+            "hostname_status": "FAIL",
+            "ip_status": "FAIL",
+            "error": None,
+            "auth_method": None,
+            "heater_name": heater.get("heaterName", "Unknown"),
+            "location": heater.get("location", "Unknown"),
+            "type": heater.get("type", "Unknown"),
+            "latency_ms": None
+        }
+        started = time.monotonic()
+
+        # Race hostname.local and the IP address; the first to answer wins
+        addresses = heater_addresses(hostname, ip_address)[::-1]
+        if addresses:
+            host, outcome = await race_async(addresses, lambda host: bridge.engine.execute(host, "echo 'test'"),
+                                             lambda outcome: outcome.get("exit_code") == 0)
+            if outcome.get("exit_code") == 0:
+                result["ip_status" if host == ip_address else "hostname_status"] = "SUCCESS"
+                result["auth_method"] = "SSH Key"
+            else:
+                result["error"] = outcome.get("error") or f"Exit code {outcome.get('exit_code')}"
+        else:
+            result["error"] = "No hostname or IP address"
+
+        result["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+        results[index] = result
+        print_miner_result(heater, result)
+        if on_result is not None:
+            on_result(result)
+
+    async def scan():
+        tasks = [asyncio.ensure_future(probe(index, heater)) for index, heater in enumerate(heaters)]
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=budget)
+            for task in pending:
+                task.cancel()
+
+    try:
+        bridge.call(scan())
+    finally:
+        bridge.close()
+
+    for index, heater in enumerate(heaters):
+        if results[index] is None:
+            results[index] = budget_exceeded_result(heater, budget)
+            print_miner_result(heater, results[index])
+            if on_result is not None:
+                on_result(results[index])
+
+    return results
+
+def test_all_miners(heaters_json_path: str = "./heaters.json", concurrency: int = 1,
+                    budget: Optional[float] = None, engine: str = "threads",
+                    on_result: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """
+    Test connectivity to all miners defined in heaters.json.
+
+    With concurrency of 1 and no budget the miners are tested one at a time;
+    otherwise the fleet is scanned in parallel by scan_fleet. With the "async"
+    engine the fleet is scanned from one event loop by scan_fleet_async.
+    on_result, if given, is called with each result as soon as it is known.
+
+    Returns:
+        List of test results for each miner
+    """
+    heaters = load_heaters(heaters_json_path)
+    if not heaters:
+        return []
 
     print(f"\n{'='*80}")
     print(f"Bitcoin Heater Miner Connectivity Test")
@@ -118,35 +335,20 @@ def test_all_miners(heaters_json_path: str = "./heaters.json") -> List[Dict]:
     print(f"Testing {len(heaters)} miners...")
     print(f"{'='*80}\n")
 
+    if engine == "async":
+        return scan_fleet_async(heaters, concurrency, budget, on_result)
+    if concurrency > 1 or budget is not None:
+        return scan_fleet(heaters, concurrency, budget, on_result)
+
+    results = []
     for heater in heaters:
-        heater_name = heater.get("heaterName", "Unknown")
-        hostname = heater.get("hostname", "")
-        ip_address = heater.get("ipAddress", "")
-        location = heater.get("location", "Unknown")
-        miner_type = heater.get("type", "Unknown")
-
-        print(f"Testing: {heater_name} ({location})")
-        print(f"  Type: {miner_type}")
-        print(f"  Hostname: {hostname}.local")
-        print(f"  IP Address: {ip_address}")
-
-        result = test_ssh_connection(hostname, ip_address)
-        result["heater_name"] = heater_name
-        result["location"] = location
-        result["type"] = miner_type
+        result = probe_miner(heater)
         results.append(result)
 
         # Print immediate result
-        if result["hostname_status"] == "SUCCESS":
-            print(f"  ✓ Status: SUCCESS (via hostname)")
-        elif result["ip_status"] == "SUCCESS":
-            print(f"  ✓ Status: SUCCESS (via IP address)")
-        else:
-            print(f"  ✗ Status: FAILED")
-            if result["error"]:
-                print(f"    Error: {result['error']}")
-
-        print()
+        print_miner_result(heater, result)
+        if on_result is not None:
+            on_result(result)
 
     return results
 
@@ -205,17 +407,43 @@ def print_summary(results: List[Dict]):
         if timeout_failures > 0:
             print(f"  • {timeout_failures} miner(s) timed out - check if they are powered on and network accessible")
 
+def parse_args():
+    """
+    Parse command line options.
+    """
+    parser = argparse.ArgumentParser(description="Test SSH connectivity to every miner in heaters.json.")
+    parser.add_argument("--heaters", default="./heaters.json", help="Path to the heaters JSON file")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Number of miners probed in parallel (1 tests them one at a time)")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="Total time budget for the scan in seconds")
+    parser.add_argument("--engine", choices=("threads", "async"), default="threads",
+                        help="Scan with one thread per miner or from one asyncio event loop")
+    parser.add_argument("--history", default=HISTORY_DB_PATH,
+                        help=f"SQLite file the results are appended to (default: {HISTORY_DB_PATH})")
+    parser.add_argument("--no-history", action="store_true", help="Do not record the results in the history")
+    return parser.parse_args()
+
 def main():
     """
     Main function to run connectivity tests.
     """
+    args = parse_args()
+
     # Check if SSH key exists
     if not os.path.exists(SSH_KEY_PATH):
         print(f"ERROR: SSH private key not found at {SSH_KEY_PATH}")
         print("Generate a key pair with: ssh-keygen -t rsa -b 4096")
         return
 
-    results = test_all_miners()
+    # Append each result to the history as it comes in
+    history = None if args.no_history else HistoryStore(args.history)
+    on_result = (lambda result: record_result(history, result)) if history is not None else None
+    try:
+        results = test_all_miners(args.heaters, args.concurrency, args.budget, args.engine, on_result)
+    finally:
+        if history is not None:
+            history.close()
 
     if results:
         print_summary(results)
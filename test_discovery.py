@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+import paramiko
+import discovery
+from fake_miner import FakeMiner
+from remote_engine import RemoteEngine, PoolBackend
+from ssh_pool import SSHConnectionPool, set_pool
+
+VERSION = {"STATUS": [{"STATUS": "S"}], "VERSION": [{"BOSminer": "0.2.0-9e5a3d1a5f", "API": "3.7"}]}
+
+class FakeMinerAPI(socketserver.BaseRequestHandler):
+    """Answers the bosminer API 'version' command."""
+
+    def handle(self):
+        self.request.recv(4096)
+        self.request.sendall(json.dumps(VERSION).encode() + b"\0")
+
+def host(address, hostname, firmware="BOSminer 0.2.0", ports=(22, 4028)):
+    return {"ipAddress": address, "ports": list(ports), "sshBanner": "SSH-2.0-dropbear", "firmware": firmware,
+            "hostname": hostname, "hostnameSource": "ssh"}
+
+HEATERS = [
+    {"heaterName": "office", "hostname": "s9office", "type": "standard", "location": "Office",
+     "ipAddress": "192.168.1.10", "limitPower": False},
+    {"heaterName": "loft", "hostname": "s9loft", "type": "quiet", "location": "Loft",
+     "ipAddress": "192.168.1.11", "limitPower": True},
+]
+
+class TestProposeUpdates(unittest.TestCase):
+
+    def test_updates_moved_heaters_only(self):
+        proposal = discovery.propose_updates(HEATERS, [host("192.168.1.20", "s9office"), host("192.168.1.11", "s9loft")])
+
+        self.assertEqual(proposal["changes"], [{"heaterName": "office", "hostname": "s9office",
+                                                "old": "192.168.1.10", "new": "192.168.1.20"}])
+        self.assertEqual(proposal["heaters"][0], dict(HEATERS[0], ipAddress="192.168.1.20"))
+        self.assertEqual(proposal["heaters"][1], HEATERS[1])
+        self.assertEqual(HEATERS[0]["ipAddress"], "192.168.1.10")
+        self.assertEqual(proposal["missing"], [])
+
+    def test_matches_hostnames_case_insensitively(self):
+        proposal = discovery.propose_updates(HEATERS, [host("192.168.1.20", "S9Office")])
+        self.assertEqual(proposal["changes"][0]["new"], "192.168.1.20")
+        self.assertEqual(proposal["missing"], ["loft"])
+
+    def test_new_miners_are_only_added_on_request(self):
+        hosts = [host("192.168.1.30", "s9garage"), host("192.168.1.40", "nas", firmware=None, ports=(22,))]
+
+        proposal = discovery.propose_updates(HEATERS, hosts)
+        self.assertEqual([h["hostname"] for h in proposal["new"]], ["s9garage"])
+        self.assertEqual([h["ipAddress"] for h in proposal["unidentified"]], ["192.168.1.40"])
+        self.assertEqual(proposal["heaters"], HEATERS)
+
+        proposal = discovery.propose_updates(HEATERS, hosts, add_new=True, new_type="quiet")
+        self.assertEqual(proposal["heaters"][2], {
+            "heaterName": "s9garage", "hostname": "s9garage", "type": "quiet",
+            "location": discovery.NEW_HEATER_LOCATION, "ipAddress": "192.168.1.30", "limitPower": False
+        })
+
+    def test_hostname_at_several_addresses_is_left_unchanged(self):
+        proposal = discovery.propose_updates(HEATERS, [host("192.168.1.20", "s9office"), host("192.168.1.21", "s9office")])
+        self.assertEqual(proposal["changes"], [])
+        self.assertEqual(proposal["conflicts"], {"s9office": ["192.168.1.20", "192.168.1.21"]})
+        self.assertEqual(proposal["heaters"], HEATERS)
+
+class TestHeatersFile(unittest.TestCase):
+
+    def test_write_heaters_replaces_file(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "heaters.json")
+            with open(path, "w") as file:
+                file.write("[]")
+
+            discovery.write_heaters(path, HEATERS)
+
+            with open(path) as file:
+                self.assertEqual(json.load(file), HEATERS)
+            self.assertEqual(os.listdir(workdir), ["heaters.json"])
+
+    def test_default_networks(self):
+        heaters = HEATERS + [{"heaterName": "shed", "ipAddress": "10.0.0.5"}, {"heaterName": "new"}]
+        self.assertEqual([str(network) for network in discovery.default_networks(heaters)],
+                         ["192.168.1.0/24", "10.0.0.0/24"])
+
+class TestSweep(unittest.TestCase):
+    """Sweeps loopback, where only 127.0.0.1 listens, against a fake miner and API."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.TemporaryDirectory()
+        cls.key_path = os.path.join(cls.workdir.name, 'id_rsa')
+        paramiko.RSAKey.generate(2048).write_private_key_file(cls.key_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.workdir.cleanup()
+
+    def setUp(self):
+        self.miner = FakeMiner(hostname="s9office").start()
+        self.addCleanup(self.miner.stop)
+
+        self.api = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FakeMinerAPI)
+        self.api.daemon_threads = True
+        threading.Thread(target=self.api.serve_forever, daemon=True).start()
+        self.addCleanup(self.api.server_close)
+        self.addCleanup(self.api.shutdown)
+
+        self.pool = SSHConnectionPool(key_path=self.key_path, addresses={"127.0.0.1": self.miner.address})
+        self.addCleanup(self.pool.close_all)
+        previous = set_pool(self.pool)
+        self.addCleanup(set_pool, previous)
+
+    def sweep(self, network, engine=None):
+        return asyncio.run(discovery.discover_async([network], engine, ssh_port=self.miner.port,
+                                                    api_port=self.api.server_address[1]))
+
+    def test_finds_and_fingerprints_miner(self):
+        hosts = self.sweep("127.0.0.0/29", RemoteEngine(backend=PoolBackend()))
+
+        self.assertEqual(len(hosts), 1)
+        found = hosts[0]
+        self.assertEqual(found["ipAddress"], "127.0.0.1")
+        self.assertEqual(found["ports"], [self.miner.port, self.api.server_address[1]])
+        self.assertTrue(found["sshBanner"].startswith("SSH-2.0-"))
+        self.assertEqual(found["firmware"], "BOSminer 0.2.0-9e5a3d1a5f")
+        self.assertEqual((found["hostname"], found["hostnameSource"]), ("s9office", "ssh"))
+
+        proposal = discovery.propose_updates(HEATERS, hosts)
+        self.assertEqual(proposal["changes"][0]["new"], "127.0.0.1")
+
+    def test_full_subnet_sweep_is_concurrent(self):
+        started = time.monotonic()
+        hosts = self.sweep("127.0.1.0/24")
+        self.assertEqual(hosts, [])
+        self.assertLess(time.monotonic() - started, 5)
+
+if __name__ == '__main__':
+    unittest.main()
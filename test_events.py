@@ -0,0 +1,70 @@
+import json
+import unittest
+from events import EventBroadcaster
+
+def parse(message):
+    """Parse one Server-Sent Events message into a dict of its fields."""
+    fields = dict(line.split(": ", 1) for line in message.strip().split("\n") if not line.startswith(":"))
+    if "data" in fields:
+        fields["data"] = json.loads(fields["data"])
+    return fields
+
+class TestEventBroadcaster(unittest.TestCase):
+
+    def setUp(self):
+        self.events = EventBroadcaster(history=3, buffer_size=2, heartbeat_interval=0.05)
+
+    def test_live_events_reach_subscribers(self):
+        stream = self.events.stream()
+        self.assertEqual(next(stream), "retry: 3000\n\n")
+
+        self.events.publish("config", {"heaterName": "office", "status": "updated"})
+        message = parse(next(stream))
+
+        self.assertEqual(message["event"], "config")
+        self.assertEqual(message["id"], "1")
+        self.assertEqual(message["data"]["heaterName"], "office")
+        self.assertEqual(self.events.subscriber_count, 1)
+        stream.close()
+        self.assertEqual(self.events.subscriber_count, 0)
+
+    def test_reconnect_replays_missed_events(self):
+        for i in range(3):
+            self.events.publish("job", {"n": i})
+
+        stream = self.events.stream(last_event_id=1)
+        next(stream)
+        replayed = [parse(next(stream))["data"]["n"] for _ in range(2)]
+        self.assertEqual(replayed, [1, 2])
+        stream.close()
+
+    def test_reconnect_after_history_loss_requests_resync(self):
+        for i in range(5):
+            self.events.publish("job", {"n": i})
+
+        stream = self.events.stream(last_event_id=1)
+        next(stream)
+        message = parse(next(stream))
+        self.assertEqual(message["event"], "resync")
+        self.assertNotIn("id", message)
+        stream.close()
+
+    def test_slow_subscriber_is_told_to_resync(self):
+        stream = self.events.stream()
+        next(stream)
+        for i in range(3):
+            self.events.publish("job", {"n": i})
+
+        self.assertEqual(parse(next(stream))["event"], "resync")
+        stream.close()
+
+    def test_heartbeat(self):
+        ticks = []
+        stream = self.events.stream(on_heartbeat=lambda: ticks.append(1))
+        next(stream)
+        self.assertEqual(next(stream), ": heartbeat\n\n")
+        self.assertEqual(ticks, [1])
+        stream.close()
+
+if __name__ == '__main__':
+    unittest.main()
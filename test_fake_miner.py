@@ -0,0 +1,241 @@
+import json
+import os
+import socket
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+import paramiko
+import benchmark
+import command_stream
+import heaterService
+import heater_status
+import tracing
+import utils
+from fake_miner import FakeFleet
+from history import HistoryStore
+from host_resolver import HostResolver
+from shared_state import SharedState
+from ssh_pool import SSHConnectionPool, set_pool
+
+class TestFakeMiner(unittest.TestCase):
+    """Runs the real SSH and SFTP paths against in-process fake miners."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.TemporaryDirectory()
+        cls.key_path = os.path.join(cls.workdir.name, 'id_rsa')
+        paramiko.RSAKey.generate(2048).write_private_key_file(cls.key_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.workdir.cleanup()
+
+    def setUp(self):
+        self.fleet = FakeFleet(2).start()
+        self.addCleanup(self.fleet.stop)
+
+        self.pool = SSHConnectionPool(key_path=self.key_path, addresses=self.fleet.addresses())
+        self.addCleanup(self.pool.close_all)
+        previous = set_pool(self.pool)
+        self.addCleanup(set_pool, previous)
+
+        utils._remote_hashes.clear()
+        self.addCleanup(utils._remote_hashes.clear)
+
+        history = HistoryStore(os.path.join(self.workdir.name, 'history.db'))
+        self.addCleanup(history.close)
+        history_patcher = patch.object(heaterService, 'history_store', history)
+        history_patcher.start()
+        self.addCleanup(history_patcher.stop)
+
+        shared = SharedState()
+        self.addCleanup(shared.close)
+        shared_patcher = patch.object(heaterService, 'shared_state', shared)
+        shared_patcher.start()
+        self.addCleanup(shared_patcher.stop)
+
+    def test_push_config_uploads_then_skips_unchanged(self):
+        template = 'bosminerConfig/bosminer-standard-low.toml'
+
+        self.assertEqual(utils.push_config(template, '/etc/bosminer.toml', 'fake-miner-1'), 'updated')
+        self.assertEqual(self.fleet.miners[0].files['/etc/bosminer.toml'], utils.render_config(template, 'fake-miner-1'))
+
+        utils._remote_hashes.clear()
+        self.assertEqual(utils.push_config(template, '/etc/bosminer.toml', 'fake-miner-1'), 'unchanged')
+        self.assertEqual(self.fleet.miners[0].connections, 1)
+
+    def test_apply_config_restarts_stopped_miner(self):
+        miner = self.fleet.miners[1]
+        miner.running = False
+
+        result = utils.apply_config('bosminerConfig/bosminer-standard-high.toml', '/etc/bosminer.toml',
+                                    'fake-miner-2', host='192.0.2.2')
+
+        self.assertEqual(result['restart']['exit_code'], 0)
+        self.assertTrue(miner.running)
+        self.assertEqual(miner.commands, ['/etc/init.d/bosminer restart'])
+
+    def test_benchmark_reports_percentiles(self):
+        results = benchmark.run_benchmark(miners=2, endpoints=('heaters', 'apply'), requests=6, concurrency=4)
+
+        self.assertEqual([result['endpoint'] for result in results], ['heaters', 'apply'])
+        for result in results:
+            self.assertEqual(result['errors'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_apply_is_traced_end_to_end(self):
+        tracing.enable(os.path.join(self.workdir.name, 'traces.log'))
+        self.addCleanup(tracing.disable)
+        client = heaterService.app.test_client()
+        with patch.object(heaterService, 'HEATERS_JSON_PATH', os.path.join(self.workdir.name, 'heaters.json')):
+            with open(heaterService.HEATERS_JSON_PATH, 'w') as file:
+                json.dump(self.fleet.heaters(), file)
+            response = client.post('/apply', json={'heaterName': 'fake-1', 'action': 'low', 'force': True})
+        self.assertEqual(response.status_code, 200)
+
+        traces = client.get('/debug/traces').get_json()['traces']
+        apply_trace = next(trace for trace in traces if trace['attributes']['path'] == '/apply')
+        names = [span['name'] for span in apply_trace['spans']]
+        for name in ('http_request', 'registry_lookup', 'render_config', 'ssh_operation', 'acquire',
+                     'resolve', 'connect', 'handshake', 'sftp_open', 'sftp_put', 'exec', 'exit_wait'):
+            self.assertIn(name, names)
+        self.assertEqual(apply_trace['attributes']['status'], '200')
+
+    def test_batch_push_renders_each_miner_its_own_config(self):
+        client = heaterService.app.test_client()
+        with patch.object(heaterService, 'HEATERS_JSON_PATH', os.path.join(self.workdir.name, 'heaters.json')):
+            with open(heaterService.HEATERS_JSON_PATH, 'w') as file:
+                json.dump(self.fleet.heaters(), file)
+            response = client.post('/batch/set_heater', json={'action': 'high', 'selector': {'location': 'Bench'},
+                                                               'concurrency': 2})
+        self.assertEqual(response.status_code, 200)
+
+        template = 'bosminerConfig/bosminer-standard-high.toml'
+        for heater, miner in zip(self.fleet.heaters(), self.fleet.miners):
+            self.assertEqual(miner.files['/etc/bosminer.toml'], utils.render_config(template, heater['hostname']))
+        self.assertFalse(os.path.exists('./tmpFile/newConfigTmp.toml'))
+
+    def test_push_without_start_then_with_start_restarts(self):
+        client = heaterService.app.test_client()
+        miner = self.fleet.miners[0]
+        with patch.object(heaterService, 'HEATERS_JSON_PATH', os.path.join(self.workdir.name, 'heaters.json')):
+            with open(heaterService.HEATERS_JSON_PATH, 'w') as file:
+                json.dump(self.fleet.heaters(), file)
+            first = client.post('/set_heater', json={'heaterName': 'fake-1', 'action': 'medium'})
+            self.assertEqual(first.get_json()['status'], 'updated')
+            self.assertEqual(miner.commands, [])
+            self.assertIsNone((heaterService.observed_heater_state('fake-1') or {}).get('level'))
+
+            second = client.post('/set_heater', json={'heaterName': 'fake-1', 'action': 'medium', 'start': True})
+            self.assertEqual(second.status_code, 200)
+            self.assertEqual(second.get_json()['status'], 'pending')
+            self.assertEqual(miner.commands.count('/etc/init.d/bosminer restart'), 1)
+            self.assertEqual(heaterService.observed_heater_state('fake-1')['level'], 'medium')
+
+            third = client.post('/set_heater', json={'heaterName': 'fake-1', 'action': 'medium', 'start': True})
+            self.assertEqual(third.get_json()['status'], 'unchanged')
+            self.assertEqual(miner.commands.count('/etc/init.d/bosminer restart'), 1)
+
+    def test_probe_reads_running_state_and_level(self):
+        miner = self.fleet.miners[0]
+        miner.files['/etc/bosminer.toml'] = utils.render_config('bosminerConfig/bosminer-standard-medium.toml', 'fake-miner-1')
+        heater = self.fleet.heaters()[0]
+
+        status = heater_status.probe_heater(heater, heater['ipAddress'])
+        self.assertEqual(status, {"reachable": True, "running": True, "level": "medium", "powerTarget": 700, "error": None})
+
+        miner.running = False
+        del miner.files['/etc/bosminer.toml']
+        status = heater_status.probe_heater(heater, heater['ipAddress'])
+        self.assertFalse(status['running'])
+        self.assertIsNone(status['level'])
+
+    def test_pool_connects_through_the_address_that_answers(self):
+        with socket.socket() as closed:
+            closed.bind(('127.0.0.1', 0))
+            stale_address = closed.getsockname()
+        resolver = HostResolver(aliases=lambda host: ['192.0.2.99', 'fake-miner-1.local'])
+        pool = SSHConnectionPool(key_path=self.key_path, resolver=resolver,
+                                 addresses=dict(self.fleet.addresses(), **{'192.0.2.99': stale_address}))
+        self.addCleanup(pool.close_all)
+
+        self.assertEqual(pool.run('192.0.2.99', lambda ssh: ssh.exec_command('echo hi')[1].read()), b'hi\n')
+        self.assertEqual(resolver.winner('192.0.2.99'), 'fake-miner-1.local')
+        self.assertEqual(pool.stats()['addresses']['winners'], {'192.0.2.99': 'fake-miner-1.local'})
+
+    def stream(self, command, accept='text/event-stream'):
+        client = heaterService.app.test_client()
+        return client.post('/execute/stream', json={'host': '192.0.2.1', 'command': command},
+                           headers={'Accept': accept}, buffered=False)
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_stream_follows_output_and_hangs_up_on_close(self):
+        miner = self.fleet.miners[0]
+        response = self.stream('logs')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+
+        received = ''
+        for chunk in response.response:
+            received += chunk.decode() if isinstance(chunk, bytes) else chunk
+            if received.count('event: output') >= 3:
+                break
+        response.close()
+
+        self.assertIn('bosminer: log line 0', received)
+        self.assertTrue(self.wait_for(lambda: miner.followers_hung_up == 1))
+
+    def test_stream_reads_only_as_fast_as_the_client(self):
+        miner = self.fleet.miners[0]
+        miner.log_interval = 0
+        response = self.stream('logs', accept='text/plain')
+        next(iter(response.response))
+        time.sleep(0.5)
+
+        # The miner can only get the SSH window ahead of the reader
+        line_size = len('bosminer: log line 1000\n')
+        self.assertLess(miner.log_lines_sent, 2 * command_stream.WINDOW_SIZE // line_size)
+        response.close()
+        self.assertTrue(self.wait_for(lambda: miner.followers_hung_up == 1))
+
+    def test_stream_stops_at_byte_cap(self):
+        miner = self.fleet.miners[0]
+        with patch.object(command_stream, 'MAX_BYTES', 100):
+            response = self.stream('logs')
+            events = [event for event in b''.join(response.response).decode().split('\n\n') if event]
+        response.close()
+
+        end = json.loads(events[-1].split('data: ', 1)[1])
+        self.assertEqual(end['reason'], command_stream.TRUNCATED)
+        self.assertEqual(end['bytes'], 100)
+        self.assertTrue(self.wait_for(lambda: miner.followers_hung_up == 1))
+
+    def test_stream_reports_exit_code(self):
+        # The fake miner has no 'logread -e', so the command exits at once
+        response = self.stream('bosminer_logs')
+        body = b''.join(response.response).decode()
+        response.close()
+
+        end = json.loads(body.split('event: end\ndata: ', 1)[1])
+        self.assertEqual(end['reason'], command_stream.EXITED)
+        self.assertEqual(end['exitCode'], 127)
+
+    def test_stream_refuses_commands_that_change_the_heater(self):
+        for command in ('start', 'stop', 'restart'):
+            self.assertEqual(self.stream(command).status_code, 400)
+        self.assertEqual(self.fleet.miners[0].commands, [])
+        self.assertTrue(self.fleet.miners[0].running)
+
+    def test_percentile(self):
+        self.assertEqual(benchmark.percentile([5, 1, 3, 2, 4], 50), 3)
+        self.assertEqual(benchmark.percentile(list(range(1, 101)), 99), 99)
+        self.assertIsNone(benchmark.percentile([], 50))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+import paramiko
+import test_connectivity
+from history import HistoryStore
+from test_connectivity import scan_fleet, record_result
+
+HEATERS = [
+    {"heaterName": "slow", "hostname": "slow-miner", "ipAddress": "192.168.1.10", "location": "Loft", "type": "quiet"},
+    {"heaterName": "fast", "hostname": "fast-miner", "ipAddress": "192.168.1.11", "location": "Office", "type": "standard"},
+    {"heaterName": "stuck", "hostname": "stuck-miner", "ipAddress": "192.168.1.12", "location": "Basement", "type": "standard"},
+]
+
+def fake_ssh_connection(hostname, ip_address, timeout):
+    """Simulate miners that answer after different delays."""
+    delay = {"slow-miner": 0.2, "fast-miner": 0.0, "stuck-miner": 5.0}[hostname]
+    time.sleep(min(delay, timeout))
+    status = "SUCCESS" if delay < timeout else "FAIL"
+    return {
+        "hostname": hostname,
+        "ip_address": ip_address,
+        "hostname_status": status,
+        "ip_status": "FAIL",
+        "error": None if status == "SUCCESS" else "Connection error: timed out",
+        "auth_method": "SSH Key" if status == "SUCCESS" else None
+    }
+
+class TestScanFleet(unittest.TestCase):
+
+    @patch('test_connectivity.print_miner_result')
+    @patch('test_connectivity.test_ssh_connection', side_effect=fake_ssh_connection)
+    def test_results_keep_heater_order_and_stream_by_completion(self, mock_connection, mock_print):
+        results = scan_fleet(HEATERS[:2], concurrency=2)
+
+        self.assertEqual([r["heater_name"] for r in results], ["slow", "fast"])
+        # The fast miner is reported first even though it is listed second
+        printed = [call.args[1]["heater_name"] for call in mock_print.call_args_list]
+        self.assertEqual(printed, ["fast", "slow"])
+
+    @patch('test_connectivity.print_miner_result')
+    @patch('test_connectivity.test_ssh_connection', side_effect=fake_ssh_connection)
+    def test_scan_runs_in_parallel(self, mock_connection, mock_print):
+        heaters = [dict(HEATERS[0], heaterName=f"slow-{i}") for i in range(5)]
+
+        start = time.monotonic()
+        results = scan_fleet(heaters, concurrency=5)
+
+        # Five 0.2 s probes in parallel take about as long as one
+        self.assertLess(time.monotonic() - start, 0.8)
+        self.assertTrue(all(r["hostname_status"] == "SUCCESS" for r in results))
+
+    @patch('test_connectivity.print_miner_result')
+    @patch('test_connectivity.test_ssh_connection', side_effect=fake_ssh_connection)
+    def test_budget_bounds_total_scan_time(self, mock_connection, mock_print):
+        start = time.monotonic()
+        results = scan_fleet(HEATERS, concurrency=3, budget=0.5)
+
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(results[0]["hostname_status"], "SUCCESS")
+        self.assertEqual(results[1]["hostname_status"], "SUCCESS")
+        self.assertEqual(results[2]["hostname_status"], "FAIL")
+        # Connection timeouts are clamped to the remaining budget
+        stuck_timeout = [c.args[2] for c in mock_connection.call_args_list if c.args[0] == "stuck-miner"][0]
+        self.assertLessEqual(stuck_timeout, 0.5)
+
+    @patch('test_connectivity.print_miner_result')
+    @patch('test_connectivity.test_ssh_connection', side_effect=fake_ssh_connection)
+    def test_results_are_appended_to_history_as_they_finish(self, mock_connection, mock_print):
+        history = HistoryStore(os.path.join(tempfile.mkdtemp(), "history.db"))
+        self.addCleanup(history.close)
+
+        scan_fleet(HEATERS, concurrency=3, budget=0.5, on_result=lambda result: record_result(history, result))
+
+        summary = history.uptime(time.time() - 60, time.time() + 60)
+        self.assertEqual(sorted(summary), ["fast", "slow", "stuck"])
+        self.assertEqual(summary["slow"]["uptime"], 1.0)
+        self.assertGreaterEqual(summary["slow"]["avgLatencyMs"], 200)
+        self.assertEqual(summary["stuck"]["uptime"], 0.0)
+
+class TestSSHConnection(unittest.TestCase):
+
+    @patch('paramiko.SSHClient')
+    @patch('test_connectivity.get_resolver')
+    def test_failed_login_retries_other_address_once(self, mock_get_resolver, mock_ssh_client):
+        resolver = mock_get_resolver.return_value
+        resolver.connect.side_effect = lambda host, targets, timeout: (MagicMock(), targets[0][0])
+        client = mock_ssh_client.return_value
+        client.connect.side_effect = [paramiko.SSHException("Error reading SSH protocol banner"), None]
+        stdout = MagicMock()
+        stdout.channel.recv_exit_status.return_value = 0
+        client.exec_command.return_value = (MagicMock(), stdout, MagicMock())
+
+        result = test_connectivity.test_ssh_connection("s9office", "192.168.1.10", timeout=1)
+
+        self.assertEqual((result["hostname_status"], result["ip_status"], result["error"]), ("FAIL", "SUCCESS", None))
+        self.assertEqual([call.args[1] for call in resolver.connect.call_args_list],
+                         [[("s9office.local", "s9office.local", 22), ("192.168.1.10", "192.168.1.10", 22)],
+                          [("192.168.1.10", "192.168.1.10", 22)]])
+
+        client.connect.side_effect = paramiko.AuthenticationException()
+        result = test_connectivity.test_ssh_connection("s9office", "192.168.1.10", timeout=1)
+        self.assertEqual(result["error"], "Authentication failed - SSH key not authorized")
+        self.assertEqual(resolver.connect.call_count, 3)
+
+if __name__ == '__main__':
+    unittest.main()
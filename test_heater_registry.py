@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from heater_registry import HeaterRegistry
+
+HEATERS = [
+    {"heaterName": "hvac-front-1", "hostname": "s9hvac1f", "type": "standard", "location": "Basement", "ipAddress": "192.168.1.210", "limitPower": False},
+    {"heaterName": "loft", "hostname": "ellsworth-loft", "type": "quiet", "location": "Loft", "ipAddress": "192.168.1.201", "limitPower": False},
+    {"heaterName": "cooler1", "hostname": "ellsworth-cooler1", "type": "standard", "location": "Basement", "ipAddress": "192.168.1.204", "limitPower": False},
+]
+
+class TestHeaterRegistry(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        self.write(HEATERS)
+        self.registry = HeaterRegistry(self.path)
+
+    def write(self, data, mtime_offset=0):
+        with open(self.path, 'w') as file:
+            file.write(data if isinstance(data, str) else json.dumps(data))
+        # Give each write a distinct mtime regardless of filesystem resolution
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + mtime_offset))
+
+    def test_indexes(self):
+        fleet = self.registry.snapshot()
+
+        self.assertEqual(fleet.by_name["loft"]["hostname"], "ellsworth-loft")
+        self.assertEqual(fleet.by_ip["192.168.1.204"]["heaterName"], "cooler1")
+        self.assertEqual([h["heaterName"] for h in fleet.by_location["Basement"]], ["hvac-front-1", "cooler1"])
+        self.assertEqual(fleet.find("ellsworth-loft.local")["heaterName"], "loft")
+        self.assertEqual(json.loads(fleet.json_bytes), HEATERS)
+
+    def test_unchanged_file_is_not_reread(self):
+        first = self.registry.snapshot()
+        with patch('builtins.open') as mock_open:
+            self.assertIs(self.registry.snapshot(), first)
+        mock_open.assert_not_called()
+
+    def test_touched_file_with_same_content_is_not_reparsed(self):
+        first = self.registry.snapshot()
+        self.write(HEATERS, mtime_offset=1_000_000_000)
+        with patch('heater_registry.json.loads') as mock_loads:
+            self.assertIs(self.registry.snapshot(), first)
+        mock_loads.assert_not_called()
+
+    def test_changed_file_is_reloaded_into_new_snapshot(self):
+        first = self.registry.snapshot()
+        self.write(HEATERS[:1], mtime_offset=1_000_000_000)
+
+        second = self.registry.snapshot()
+        self.assertIsNot(second, first)
+        self.assertEqual(len(second.heaters), 1)
+        # Holders of the old snapshot still see the complete old fleet
+        self.assertEqual(len(first.heaters), 3)
+
+    def test_invalid_edit_keeps_last_good_fleet(self):
+        first = self.registry.snapshot()
+        self.write('[{"heaterName": ', mtime_offset=1_000_000_000)
+        self.assertIs(self.registry.snapshot(), first)
+
+    def test_select_uses_names_and_selector(self):
+        fleet = self.registry.snapshot()
+
+        selected, missing = fleet.select(["cooler1", "hvac-front-1", "nope"], None)
+        self.assertEqual([h["heaterName"] for h in selected], ["hvac-front-1", "cooler1"])
+        self.assertEqual(missing, ["nope"])
+
+        selected, _ = fleet.select(None, {"location": "Basement", "hostname": "ellsworth-cooler1"})
+        self.assertEqual([h["heaterName"] for h in selected], ["cooler1"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,659 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+import heaterService
+import tracing
+from circuit_breaker import HostUnreachableError
+from heater_status import StatusCache
+from history import HistoryStore
+from reconciler import DesiredStateStore
+from shared_state import SharedState
+
+HEATERS = [
+    {"heaterName": "hvac-front-1", "hostname": "s9hvac1f", "type": "standard", "location": "Basement", "ipAddress": "192.168.1.210", "limitPower": False},
+    {"heaterName": "hvac-front-2", "hostname": "s9hvac2f", "type": "standard", "location": "Basement", "ipAddress": "192.168.1.211", "limitPower": False},
+    {"heaterName": "office", "hostname": "ellsworth-office", "type": "quiet", "location": "Office", "ipAddress": "192.168.1.203", "limitPower": True},
+]
+
+class HeaterServiceTestCase(unittest.TestCase):
+    """Runs the Flask app against a temporary heaters.json."""
+
+    def setUp(self):
+        fd, self.heaters_path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, 'w') as file:
+            json.dump(HEATERS, file)
+        self.addCleanup(os.remove, self.heaters_path)
+
+        path_patcher = patch.object(heaterService, 'HEATERS_JSON_PATH', self.heaters_path)
+        path_patcher.start()
+        self.addCleanup(path_patcher.stop)
+
+        history = HistoryStore(os.path.join(tempfile.mkdtemp(), "history.db"))
+        self.addCleanup(history.close)
+        history_patcher = patch.object(heaterService, 'history_store', history)
+        history_patcher.start()
+        self.addCleanup(history_patcher.stop)
+
+        shared = SharedState()
+        self.addCleanup(shared.close)
+        shared_patcher = patch.object(heaterService, 'shared_state', shared)
+        shared_patcher.start()
+        self.addCleanup(shared_patcher.stop)
+
+        self.client = heaterService.app.test_client()
+
+class TestHeaterEndpoints(HeaterServiceTestCase):
+
+    def test_list_heaters(self):
+        response = self.client.get('/heaters')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), HEATERS)
+
+    def test_list_heaters_missing_file(self):
+        with patch.object(heaterService, 'HEATERS_JSON_PATH', self.heaters_path + ".missing"):
+            response = self.client.get('/heaters')
+        self.assertEqual(response.status_code, 404)
+
+    @patch('heaterService.push_config', return_value="updated")
+    def test_set_heater_unknown_heater(self, mock_push):
+        response = self.client.post('/set_heater', json={"heaterName": "nope", "action": "low"})
+        self.assertEqual(response.status_code, 404)
+        mock_push.assert_not_called()
+
+    @patch('heaterService.get_pool')
+    def test_unreachable_host_returns_retry_after(self, mock_get_pool):
+        mock_get_pool.return_value.run.side_effect = HostUnreachableError("192.168.1.203", 42)
+
+        response = self.client.post('/execute', json={"host": "192.168.1.203", "command": "start"})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "42")
+        self.assertEqual(response.get_json()["retryAfter"], 42)
+
+    @patch('heaterService.get_pool')
+    def test_stream_unreachable_host_returns_json_error(self, mock_get_pool):
+        mock_get_pool.return_value.acquire.side_effect = HostUnreachableError("192.168.1.203", 42)
+
+        response = self.client.get('/execute/stream?host=192.168.1.203&command=logs')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "42")
+
+    @patch('heaterService.get_pool')
+    def test_stream_rejects_unknown_command(self, mock_get_pool):
+        response = self.client.post('/execute/stream', json={"host": "192.168.1.203", "command": "reboot"})
+
+        self.assertEqual(response.status_code, 400)
+        mock_get_pool.return_value.acquire.assert_not_called()
+
+    @patch('heaterService.push_config', return_value="unchanged")
+    def test_set_heater_reports_unchanged(self, mock_push):
+        response = self.client.post('/set_heater', json={"heaterName": "office", "action": "low"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["status"], "unchanged")
+        mock_push.assert_called_once_with(
+            local_file_path="bosminerConfig/bosminer-quiet-low.toml",
+            remote_file_path="/etc/bosminer.toml",
+            hostname="ellsworth-office",
+            host="192.168.1.203",
+            force=False
+        )
+
+    @patch('heaterService.push_config', return_value="updated")
+    def test_set_heater_force(self, mock_push):
+        response = self.client.post('/set_heater', json={"heaterName": "office", "action": "high", "force": True})
+
+        self.assertEqual(response.get_json()["status"], "updated")
+        self.assertTrue(mock_push.call_args.kwargs["force"])
+
+    @patch('heaterService.forget_remote_hash')
+    @patch('heaterService.execute_remote_command', return_value={"exit_code": 0, "output": "", "error": ""})
+    def test_stop_forgets_remembered_config(self, mock_execute, mock_forget):
+        response = self.client.post('/execute', json={"host": "192.168.1.203", "command": "stop"})
+
+        self.assertEqual(response.status_code, 200)
+        mock_forget.assert_called_once_with("ellsworth-office")
+
+class TestHeaterStatus(HeaterServiceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.probes = []
+
+        def probe(heater):
+            self.probes.append(heater["heaterName"])
+            return {"reachable": True, "running": True, "level": "low", "powerTarget": 600, "error": None}
+
+        cache_patcher = patch.object(heaterService, 'status_cache', StatusCache(probe, max_age=30))
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+
+    def test_include_status(self):
+        response = self.client.get('/heaters?include=status')
+
+        self.assertEqual(response.status_code, 200)
+        heaters = response.get_json()
+        self.assertEqual([heater["heaterName"] for heater in heaters], [heater["heaterName"] for heater in HEATERS])
+        self.assertTrue(all(heater["status"]["running"] for heater in heaters))
+        self.assertEqual(len(self.probes), len(HEATERS))
+
+    def test_cached_status_is_revalidated_without_probing(self):
+        first = self.client.get('/heaters?include=status')
+        second = self.client.get('/heaters?include=status', headers={"If-None-Match": first.headers["ETag"]})
+
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(len(self.probes), len(HEATERS))
+
+    def test_max_age_bounds_staleness(self):
+        self.client.get('/heaters?include=status')
+        self.client.get('/heaters?include=status&maxAge=0')
+        self.assertEqual(len(self.probes), 2 * len(HEATERS))
+
+    def test_state_change_drops_cached_status(self):
+        self.client.get('/heaters?include=status')
+        heaterService.update_heater_state("office", level="high")
+
+        self.client.get('/heaters?include=status')
+        self.assertEqual(self.probes.count("office"), 2)
+
+    def test_plain_list_does_not_probe(self):
+        self.client.get('/heaters')
+        self.assertEqual(self.probes, [])
+
+    def test_invalid_max_age(self):
+        self.assertEqual(self.client.get('/heaters?include=status&maxAge=soon').status_code, 400)
+
+class TestConditionalRequests(HeaterServiceTestCase):
+
+    def test_heaters_revalidate_with_etag(self):
+        first = self.client.get('/heaters')
+        self.assertEqual(first.headers["Cache-Control"], "no-cache")
+        etag = first.headers["ETag"]
+
+        repeat = self.client.get('/heaters', headers={"If-None-Match": etag})
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat.data, b"")
+
+        # Editing heaters.json changes the version and the ETag
+        with open(self.heaters_path, 'w') as file:
+            json.dump(HEATERS[:1], file)
+        os.utime(self.heaters_path, (time.time() + 5, time.time() + 5))
+        changed = self.client.get('/heaters', headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.get_json(), HEATERS[:1])
+        self.assertNotEqual(changed.headers["ETag"], etag)
+
+    def test_index_is_served_compressed_and_revalidated(self):
+        response = self.client.get('/', headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertIn(b"<html", gzip.decompress(response.data).lower())
+
+        repeat = self.client.get('/', headers={"If-Modified-Since": response.headers["Last-Modified"]})
+        self.assertEqual(repeat.status_code, 304)
+
+class TestDebugTracesEndpoint(HeaterServiceTestCase):
+
+    def test_disabled_tracing_lists_nothing(self):
+        response = self.client.get('/debug/traces')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {"enabled": False, "traces": []})
+
+    def test_requests_are_traced_when_enabled(self):
+        workdir = tempfile.mkdtemp()
+        tracing.enable(os.path.join(workdir, "traces.log"))
+        self.addCleanup(tracing.disable)
+
+        self.client.get('/heaters')
+        traces = self.client.get('/debug/traces?limit=5').get_json()["traces"]
+
+        self.assertEqual(traces[0]["name"], "http_request")
+        self.assertEqual(traces[0]["attributes"], {"method": "GET", "path": "/heaters", "status": "200"})
+
+    def test_invalid_limit(self):
+        self.assertEqual(self.client.get('/debug/traces?limit=many').status_code, 400)
+
+class TestMetricsEndpoint(HeaterServiceTestCase):
+
+    def test_request_durations_are_exported_by_route(self):
+        self.client.get('/heaters')
+        self.client.get('/telemetry/office?metric=nope')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        text = response.get_data(as_text=True)
+        self.assertIn('# TYPE heater_http_request_duration_seconds histogram', text)
+        self.assertIn('route="/heaters",method="GET",status="200"', text)
+        self.assertIn('route="/telemetry/<heater_name>",method="GET",status="404"', text)
+
+class TestEventPublishing(HeaterServiceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        publish_patcher = patch.object(heaterService.events, 'publish')
+        self.mock_publish = publish_patcher.start()
+        self.addCleanup(publish_patcher.stop)
+
+    def published(self, event_type):
+        return [call.args[1] for call in self.mock_publish.call_args_list if call.args[0] == event_type]
+
+    @patch('heaterService.execute_remote_command', return_value={"exit_code": 0, "output": "", "error": ""})
+    @patch('heaterService.push_config', return_value="updated")
+    def test_set_heater_with_start_publishes_progress(self, mock_push, mock_execute):
+        response = self.client.post('/set_heater', json={"heaterName": "office", "action": "medium", "start": True})
+
+        self.assertEqual(response.status_code, 200)
+        mock_execute.assert_called_once_with("192.168.1.203", "/etc/init.d/bosminer restart")
+        self.assertEqual(self.published("config"), [{"heaterName": "office", "action": "medium", "status": "updated"}])
+        self.assertEqual(self.published("command")[0]["command"], "restart")
+        states = self.published("heater")
+        self.assertEqual((states[-1]["level"], states[-1]["running"]), ("medium", True))
+
+    @patch('heaterService.forget_remote_hash')
+    @patch('heaterService.execute_remote_command', return_value={"exit_code": 1, "output": "", "error": ""})
+    @patch('heaterService.push_config', return_value="updated")
+    def test_set_heater_forgets_hash_when_start_fails(self, mock_push, mock_execute, mock_forget):
+        self.client.post('/set_heater', json={"heaterName": "office", "action": "medium", "start": True})
+
+        mock_forget.assert_called_once_with("ellsworth-office")
+
+    @patch('heaterService.execute_remote_command')
+    @patch('heaterService.push_config', return_value="unchanged")
+    def test_set_heater_with_start_skips_restart_when_unchanged(self, mock_push, mock_execute):
+        response = self.client.post('/set_heater', json={"heaterName": "office", "action": "medium", "start": True})
+
+        self.assertEqual(response.get_json()["status"], "unchanged")
+        mock_execute.assert_not_called()
+
+    @patch('heaterService.execute_remote_command', return_value={"exit_code": 0, "output": "", "error": ""})
+    @patch('heaterService.push_config', return_value="updated")
+    def test_batch_set_heater_publishes_progress(self, mock_push, mock_execute):
+        response = self.client.post('/batch/set_heater', json={"heaterNames": ["office"], "action": "low", "start": True})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.published("config"), [{"heaterName": "office", "action": "low", "status": "updated"}])
+        self.assertEqual(self.published("command")[0]["command"], "restart")
+        self.assertEqual(heaterService.observed_heater_state("office")["level"], "low")
+
+    @patch('heaterService.execute_remote_command', return_value={"exit_code": 0, "output": "", "error": ""})
+    def test_batch_execute_publishes_commands(self, mock_execute):
+        response = self.client.post('/batch/execute', json={"heaterNames": ["office"], "command": "stop"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.published("command")[0]["command"], "stop")
+        self.assertFalse(heaterService.observed_heater_state("office")["running"])
+
+    @patch('heaterService.apply_config', return_value={
+        "status": "updated", "steps": [{"step": "upload", "seconds": 0.1}], "elapsed": 0.2,
+        "restart": {"command": "/etc/init.d/bosminer restart", "exit_code": 0, "output": "", "error": ""}})
+    def test_apply_uses_one_session_and_reports_steps(self, mock_apply):
+        response = self.client.post('/apply', json={"heaterName": "office", "action": "high"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["steps"], [{"step": "upload", "seconds": 0.1}])
+        mock_apply.assert_called_once_with(
+            local_file_path="bosminerConfig/bosminer-quiet-high.toml",
+            remote_file_path="/etc/bosminer.toml",
+            hostname="ellsworth-office",
+            host="192.168.1.203",
+            force=False
+        )
+        self.assertEqual(self.published("command")[0]["command"], "restart")
+        states = self.published("heater")
+        self.assertEqual((states[-1]["level"], states[-1]["running"]), ("high", True))
+
+    @patch('heaterService.apply_config', return_value={
+        "status": "updated", "steps": [], "elapsed": 0.2,
+        "restart": {"command": "/etc/init.d/bosminer restart", "exit_code": 1, "output": "", "error": "failed"}})
+    def test_apply_reports_failed_restart(self, mock_apply):
+        response = self.client.post('/apply', json={"heaterName": "office", "action": "high"})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("restart failed", response.get_json()["error"])
+
+    def test_apply_validates_action(self):
+        response = self.client.post('/apply', json={"heaterName": "office", "action": "turbo"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_fleet_change_is_published(self):
+        self.client.get('/heaters')
+        with open(self.heaters_path, 'w') as file:
+            json.dump(HEATERS[:1], file)
+        os.utime(self.heaters_path, (time.time() + 5, time.time() + 5))
+        self.client.get('/heaters')
+
+        self.assertEqual(self.published("fleet"), [HEATERS[:1]])
+
+class TestAsyncJobs(HeaterServiceTestCase):
+
+    def wait_for_job(self, status_url):
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            job = self.client.get(status_url).get_json()
+            if job["state"] in ("succeeded", "failed"):
+                return job
+            time.sleep(0.01)
+        self.fail("job did not finish")
+
+    @patch('heaterService.push_config', return_value="updated")
+    def test_set_heater_async_returns_job(self, mock_push):
+        response = self.client.post('/set_heater', json={"heaterName": "office", "action": "low", "async": True})
+
+        self.assertEqual(response.status_code, 202)
+        body = response.get_json()
+        self.assertEqual(response.headers["Location"], body["statusUrl"])
+
+        job = self.wait_for_job(body["statusUrl"])
+        self.assertEqual(job["state"], "succeeded")
+        self.assertEqual(job["key"], "office")
+        self.assertEqual(job["result"]["status"], "updated")
+
+    @patch('heaterService.execute_remote_command', return_value={"error": "Connection error: timed out"})
+    def test_execute_async_failure_is_reported_on_job(self, mock_execute):
+        response = self.client.post('/execute?async=1', json={"host": "192.168.1.203", "command": "start"})
+
+        self.assertEqual(response.status_code, 202)
+        job = self.wait_for_job(response.get_json()["statusUrl"])
+        self.assertEqual(job["state"], "failed")
+        self.assertEqual(job["statusCode"], 500)
+        # Commands sent by IP address are serialized with pushes for the same heater
+        self.assertEqual(job["key"], "office")
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get('/jobs/nope').status_code, 404)
+
+    def test_job_run_by_another_worker(self):
+        heaterService.shared_state.save_job({"jobId": "elsewhere", "key": "office", "state": "running", "finished": None})
+
+        response = self.client.get('/jobs/elsewhere')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["state"], "running")
+
+class TestHeaterLeases(HeaterServiceTestCase):
+
+    @patch('heaterService.push_config', return_value="updated")
+    def test_busy_heater_returns_conflict(self, mock_push):
+        # Another thread or worker is busy with the heater
+        token, _ = heaterService.shared_state.try_acquire("heater:office")
+        self.addCleanup(heaterService.shared_state.release, "heater:office", token)
+
+        with patch.object(heaterService.shared_state, 'lease_wait', 0):
+            response = self.client.post('/set_heater', json={"heaterName": "office", "action": "low"})
+
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("Retry-After", response.headers)
+        mock_push.assert_not_called()
+
+    @patch('heaterService.execute_remote_command', return_value={"exit_code": 0, "output": "", "error": ""})
+    @patch('heaterService.push_config', return_value="updated")
+    def test_nested_operations_reuse_the_lease(self, mock_push, mock_execute):
+        response = self.client.post('/set_heater', json={"heaterName": "office", "action": "low", "start": True})
+
+        self.assertEqual(response.status_code, 200)
+        mock_execute.assert_called_once()
+        self.assertEqual(heaterService.shared_state.leases(), {})
+
+class TestTelemetryEndpoints(HeaterServiceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        store_patcher = patch.object(heaterService, 'telemetry_store', heaterService.TelemetryStore())
+        self.store = store_patcher.start()
+        self.addCleanup(store_patcher.stop)
+
+    def test_query_telemetry(self):
+        for t in range(0, 600, 30):
+            self.store.record("office", {"power_w": 700.0}, timestamp=float(t))
+
+        response = self.client.get('/telemetry/office?metric=power_w&start=0&end=300&resolution=1m')
+
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body["resolution"], "1m")
+        self.assertEqual([p["count"] for p in body["points"]], [2] * 5)
+        self.assertEqual(self.client.get('/telemetry').get_json()["office"]["metrics"], {"power_w": 700.0})
+
+    def test_query_unknown_heater(self):
+        self.assertEqual(self.client.get('/telemetry/nope').status_code, 404)
+
+    def test_query_bad_resolution(self):
+        self.store.record("office", {"power_w": 700.0}, timestamp=1.0)
+        self.assertEqual(self.client.get('/telemetry/office?metric=power_w&resolution=5m').status_code, 400)
+
+class TestBatchEndpoints(HeaterServiceTestCase):
+
+    @patch('heaterService.execute_remote_command')
+    @patch('heaterService.push_config', return_value="updated")
+    def test_batch_set_heater_by_selector(self, mock_push, mock_execute):
+        mock_execute.return_value = {"exit_code": 0, "output": "", "error": ""}
+
+        response = self.client.post('/batch/set_heater', json={
+            "selector": {"location": "Basement"}, "action": "low", "start": True
+        })
+
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual([r["heaterName"] for r in body["results"]], ["hvac-front-1", "hvac-front-2"])
+        self.assertEqual(body["succeeded"], 2)
+        mock_push.assert_any_call(local_file_path="bosminerConfig/bosminer-standard-low.toml",
+                                  remote_file_path="/etc/bosminer.toml", hostname="s9hvac1f",
+                                  host="192.168.1.210", force=False)
+        mock_execute.assert_any_call("192.168.1.211", "/etc/init.d/bosminer restart")
+
+    @patch('heaterService.forget_remote_hash')
+    @patch('heaterService.execute_remote_command', return_value={"exit_code": 1, "output": "", "error": ""})
+    @patch('heaterService.push_config', return_value="updated")
+    def test_batch_set_heater_forgets_hash_when_start_fails(self, mock_push, mock_execute, mock_forget):
+        self.client.post('/batch/set_heater', json={"heaterNames": ["hvac-front-1"], "action": "low", "start": True})
+
+        mock_forget.assert_called_once_with("s9hvac1f")
+
+    @patch('heaterService.execute_remote_command')
+    @patch('heaterService.push_config')
+    def test_batch_set_heater_skips_start_when_unchanged(self, mock_push, mock_execute):
+        mock_push.side_effect = lambda local_file_path, remote_file_path, hostname, host, force: "unchanged" if hostname == "s9hvac1f" else "updated"
+        mock_execute.return_value = {"exit_code": 0, "output": "", "error": ""}
+
+        response = self.client.post('/batch/set_heater', json={
+            "selector": {"location": "Basement"}, "action": "low", "start": True
+        })
+
+        statuses = [r["status"] for r in response.get_json()["results"]]
+        self.assertEqual(statuses, ["unchanged", "updated"])
+        mock_execute.assert_called_once_with("192.168.1.211", "/etc/init.d/bosminer restart")
+
+    @patch('heaterService.push_config')
+    def test_batch_set_heater_reports_partial_failure(self, mock_push):
+        def push(local_file_path, remote_file_path, hostname, host, force):
+            if hostname == "s9hvac2f":
+                raise TimeoutError("timed out")
+            return "updated"
+        mock_push.side_effect = push
+
+        response = self.client.post('/batch/set_heater', json={
+            "heaterNames": ["hvac-front-1", "hvac-front-2", "missing"], "action": "high"
+        })
+
+        self.assertEqual(response.status_code, 207)
+        results = {r["heaterName"]: r for r in response.get_json()["results"]}
+        self.assertTrue(results["hvac-front-1"]["ok"])
+        self.assertFalse(results["hvac-front-2"]["ok"])
+        self.assertIn("not found", results["missing"]["error"])
+
+    @patch('heaterService.execute_remote_command')
+    def test_batch_execute_runs_in_parallel(self, mock_execute):
+        in_flight, peak = [0], [0]
+        lock = threading.Lock()
+
+        def slow_command(host, command):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.1)
+            with lock:
+                in_flight[0] -= 1
+            return {"host": host, "command": command, "exit_code": 0, "output": "", "error": ""}
+
+        mock_execute.side_effect = slow_command
+        response = self.client.post('/batch/execute', json={
+            "selector": {"type": ["standard", "quiet"]}, "command": "stop", "concurrency": 2
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["succeeded"], 3)
+        self.assertEqual(peak[0], 2)
+
+    def test_batch_rejects_unknown_selector_field(self):
+        response = self.client.post('/batch/execute', json={"selector": {"color": "red"}, "command": "stop"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_requires_heaters(self):
+        response = self.client.post('/batch/execute', json={"command": "stop"})
+        self.assertEqual(response.status_code, 400)
+
+class DesiredStateTestCase(HeaterServiceTestCase):
+    """Gives the reconciler an empty, temporary desired state."""
+
+    def setUp(self):
+        super().setUp()
+        store = DesiredStateStore(os.path.join(tempfile.mkdtemp(), "desired_state.json"))
+        for target, attribute, value in ((heaterService, 'desired_state', store),
+                                         (heaterService.reconciler, 'store', store),
+                                         (heaterService.reconciler, '_last_desired', {}),
+                                         (heaterService.reconciler, '_retry', set())):
+            patcher = patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+class TestDesiredStateEndpoints(DesiredStateTestCase):
+
+    @patch('heaterService.apply_config', return_value={"status": "updated", "restart": None, "steps": [], "elapsed": 0.1})
+    def test_set_desired_reconciles_only_changed_heaters(self, mock_apply):
+        response = self.client.put('/desired', json={"heaters": {"office": "high"}})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["reconcile"]["drifted"], [{"heaterName": "office", "level": "high"}])
+        self.assertEqual(mock_apply.call_args.kwargs["hostname"], "ellsworth-office")
+
+        # Steady state: nothing changed, so nothing is touched
+        response = self.client.post('/reconcile')
+        self.assertEqual(response.get_json()["drifted"], [])
+        self.assertEqual(mock_apply.call_count, 1)
+
+    @patch('heaterService.execute_remote_command', return_value={"exit_code": 0, "output": "", "error": ""})
+    def test_off_stops_bosminer(self, mock_execute):
+        response = self.client.put('/desired', json={"heaters": {"hvac-front-1": "off"}})
+
+        self.assertEqual(response.status_code, 200)
+        mock_execute.assert_called_once_with("192.168.1.210", "/etc/init.d/bosminer stop")
+        self.assertFalse(heaterService.observed_heater_state("hvac-front-1")["running"])
+
+    def test_get_desired_reports_effective_levels(self):
+        heaterService.desired_state.update(
+            {"office": "low"},
+            [{"level": "medium", "from": "00:00", "to": "23:59", "selector": {"location": "Basement"}}])
+
+        response = self.client.get('/desired')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["heaters"], {"office": "low"})
+        self.assertEqual(response.get_json()["effective"]["office"], "low")
+
+    def test_set_desired_rejects_invalid_level_and_unknown_heater(self):
+        response = self.client.put('/desired', json={"heaters": {"office": "turbo"}})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.put('/desired', json={"heaters": {"nope": "low"}})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(heaterService.desired_state.get()["heaters"], {})
+
+    @patch('heaterService.apply_config')
+    def test_dry_run_changes_nothing(self, mock_apply):
+        heaterService.desired_state.update({"office": "medium"})
+
+        response = self.client.post('/reconcile', json={"dryRun": True})
+
+        self.assertEqual(response.get_json()["drifted"], [{"heaterName": "office", "level": "medium"}])
+        mock_apply.assert_not_called()
+
+class TestPowerBudgetEndpoint(DesiredStateTestCase):
+
+    def test_plan_within_budget(self):
+        response = self.client.post('/power_budget', json={"budgetWatts": 1500, "priorities": {"Office": 2}})
+
+        self.assertEqual(response.status_code, 200)
+        plan = response.get_json()
+        self.assertLessEqual(plan["totalWatts"], 1500)
+        self.assertNotEqual(plan["assignments"]["office"], "off")
+        self.assertEqual(heaterService.desired_state.get()["heaters"], {})
+
+    @patch('heaterService.execute_remote_command', return_value={"exit_code": 0, "output": "", "error": ""})
+    @patch('heaterService.apply_config', return_value={"status": "updated", "restart": None, "steps": [], "elapsed": 0.1})
+    def test_apply_pushes_plan_through_desired_state(self, mock_apply, mock_execute):
+        response = self.client.post('/power_budget', json={
+            "budgetWatts": 900, "selector": {"location": "Basement"}, "apply": True
+        })
+
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(sorted(body["assignments"].values()), ["high", "off"])
+        self.assertEqual(len(body["reconcile"]["results"]), 2)
+        self.assertEqual(heaterService.desired_state.get()["heaters"], body["assignments"])
+        mock_apply.assert_called_once()
+        mock_execute.assert_called_once()
+
+    @patch('heaterService.execute_remote_command')
+    @patch('heaterService.apply_config')
+    def test_apply_refused_while_schedules_cover_planned_heaters(self, mock_apply, mock_execute):
+        schedules = [{"level": "high", "from": "00:00", "to": "23:59", "selector": {"location": "Basement"}}]
+        heaterService.desired_state.update(schedules=schedules)
+
+        response = self.client.post('/power_budget', json={
+            "budgetWatts": 900, "selector": {"location": "Basement"}, "apply": True
+        })
+
+        self.assertEqual(response.status_code, 409)
+        body = response.get_json()
+        self.assertEqual(len(body["scheduled"]), 2)
+        self.assertLessEqual(body["plan"]["totalWatts"], 900)
+        self.assertEqual(heaterService.desired_state.get(), {"heaters": {}, "schedules": schedules})
+        mock_apply.assert_not_called()
+        mock_execute.assert_not_called()
+
+    def test_invalid_budget(self):
+        self.assertEqual(self.client.post('/power_budget', json={}).status_code, 400)
+        self.assertEqual(self.client.post('/power_budget', json={"budgetWatts": 900, "objective": "x"}).status_code, 400)
+
+class TestHistoryEndpoint(HeaterServiceTestCase):
+
+    def test_uptime_and_state_changes(self):
+        now = time.time()
+        heaterService.history_store.record_probe("office", "ellsworth-office", True, 120.0, "hostname", timestamp=now - 60)
+        heaterService.history_store.record_probe("office", "ellsworth-office", False, 5000.0, error="timed out", timestamp=now - 30)
+        heaterService.update_heater_state("office", level="high")
+
+        response = self.client.get('/history?heater=ellsworth-office&events=all')
+
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body["heaters"]["office"]["probes"], 2)
+        self.assertEqual(body["heaters"]["office"]["uptime"], 0.5)
+        self.assertFalse(body["heaters"]["office"]["lastOk"])
+        kinds = [event["kind"] for event in body["events"]]
+        self.assertEqual(sorted(kinds), ["probe", "probe", "state"])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/history?start=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/history?events=everything').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from heater_status import StatusCache, level_for_power_target
+
+HEATERS = [{"heaterName": f"heater-{index}", "type": "standard"} for index in range(3)]
+
+class TestStatusCache(unittest.TestCase):
+
+    def setUp(self):
+        self.probes = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def probe(self, heater):
+        self.probes.append(heater["heaterName"])
+        self.release.wait(5)
+        return {"reachable": True, "running": True, "level": "low", "powerTarget": 900, "error": None}
+
+    def test_fresh_status_is_served_from_cache(self):
+        cache = StatusCache(self.probe, max_age=30)
+        first = cache.statuses(HEATERS)
+        second = cache.statuses(HEATERS)
+
+        self.assertEqual(sorted(self.probes), ["heater-0", "heater-1", "heater-2"])
+        self.assertEqual(first, second)
+        self.assertEqual(first["heater-0"]["level"], "low")
+
+    def test_stale_status_is_probed_again(self):
+        cache = StatusCache(self.probe, max_age=30)
+        cache.status(HEATERS[0])
+        cache.status(HEATERS[0], max_age=0)
+        self.assertEqual(self.probes, ["heater-0", "heater-0"])
+
+    def test_concurrent_requests_share_one_probe(self):
+        cache = StatusCache(self.probe, max_age=30)
+        self.release.clear()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.statuses(HEATERS[:1])))
+                   for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.probes, ["heater-0"])
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(result["heater-0"]["reachable"] for result in results))
+
+    def test_invalidate_forces_probe_and_bumps_version(self):
+        cache = StatusCache(self.probe, max_age=30)
+        cache.status(HEATERS[0])
+        version = cache.version
+
+        cache.invalidate("heater-0")
+        self.assertGreater(cache.version, version)
+        cache.status(HEATERS[0])
+        self.assertEqual(self.probes, ["heater-0", "heater-0"])
+
+    def test_failed_probe_reports_unreachable(self):
+        def failing(heater):
+            raise OSError("no route to host")
+        status = StatusCache(failing).status(HEATERS[0])
+        self.assertFalse(status["reachable"])
+        self.assertIn("no route to host", status["error"])
+
+    def test_refresh_renews_statuses_before_they_go_stale(self):
+        cache = StatusCache(self.probe, heaters=lambda: HEATERS, max_age=30, refresh_interval=10)
+        cache.refresh()
+        cache.refresh()
+        self.assertEqual(len(self.probes), 3)
+
+        with patch('heater_status.time.time', return_value=time.time() + 25):
+            cache.refresh()
+        self.assertEqual(len(self.probes), 6)
+
+class TestLevels(unittest.TestCase):
+
+    def test_level_for_power_target(self):
+        self.assertEqual(level_for_power_target("standard", 900), "high")
+        self.assertIsNone(level_for_power_target("standard", 12345))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from history import HistoryStore
+
+DAY = 86400
+NOW = time.time()
+
+
+class TestHistoryStore(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "history.db")
+        self.store = HistoryStore(self.path, raw_retention_days=7, rollup_retention_days=30)
+        self.addCleanup(self.store.close)
+
+    def probe(self, heater, ok, latency, age, hostname=None):
+        self.store.record_probe(heater, hostname or f"{heater}-host", ok, latency, timestamp=NOW - age)
+
+    def test_uptime_per_host_and_time_range(self):
+        self.probe("office", True, 100.0, 300)
+        self.probe("office", True, 200.0, 200)
+        self.probe("office", False, None, 100)
+        self.probe("loft", True, 50.0, 100)
+        self.probe("loft", False, None, 2 * DAY)
+
+        fleet = self.store.uptime(NOW - DAY, NOW)
+        self.assertEqual(fleet["office"]["probes"], 3)
+        self.assertEqual(fleet["office"]["uptime"], 0.6667)
+        self.assertEqual(fleet["office"]["avgLatencyMs"], 150.0)
+        self.assertEqual(fleet["office"]["maxLatencyMs"], 200.0)
+        self.assertFalse(fleet["office"]["lastOk"])
+        self.assertEqual(fleet["loft"]["uptime"], 1.0)
+
+        by_hostname = self.store.uptime(NOW - 3 * DAY, NOW, heater="loft-host")
+        self.assertEqual(list(by_hostname), ["loft"])
+        self.assertEqual(by_hostname["loft"]["probes"], 2)
+
+    def test_events_newest_first_and_filtered(self):
+        self.probe("office", False, None, 20)
+        self.store.record_probe("office", "office-host", True, 80.0, "ip", timestamp=NOW - 10)
+        self.store.record_state("office", "office-host", timestamp=NOW - 5, level="high", running=True)
+
+        events = self.store.events(NOW - 60, NOW, heater="office")
+        self.assertEqual([event["kind"] for event in events], ["state", "probe", "probe"])
+        self.assertEqual(events[0]["level"], "high")
+        self.assertEqual(events[1]["method"], "ip")
+
+        probes = self.store.events(NOW - 60, NOW, kind="probe", limit=1)
+        self.assertEqual(len(probes), 1)
+        self.assertTrue(probes[0]["ok"])
+
+    def test_compaction_rolls_up_old_probes(self):
+        self.probe("office", True, 100.0, 10 * DAY)
+        self.probe("office", False, None, 10 * DAY - 60)
+        self.probe("office", True, 300.0, 10 * DAY - 120)
+        self.probe("office", True, 100.0, 60 * DAY)  # past the rollup retention
+        self.probe("office", True, 50.0, 60)
+        self.store.record_state("office", timestamp=NOW - 10 * DAY, level="low")
+
+        deleted = self.store.compact(now=NOW)
+
+        self.assertEqual(deleted, 5)
+        self.assertEqual(self.store.events(NOW - 90 * DAY, NOW), self.store.events(NOW - DAY, NOW))
+        summary = self.store.uptime(NOW - 90 * DAY, NOW)["office"]
+        self.assertEqual(summary["probes"], 4)
+        self.assertEqual(summary["up"], 3)
+        self.assertEqual(summary["avgLatencyMs"], 150.0)
+        self.assertEqual(summary["maxLatencyMs"], 300.0)
+
+        # Compacting again merges into the same hourly rows
+        self.probe("office", True, 100.0, 10 * DAY - 30)
+        self.store.compact(now=NOW)
+        self.assertEqual(self.store.uptime(NOW - 90 * DAY, NOW)["office"]["probes"], 5)
+
+    def test_automatic_compaction(self):
+        store = HistoryStore(self.path, raw_retention_days=7, compact_interval=0)
+        self.addCleanup(store.close)
+        store.record_probe("office", "office-host", True, timestamp=NOW - 30 * DAY)
+        store.record_probe("office", "office-host", True)  # triggers a compaction
+        store.record_probe("office", "office-host", True)
+        self.assertEqual(len(store.events(0, NOW * 2)), 2)
+
+    def test_concurrent_appends(self):
+        def append(index):
+            for offset in range(50):
+                self.probe(f"heater-{index}", True, 10.0, offset)
+
+        threads = [threading.Thread(target=append, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        summary = self.store.uptime(NOW - DAY, NOW + 1)
+        self.assertEqual(sorted(summary), [f"heater-{index}" for index in range(4)])
+        self.assertTrue(all(entry["probes"] == 50 for entry in summary.values()))
+
+    def test_write_errors_are_logged_not_raised(self):
+        store = HistoryStore(os.path.join(self.path, "missing", "history.db"))
+        with self.assertLogs("history", level="ERROR"):
+            store.record_probe("office", "office-host", True)
+
+
+if __name__ == '__main__':
+    unittest.main()
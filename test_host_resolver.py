@@ -0,0 +1,138 @@
+import asyncio
+import socket
+import time
+import unittest
+from unittest.mock import patch
+from host_resolver import AddressCache, HostResolver, LatencyTracker, heater_addresses, race_async
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class TestLatencyTracker(unittest.TestCase):
+
+    def test_timeout_follows_latency(self):
+        latency = LatencyTracker(initial=2, minimum=0.1, maximum=10)
+        self.assertEqual(latency.timeout("miner"), 2)
+
+        for _ in range(20):
+            latency.observe("miner", 0.01)
+        self.assertEqual(latency.timeout("miner"), 0.1)
+
+        for _ in range(20):
+            latency.observe("miner", 1.0)
+        self.assertGreater(latency.timeout("miner"), 1.0)
+        self.assertLessEqual(latency.timeout("miner"), 10)
+
+    def test_timeouts_back_off_until_an_answer(self):
+        latency = LatencyTracker(initial=2, minimum=1, maximum=10)
+        latency.observe("miner", 0.01)
+        latency.timed_out("miner")
+        latency.timed_out("miner")
+        self.assertEqual(latency.timeout("miner"), 4)
+        self.assertEqual(latency.timeout("miner", cap=3), 3)
+
+        latency.observe("miner", 0.01)
+        self.assertEqual(latency.timeout("miner"), 1)
+
+class TestAddressCache(unittest.TestCase):
+
+    def test_names_are_cached_for_the_ttl(self):
+        cache = AddressCache(ttl=60)
+        with patch('socket.getaddrinfo', return_value=["info"]) as mock_lookup:
+            self.assertEqual(cache.resolve("miner.local", 22), ["info"])
+            self.assertEqual(cache.resolve("miner.local", 22), ["info"])
+        self.assertEqual(mock_lookup.call_count, 1)
+
+        cache.forget("miner.local", 22)
+        with patch('socket.getaddrinfo', return_value=["info"]) as mock_lookup:
+            cache.resolve("miner.local", 22)
+        self.assertEqual(mock_lookup.call_count, 1)
+
+    def test_failed_lookups_are_cached(self):
+        cache = AddressCache(negative_ttl=60)
+        with patch('socket.getaddrinfo', side_effect=socket.gaierror(-2, "Name or service not known")) as mock_lookup:
+            for _ in range(2):
+                with self.assertRaises(socket.gaierror):
+                    cache.resolve("gone.local", 22)
+        self.assertEqual(mock_lookup.call_count, 1)
+
+    def test_ip_addresses_are_not_looked_up(self):
+        [info] = AddressCache().resolve("127.0.0.1", 22)
+        self.assertEqual(info[4], ("127.0.0.1", 22))
+
+class TestHostResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.addCleanup(self.server.close)
+        self.port = self.server.getsockname()[1]
+        self.resolver = HostResolver(hedge_delay=0.05)
+
+        # 'slow.local' takes a second to resolve; everything else resolves normally
+        resolve = self.resolver.cache.resolve
+        def slow_resolve(name, port):
+            if name == "slow.local":
+                time.sleep(1)
+                return resolve("127.0.0.1", port)
+            return resolve(name, port)
+        patcher = patch.object(self.resolver.cache, 'resolve', side_effect=slow_resolve)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fastest_address_wins_and_is_tried_first_next_time(self):
+        started = time.monotonic()
+        sock, address = self.resolver.connect("miner", [("slow.local", "slow.local", self.port),
+                                                        ("127.0.0.1", "127.0.0.1", self.port)])
+        sock.close()
+
+        self.assertEqual(address, "127.0.0.1")
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(self.resolver.winner("miner"), "127.0.0.1")
+        self.resolver.aliases = lambda host: ["slow.local", "127.0.0.1"]
+        self.assertEqual(self.resolver.candidates("miner"), ["127.0.0.1", "slow.local"])
+        self.assertEqual(self.resolver.stats()["latency"]["127.0.0.1"]["samples"], 1)
+
+    def test_failed_address_starts_the_next_at_once(self):
+        resolver = HostResolver(hedge_delay=5)
+        sock, address = resolver.connect("miner", [("stale", "127.0.0.1", closed_port()),
+                                                   ("miner.local", "127.0.0.1", self.port)])
+        sock.close()
+        self.assertEqual(address, "miner.local")
+
+    def test_first_error_is_raised_when_every_address_fails(self):
+        with self.assertRaises(ConnectionRefusedError):
+            self.resolver.connect("miner", [("127.0.0.1", "127.0.0.1", closed_port()),
+                                            ("miner.local", "127.0.0.1", closed_port())])
+
+    def test_unknown_hosts_are_connected_as_given(self):
+        self.resolver.aliases = lambda host: None
+        self.assertEqual(self.resolver.candidates("192.168.1.50"), ["192.168.1.50"])
+
+class TestRaceAsync(unittest.TestCase):
+
+    def test_first_success_wins(self):
+        async def attempt(address):
+            if address == "slow":
+                await asyncio.sleep(5)
+            return {"exit_code": 0 if address != "broken" else 1, "address": address}
+
+        def race(addresses):
+            return asyncio.run(race_async(addresses, attempt, lambda result: result["exit_code"] == 0, 0.05))
+
+        started = time.monotonic()
+        self.assertEqual(race(["slow", "fast"])[0], "fast")
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(race(["broken", "fast"])[0], "fast")
+        self.assertEqual(race(["broken"]), ("broken", {"exit_code": 1, "address": "broken"}))
+
+class TestHeaterAddresses(unittest.TestCase):
+
+    def test_ip_then_mdns_name(self):
+        self.assertEqual(heater_addresses("s9office", "192.168.1.10"), ["192.168.1.10", "s9office.local"])
+        self.assertEqual(heater_addresses("s9office", ""), ["s9office.local"])
+        self.assertEqual(heater_addresses(None, "192.168.1.10"), ["192.168.1.10"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import gzip
+import os
+import tempfile
+import time
+import unittest
+
+from werkzeug.datastructures import ETags
+from werkzeug.http import parse_date
+
+from http_cache import CachedBody, FileBodyCache, VersionedBodyCache, accepted_encodings
+
+BODY = b'{"heaterName": "office"}' * 40
+
+
+class TestAcceptEncoding(unittest.TestCase):
+
+    def test_quality_zero_is_refused(self):
+        self.assertEqual(accepted_encodings("gzip;q=0, br;q=0.5, identity"), {"br", "identity"})
+        self.assertEqual(accepted_encodings(None), set())
+
+
+class TestCachedBody(unittest.TestCase):
+
+    def test_gzip_variant_round_trips(self):
+        cached = CachedBody(BODY, "application/json", 1_700_000_000)
+        encoding, body, etag = cached.variant("gzip, deflate")
+
+        self.assertEqual(encoding, "gzip")
+        self.assertEqual(gzip.decompress(body), BODY)
+        self.assertLess(len(body), len(BODY))
+        self.assertTrue(etag.endswith('-gzip"'))
+
+        self.assertEqual(cached.variant("identity")[:2], (None, BODY))
+
+    def test_small_bodies_are_not_compressed(self):
+        cached = CachedBody(b"[]", "application/json", 0)
+        self.assertEqual(cached.variant("gzip")[0], None)
+
+    def test_validators(self):
+        cached = CachedBody(BODY, "application/json", 1_700_000_000, version="abc123")
+        _, _, etag = cached.variant("gzip")
+
+        self.assertTrue(cached.not_modified(ETags([etag.strip('"')]), None))
+        self.assertTrue(cached.not_modified(ETags(weak_etags=["abc123"]), None))
+        self.assertFalse(cached.not_modified(ETags(["other"]), None))
+        self.assertTrue(cached.not_modified(ETags(star_tag=True), None))
+
+        self.assertTrue(cached.not_modified(ETags(), parse_date(cached.last_modified_header)))
+        self.assertFalse(cached.not_modified(ETags(), parse_date("Mon, 01 Jan 2001 00:00:00 GMT")))
+        # If-None-Match wins over If-Modified-Since
+        self.assertFalse(cached.not_modified(ETags(["other"]), parse_date(cached.last_modified_header)))
+
+
+class TestBodyCaches(unittest.TestCase):
+
+    def test_versioned_cache_builds_once_per_version(self):
+        cache, builds = VersionedBodyCache(), []
+
+        def build():
+            builds.append(1)
+            return CachedBody(BODY, "application/json", 0)
+
+        first = cache.get("v1", build)
+        self.assertIs(cache.get("v1", build), first)
+        self.assertIsNot(cache.get("v2", build), first)
+        self.assertEqual(len(builds), 2)
+
+    def test_file_cache_reloads_on_change(self):
+        fd, path = tempfile.mkstemp(suffix=".html")
+        with os.fdopen(fd, "wb") as file:
+            file.write(b"<p>one</p>")
+        self.addCleanup(os.remove, path)
+        cache = FileBodyCache(path, "text/html")
+
+        first = cache.get()
+        self.assertIs(cache.get(), first)
+
+        with open(path, "wb") as file:
+            file.write(b"<p>two!</p>")
+        os.utime(path, (time.time() + 5, time.time() + 5))
+        second = cache.get()
+        self.assertEqual(second.body, b"<p>two!</p>")
+        self.assertNotEqual(second.etags, first.etags)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import threading
+import time
+import unittest
+from jobs import JobQueue, QueueFullError, SUCCEEDED, FAILED
+
+def wait_for(job, timeout=2.0):
+    """Poll until a job has finished."""
+    deadline = time.monotonic() + timeout
+    while not job.done and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return job
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = JobQueue(workers=4)
+        self.addCleanup(self.queue.shutdown)
+
+    def test_job_result_and_state(self):
+        ok = wait_for(self.queue.submit("miner1", "ok", lambda: ({"message": "done"}, 200)))
+        bad = wait_for(self.queue.submit("miner1", "bad", lambda: ({"error": "nope"}, 500)))
+        boom = wait_for(self.queue.submit("miner1", "boom", lambda: 1 / 0))
+
+        self.assertEqual((ok.state, ok.result), (SUCCEEDED, {"message": "done"}))
+        self.assertEqual((bad.state, bad.status_code), (FAILED, 500))
+        self.assertEqual(boom.state, FAILED)
+        self.assertIn("division by zero", boom.result["error"])
+        self.assertIs(self.queue.get(ok.id), ok)
+
+    def test_jobs_for_same_key_run_in_order(self):
+        order, running = [], []
+
+        def step(name):
+            def operation():
+                running.append(name)
+                self.assertEqual(len(running), 1)  # never overlaps with another step
+                time.sleep(0.02)
+                order.append(name)
+                running.remove(name)
+                return {}, 200
+            return operation
+
+        jobs = [self.queue.submit("miner1", name, step(name)) for name in ("push", "restart", "verify")]
+        for job in jobs:
+            wait_for(job)
+
+        self.assertEqual(order, ["push", "restart", "verify"])
+
+    def test_jobs_for_different_keys_run_in_parallel(self):
+        barrier = threading.Barrier(3, timeout=1)
+
+        def operation():
+            barrier.wait()  # only passes if all three run at once
+            return {}, 200
+
+        jobs = [self.queue.submit(f"miner{i}", "parallel", operation) for i in range(3)]
+        self.assertTrue(all(wait_for(job).state == SUCCEEDED for job in jobs))
+
+    def test_queue_depth_is_bounded(self):
+        queue = JobQueue(workers=1, max_queued=2)
+        self.addCleanup(queue.shutdown)
+        release = threading.Event()
+
+        queue.submit("miner1", "blocker", lambda: (release.wait(), ({}, 200))[1])
+        time.sleep(0.05)  # let the blocker start running
+        queue.submit("miner1", "waiting-1", lambda: ({}, 200))
+        queue.submit("miner1", "waiting-2", lambda: ({}, 200))
+        with self.assertRaises(QueueFullError):
+            queue.submit("miner1", "rejected", lambda: ({}, 200))
+        release.set()
+
+    def test_finished_jobs_are_pruned(self):
+        queue = JobQueue(workers=1, max_retained=2)
+        self.addCleanup(queue.shutdown)
+
+        jobs = [wait_for(queue.submit("miner1", str(i), lambda: ({}, 200))) for i in range(3)]
+        queue.submit("miner1", "trigger prune", lambda: ({}, 200))
+
+        self.assertIsNone(queue.get(jobs[0].id))
+        self.assertIsNotNone(queue.get(jobs[2].id))
+
+if __name__ == '__main__':
+    unittest.main()
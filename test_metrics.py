@@ -0,0 +1,66 @@
+import socket
+import unittest
+import paramiko
+from metrics import Counter, Histogram, Registry
+from ssh_pool import classify_ssh_error, ssh_phase
+from metrics import ssh_errors, ssh_phase_duration
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counter_renders_labels(self):
+        counter = Counter('test_total', 'Things counted.', ('host', 'reused'))
+        counter.inc(host='miner1', reused='true')
+        counter.inc(2, host='miner1', reused='true')
+
+        self.assertEqual(counter.value(host='miner1', reused='true'), 3)
+        self.assertEqual(counter.render(), ['test_total{host="miner1",reused="true"} 3'])
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('test_seconds', 'Durations.', ('phase',), buckets=(0.1, 1))
+        histogram.observe(0.05, phase='exec')
+        histogram.observe(0.5, phase='exec')
+        histogram.observe(5, phase='exec')
+
+        self.assertEqual(histogram.render(), [
+            'test_seconds_bucket{phase="exec",le="0.1"} 1',
+            'test_seconds_bucket{phase="exec",le="1"} 2',
+            'test_seconds_bucket{phase="exec",le="+Inf"} 3',
+            'test_seconds_sum{phase="exec"} 5.55',
+            'test_seconds_count{phase="exec"} 3',
+        ])
+
+    def test_registry_renders_help_and_type(self):
+        registry = Registry()
+        registry.counter('b_total', 'B.').inc()
+        registry.histogram('a_seconds', 'A.')
+
+        text = registry.render()
+        self.assertTrue(text.startswith('# HELP a_seconds A.\n# TYPE a_seconds histogram\n'))
+        self.assertIn('# TYPE b_total counter\nb_total 1\n', text)
+
+    def test_label_values_are_escaped(self):
+        counter = Counter('test_total', 'Escaping.', ('host',))
+        counter.inc(host='a"b')
+        self.assertEqual(counter.render(), ['test_total{host="a\\"b"} 1'])
+
+class TestSSHPhase(unittest.TestCase):
+
+    def test_classify_ssh_error(self):
+        self.assertEqual(classify_ssh_error(socket.gaierror()), 'name_resolution')
+        self.assertEqual(classify_ssh_error(socket.timeout()), 'timeout')
+        self.assertEqual(classify_ssh_error(paramiko.AuthenticationException()), 'auth')
+        self.assertEqual(classify_ssh_error(ConnectionRefusedError()), 'refused')
+        self.assertEqual(classify_ssh_error(paramiko.SSHException()), 'ssh')
+        self.assertEqual(classify_ssh_error(OSError()), 'network')
+        self.assertEqual(classify_ssh_error(ValueError()), 'other')
+
+    def test_failed_phase_is_timed_and_counted(self):
+        with self.assertRaises(paramiko.AuthenticationException):
+            with ssh_phase('handshake', 'phase-test'):
+                raise paramiko.AuthenticationException()
+
+        self.assertEqual(ssh_phase_duration.count(phase='handshake', host='phase-test'), 1)
+        self.assertEqual(ssh_errors.value(phase='handshake', host='phase-test', kind='auth'), 1)
+
+if __name__ == '__main__':
+    unittest.main()
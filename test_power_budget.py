@@ -0,0 +1,112 @@
+import itertools
+import os
+import random
+import tempfile
+import unittest
+
+from power_budget import (plan_power, solve, load_power_targets, read_power_target,
+                          heater_efficiencies, MAX_CELLS)
+
+TARGETS = {
+    "standard": {"low": 600, "medium": 700, "high": 900},
+    "quiet": {"low": 300, "medium": 450, "high": 600},
+}
+
+HEATERS = [
+    {"heaterName": "hvac-front-1", "type": "standard", "location": "Basement", "limitPower": False},
+    {"heaterName": "hvac-front-2", "type": "standard", "location": "Basement", "limitPower": False},
+    {"heaterName": "office", "type": "quiet", "location": "Office", "limitPower": False},
+    {"heaterName": "loft", "type": "quiet", "location": "Loft", "limitPower": True},
+]
+
+
+def brute_force(items, budget):
+    best = None
+    for picked in itertools.product(*(range(len(options)) for options in items)):
+        weight = sum(items[i][j][0] for i, j in enumerate(picked))
+        value = sum(items[i][j][1] for i, j in enumerate(picked))
+        if weight <= budget and (best is None or value > best):
+            best = value
+    return best
+
+
+class TestPowerTargets(unittest.TestCase):
+
+    def test_shipped_configs_have_power_targets(self):
+        targets = load_power_targets(["standard", "quiet"])
+        for levels in targets.values():
+            self.assertLess(levels["low"], levels["high"])
+
+    def test_missing_power_target(self):
+        fd, path = tempfile.mkstemp(suffix=".toml")
+        with os.fdopen(fd, "w") as file:
+            file.write("[autotuning]\nenabled = true\n")
+        self.addCleanup(os.remove, path)
+        with self.assertRaises(ValueError):
+            read_power_target(path)
+
+
+class TestSolver(unittest.TestCase):
+
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        for _ in range(50):
+            items = [[(0, 0.0)] + [(rng.randint(1, 9), rng.uniform(0, 10)) for _ in range(rng.randint(1, 3))]
+                     for _ in range(rng.randint(1, 5))]
+            budget = rng.randint(0, 25)
+            picked, weight, value = solve(items, budget)
+            self.assertLessEqual(weight, budget)
+            self.assertAlmostEqual(value, brute_force(items, budget))
+
+
+class TestPlanPower(unittest.TestCase):
+
+    def test_plan_stays_within_budget(self):
+        plan = plan_power(HEATERS, 2000, TARGETS)
+
+        self.assertLessEqual(plan["totalWatts"], 2000)
+        self.assertEqual(plan["totalWatts"], 2000)
+        self.assertEqual(set(plan["assignments"]), {heater["heaterName"] for heater in HEATERS})
+
+    def test_generous_budget_runs_everything_high_except_limited(self):
+        plan = plan_power(HEATERS, 10000, TARGETS)
+        self.assertEqual(plan["assignments"], {
+            "hvac-front-1": "high", "hvac-front-2": "high", "office": "high", "loft": "low"
+        })
+
+    def test_priorities_decide_who_gets_power(self):
+        plan = plan_power(HEATERS, 900, TARGETS, priorities={"Office": 5, "Basement": 1, "Loft": 0})
+        self.assertEqual(plan["assignments"]["office"], "high")
+        self.assertEqual(plan["assignments"]["loft"], "off")
+        self.assertEqual(plan["assignments"]["hvac-front-1"], "off")
+
+    def test_hashrate_objective_prefers_efficient_heaters(self):
+        efficiencies = {"hvac-front-1": 0.02, "hvac-front-2": 0.05, "office": 0.01, "loft": 0.01}
+        plan = plan_power(HEATERS[:2], 900, TARGETS, objective="hashrate", efficiencies=efficiencies)
+        self.assertEqual(plan["assignments"], {"hvac-front-1": "off", "hvac-front-2": "high"})
+
+    def test_efficiencies_fall_back_to_fleet_median(self):
+        latest = {"hvac-front-1": {"t": 0, "metrics": {"hashrate_ths": 13.5, "power_w": 1350.0}}}
+        self.assertEqual(heater_efficiencies(HEATERS[:2], latest), {"hvac-front-1": 0.01, "hvac-front-2": 0.01})
+
+    def test_invalid_input(self):
+        with self.assertRaises(ValueError):
+            plan_power(HEATERS, 1000, TARGETS, objective="noise")
+        with self.assertRaises(ValueError):
+            plan_power(HEATERS, -1, TARGETS)
+        with self.assertRaises(ValueError):
+            plan_power(HEATERS, 1000, TARGETS, priorities={"Office": -1})
+
+    def test_large_fleet_with_fine_grained_budget_never_exceeds_it(self):
+        targets = {"odd": {"low": 601, "medium": 733, "high": 907}}
+        heaters = [{"heaterName": f"h{i}", "type": "odd", "location": "Barn"} for i in range(40)]
+        budget = 25013
+        self.assertGreater(budget, MAX_CELLS)
+
+        plan = plan_power(heaters, budget, targets)
+        self.assertLessEqual(plan["totalWatts"], budget)
+        self.assertGreater(plan["totalWatts"], budget * 0.95)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+
+from reconciler import DesiredStateStore, Reconciler, drifted, schedule_active
+from shared_state import SharedState
+
+HEATERS = [
+    {"heaterName": "hvac-front-1", "hostname": "s9hvac1f", "type": "standard", "location": "Basement", "ipAddress": "192.168.1.210", "limitPower": False},
+    {"heaterName": "hvac-front-2", "hostname": "s9hvac2f", "type": "standard", "location": "Basement", "ipAddress": "192.168.1.211", "limitPower": False},
+    {"heaterName": "office", "hostname": "ellsworth-office", "type": "quiet", "location": "Office", "ipAddress": "192.168.1.203", "limitPower": True},
+]
+
+# A Saturday
+MORNING = datetime(2024, 1, 6, 7, 30)
+NOON = datetime(2024, 1, 6, 12, 0)
+
+
+class TestDesiredStateStore(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "desired_state.json")
+        self.store = DesiredStateStore(self.path)
+
+    def test_update_persists_and_reloads(self):
+        self.store.update({"office": "low", "hvac-front-1": "high"})
+        self.store.update({"hvac-front-1": None})
+
+        reloaded = DesiredStateStore(self.path).get()
+        self.assertEqual(reloaded["heaters"], {"office": "low"})
+        self.assertEqual(reloaded["schedules"], [])
+
+    def test_sees_updates_from_other_processes(self):
+        self.assertEqual(self.store.get()["heaters"], {})
+        DesiredStateStore(self.path).update({"office": "high"})
+
+        self.assertEqual(self.store.get()["heaters"], {"office": "high"})
+
+    def test_update_waits_for_other_workers_transaction(self):
+        workdir = os.path.dirname(self.path)
+        first, second = SharedState(os.path.join(workdir, "state.db")), SharedState(os.path.join(workdir, "state.db"))
+        self.addCleanup(first.close)
+        self.addCleanup(second.close)
+        DesiredStateStore(self.path, shared_state=first).update({"office": "low"})
+
+        updater = threading.Thread(target=DesiredStateStore(self.path, shared_state=first).update,
+                                   args=({"hvac-front-1": "high"},))
+        with second.transaction():
+            updater.start()
+            updater.join(0.2)
+            self.assertTrue(updater.is_alive())
+            # The other worker's change, made while it holds the write transaction
+            DesiredStateStore(self.path).update({"hvac-front-2": "medium"})
+        updater.join()
+
+        self.assertEqual(self.store.get()["heaters"], {"office": "low", "hvac-front-1": "high", "hvac-front-2": "medium"})
+
+    def test_invalid_update_changes_nothing(self):
+        self.store.update({"office": "low"})
+        with self.assertRaises(ValueError):
+            self.store.update({"office": "high"}, [{"level": "high", "from": "25:00", "to": "06:00", "heaterNames": ["office"]}])
+        self.assertEqual(self.store.get()["heaters"], {"office": "low"})
+
+    def test_schedules_override_in_order(self):
+        self.store.update({"office": "low"}, [
+            {"level": "high", "from": "06:00", "to": "09:00", "selector": {"location": "Basement"}},
+            {"level": "medium", "from": "07:00", "to": "08:00", "heaterNames": ["hvac-front-2", "office"]},
+        ])
+
+        self.assertEqual(self.store.desired_levels(HEATERS, MORNING),
+                         {"hvac-front-1": "high", "hvac-front-2": "medium", "office": "medium"})
+        self.assertEqual(self.store.desired_levels(HEATERS, NOON), {"office": "low"})
+
+    def test_window_wrapping_midnight_uses_start_day(self):
+        schedule = {"level": "off", "from": "23:00", "to": "05:00", "heaterNames": ["office"], "days": ["fri"]}
+        self.assertTrue(schedule_active(schedule, datetime(2024, 1, 5, 23, 30)))  # Friday night
+        self.assertTrue(schedule_active(schedule, datetime(2024, 1, 6, 4, 0)))  # early Saturday
+        self.assertFalse(schedule_active(schedule, datetime(2024, 1, 6, 23, 30)))  # Saturday night
+
+
+class TestDrift(unittest.TestCase):
+
+    def test_unknown_state_is_drifted(self):
+        self.assertTrue(drifted("low", None))
+        self.assertTrue(drifted("off", {"level": "low", "running": None}))
+
+    def test_level_and_running_must_match(self):
+        self.assertFalse(drifted("low", {"level": "low", "running": True}))
+        self.assertTrue(drifted("low", {"level": "low", "running": False}))
+        self.assertTrue(drifted("high", {"level": "low", "running": True}))
+        self.assertFalse(drifted("off", {"level": "high", "running": False}))
+
+
+class TestReconciler(unittest.TestCase):
+
+    def setUp(self):
+        self.store = DesiredStateStore(os.path.join(tempfile.mkdtemp(), "desired_state.json"))
+        self.observed = {}
+        self.applied = []
+        self.failing = set()
+        self.lock = threading.Lock()
+        self.reconciler = Reconciler(self.store, lambda: HEATERS, self.observed.get, self.apply, concurrency=2)
+
+    def apply(self, heater, level):
+        name = heater["heaterName"]
+        with self.lock:
+            self.applied.append((name, level))
+        if name in self.failing:
+            return {"error": "Connection error: timed out"}, 500
+        self.observed[name] = {"level": None if level == "off" else level, "running": level != "off"}
+        return {"status": "updated"}, 200
+
+    def test_steady_state_touches_nothing(self):
+        self.store.update({"office": "low", "hvac-front-1": "high"})
+        first = self.reconciler.reconcile(now=NOON)
+        self.assertEqual(sorted(self.applied), [("hvac-front-1", "high"), ("office", "low")])
+        self.assertTrue(all(result["ok"] for result in first["results"]))
+
+        self.applied.clear()
+        second = self.reconciler.reconcile(now=NOON)
+        self.assertEqual(self.applied, [])
+        self.assertEqual(second["drifted"], [])
+
+    def test_only_changed_heaters_are_applied(self):
+        self.store.update({"office": "low", "hvac-front-1": "high", "hvac-front-2": "high"})
+        self.reconciler.reconcile(now=NOON)
+        self.applied.clear()
+
+        self.store.update({"office": "medium"})
+        self.reconciler.reconcile(now=NOON)
+        self.assertEqual(self.applied, [("office", "medium")])
+
+    def test_already_matching_heater_is_skipped(self):
+        self.observed["office"] = {"level": "low", "running": True}
+        self.store.update({"office": "low"})
+
+        summary = self.reconciler.reconcile(now=NOON)
+        self.assertEqual(summary["desired"], 1)
+        self.assertEqual(self.applied, [])
+
+    def test_schedule_boundary_triggers_apply(self):
+        self.store.update({"office": "low"}, [{"level": "high", "from": "06:00", "to": "09:00", "heaterNames": ["office"]}])
+        self.reconciler.reconcile(now=NOON)
+        self.reconciler.reconcile(now=MORNING)
+        self.reconciler.reconcile(now=NOON)
+        self.assertEqual(self.applied, [("office", "low"), ("office", "high"), ("office", "low")])
+
+    def test_failed_heater_is_retried(self):
+        self.store.update({"office": "low"})
+        self.failing.add("office")
+        summary = self.reconciler.reconcile(now=NOON)
+        self.assertFalse(summary["results"][0]["ok"])
+
+        self.failing.clear()
+        self.reconciler.reconcile(now=NOON)
+        self.assertEqual(self.applied, [("office", "low"), ("office", "low")])
+        self.reconciler.reconcile(now=NOON)
+        self.assertEqual(len(self.applied), 2)
+
+    def test_manual_change_persists_until_full_pass(self):
+        self.store.update({"office": "low"})
+        self.reconciler.reconcile(now=NOON)
+        self.observed["office"] = {"level": "high", "running": True}  # changed from the dashboard
+
+        self.reconciler.reconcile(now=NOON)
+        self.assertEqual(len(self.applied), 1)
+
+        self.reconciler.reconcile(full=True, now=NOON)
+        self.assertEqual(self.applied, [("office", "low"), ("office", "low")])
+
+    def test_dry_run_applies_nothing_and_keeps_changes_pending(self):
+        self.store.update({"office": "off"})
+        summary = self.reconciler.reconcile(dry_run=True, now=NOON)
+        self.assertEqual(summary["drifted"], [{"heaterName": "office", "level": "off"}])
+        self.assertEqual(self.applied, [])
+
+        self.reconciler.reconcile(now=NOON)
+        self.assertEqual(self.applied, [("office", "off")])
+
+    def test_seeded_pass_skips_heaters_set_before_a_restart(self):
+        self.store.update({"office": "low", "hvac-front-1": "high"})
+        self.reconciler.seed(now=NOON)
+
+        summary = self.reconciler.reconcile(now=NOON)
+        self.assertEqual(summary["drifted"], [])
+
+        self.store.update({"office": "medium"})
+        self.reconciler.reconcile(now=NOON)
+        self.assertEqual(self.applied, [("office", "medium")])
+
+    def test_listener_only_hears_passes_with_work(self):
+        summaries = []
+        self.reconciler.listener = summaries.append
+        self.store.update({"office": "low"})
+        self.reconciler.reconcile(now=NOON)
+        self.reconciler.reconcile(now=NOON)
+        self.assertEqual(len(summaries), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+import paramiko
+import utils
+from fake_miner import FakeFleet
+from remote_engine import RemoteEngine, PoolBackend, SyncBridge
+from ssh_pool import SSHConnectionPool, set_pool
+from test_connectivity import scan_fleet_async
+
+class RemoteEngineTestCase(unittest.TestCase):
+    """Runs the engine against in-process fake miners."""
+
+    LATENCY = 0.0
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.TemporaryDirectory()
+        cls.key_path = os.path.join(cls.workdir.name, 'id_rsa')
+        paramiko.RSAKey.generate(2048).write_private_key_file(cls.key_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.workdir.cleanup()
+
+    def setUp(self):
+        self.fleet = FakeFleet(3, latency=self.LATENCY).start()
+        self.addCleanup(self.fleet.stop)
+        self.hosts = [heater["ipAddress"] for heater in self.fleet.heaters()]
+
+        self.pool = SSHConnectionPool(key_path=self.key_path, addresses=self.fleet.addresses())
+        self.addCleanup(self.pool.close_all)
+        previous = set_pool(self.pool)
+        self.addCleanup(set_pool, previous)
+
+        utils._remote_hashes.clear()
+        self.addCleanup(utils._remote_hashes.clear)
+
+    def run_engine(self, engine, coroutine):
+        async def run():
+            try:
+                return await coroutine
+            finally:
+                await engine.close()
+        return asyncio.run(run())
+
+class TestRemoteEngine(RemoteEngineTestCase):
+
+    def test_execute_many_returns_results_in_host_order(self):
+        engine = RemoteEngine(backend=PoolBackend())
+        results = self.run_engine(engine, engine.execute_many(self.hosts, "pidof bosminer"))
+
+        self.assertEqual([result["host"] for result in results], self.hosts)
+        self.assertTrue(all(result["exit_code"] == 0 and result["output"] == "1234" for result in results))
+
+    def test_transfer_renders_and_uploads(self):
+        engine = RemoteEngine(backend=PoolBackend())
+        template = 'bosminerConfig/bosminer-standard-medium.toml'
+
+        transferred = self.run_engine(engine, engine.transfer(template, '/etc/bosminer.toml', 'fake-miner-2'))
+
+        self.assertTrue(transferred)
+        self.assertEqual(self.fleet.miners[1].files['/etc/bosminer.toml'], utils.render_config(template, 'fake-miner-2'))
+
+    def test_transfer_skips_unchanged_config(self):
+        engine = RemoteEngine(backend=PoolBackend())
+        template = 'bosminerConfig/bosminer-standard-medium.toml'
+
+        async def run():
+            first = await engine.transfer(template, '/etc/bosminer.toml', 'fake-miner-2', host=self.hosts[1])
+            utils.config_activated('fake-miner-2')  # as after bosminer is restarted onto it
+            self.fleet.miners[1].files['/etc/bosminer.toml'] = b"edited on the miner"
+            second = await engine.transfer(template, '/etc/bosminer.toml', 'fake-miner-2', host=self.hosts[1])
+            return first, second
+
+        self.assertEqual(self.run_engine(engine, run()), (True, True))
+        # The second push trusted the remembered hash and uploaded nothing
+        self.assertEqual(self.fleet.miners[1].files['/etc/bosminer.toml'], b"edited on the miner")
+
+    def test_timed_out_operation_frees_its_thread_and_connection(self):
+        engine = RemoteEngine(timeout=0.5, backend=PoolBackend(workers=1))
+
+        async def run():
+            # 'logread -f' runs until the channel is closed
+            timed_out = await engine.execute(self.hosts[0], "logread -f")
+            # The only worker thread must be free again for this to run
+            return timed_out, await engine.execute(self.hosts[0], "pidof bosminer", timeout=5)
+
+        timed_out, result = self.run_engine(engine, run())
+        self.assertIn("timed out", timed_out["error"])
+        self.assertEqual(result["exit_code"], 0)
+        self.assertEqual([conn["leases"] for conn in self.pool.stats()["connections"]], [0])
+
+    def test_sync_bridge(self):
+        bridge = SyncBridge(RemoteEngine(backend=PoolBackend()))
+        self.addCleanup(bridge.close)
+
+        result = bridge.execute_remote_command(self.hosts[0], "/etc/init.d/bosminer stop")
+
+        self.assertEqual(result, {"host": self.hosts[0], "command": "/etc/init.d/bosminer stop",
+                                  "exit_code": 0, "output": "", "error": ""})
+        self.assertFalse(self.fleet.miners[0].running)
+
+    @patch('test_connectivity.print_miner_result')
+    def test_connectivity_scan_uses_engine(self, mock_print):
+        results = scan_fleet_async(self.fleet.heaters(), concurrency=3)
+
+        self.assertEqual([result["hostname_status"] for result in results], ["SUCCESS"] * 3)
+        self.assertEqual(mock_print.call_count, 3)
+
+    @patch('heaterService.REMOTE_ENGINE', 'async')
+    @patch('heaterService.get_bridge')
+    def test_service_commands_can_use_engine(self, mock_get_bridge):
+        import heaterService
+        mock_get_bridge.return_value.execute_remote_command.return_value = {"exit_code": 0, "error": ""}
+
+        self.assertEqual(heaterService.execute_remote_command("192.0.2.1", "pidof bosminer")["exit_code"], 0)
+        mock_get_bridge.return_value.execute_remote_command.assert_called_once_with("192.0.2.1", "pidof bosminer")
+
+class TestRemoteEngineLimits(RemoteEngineTestCase):
+
+    LATENCY = 0.2
+
+    def test_operations_time_out(self):
+        engine = RemoteEngine(timeout=0.05, backend=PoolBackend())
+        result = self.run_engine(engine, engine.execute(self.hosts[0], "pidof bosminer"))
+        self.assertIn("timed out", result["error"])
+
+    def test_concurrency_is_bounded(self):
+        engine = RemoteEngine(concurrency=1, backend=PoolBackend())
+        started = time.monotonic()
+        self.run_engine(engine, engine.execute_many(self.hosts, "pidof bosminer"))
+        self.assertGreaterEqual(time.monotonic() - started, 3 * self.LATENCY)
+
+if __name__ == '__main__':
+    unittest.main()
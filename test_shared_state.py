@@ -0,0 +1,126 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from shared_state import SharedState, LeaseHeldError
+
+class TestLeases(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        self.path = os.path.join(self.workdir.name, 'state.db')
+        self.first = SharedState(self.path, owner='worker-1', lease_wait=0)
+        self.second = SharedState(self.path, owner='worker-2', lease_wait=0)
+        self.addCleanup(self.first.close)
+        self.addCleanup(self.second.close)
+
+    def test_lease_excludes_other_workers(self):
+        with self.first.lease('heater:office'):
+            with self.assertRaises(LeaseHeldError) as raised:
+                with self.second.lease('heater:office'):
+                    pass
+            self.assertEqual(raised.exception.owner, 'worker-1')
+            self.assertGreaterEqual(raised.exception.retry_after, 1)
+            self.assertIn('heater:office', self.second.leases())
+
+        with self.second.lease('heater:office'):
+            pass
+        self.assertEqual(self.first.leases(), {})
+
+    def test_lease_is_reentrant_within_a_thread(self):
+        with self.first.lease('heater:office'):
+            with self.first.lease('heater:office'):
+                pass
+            self.assertIn('heater:office', self.first.leases())
+
+    def test_lease_excludes_other_threads_of_the_same_process(self):
+        errors = []
+        with self.first.lease('heater:office'):
+            def other():
+                try:
+                    with self.first.lease('heater:office'):
+                        pass
+                except LeaseHeldError as e:
+                    errors.append(e)
+            thread = threading.Thread(target=other)
+            thread.start()
+            thread.join()
+        self.assertEqual(len(errors), 1)
+
+    def test_expired_lease_is_taken_over(self):
+        token, _ = self.first.try_acquire('heater:office', ttl=0.05)
+        self.assertIsNotNone(token)
+        self.assertIsNone(self.second.try_acquire('heater:office')[0])
+        time.sleep(0.1)
+
+        with self.second.lease('heater:office'):
+            # The late release of the expired lease must not free the new holder's lease
+            self.first.release('heater:office', token)
+            self.assertEqual(self.first.leases()['heater:office']['owner'], 'worker-2')
+
+    def test_waits_for_lease(self):
+        waiting = SharedState(self.path, owner='worker-3', lease_wait=5)
+        self.addCleanup(waiting.close)
+        token, _ = self.first.try_acquire('heater:office')
+        threading.Timer(0.2, self.first.release, ('heater:office', token)).start()
+
+        started = time.monotonic()
+        with waiting.lease('heater:office'):
+            self.assertGreaterEqual(time.monotonic() - started, 0.15)
+
+    def test_one_winner_across_processes(self):
+        script = (
+            "import sys, time\n"
+            "from shared_state import SharedState\n"
+            "state = SharedState(sys.argv[1], owner=sys.argv[2])\n"
+            "token, _ = state.try_acquire('heater:office')\n"
+            "print('won' if token else 'lost')\n"
+        )
+        cwd = os.path.dirname(os.path.abspath(__file__))
+        processes = [subprocess.Popen([sys.executable, '-c', script, self.path, f'worker-{index}'], cwd=cwd,
+                                      stdout=subprocess.PIPE, text=True) for index in range(4)]
+        results = [process.communicate()[0].strip() for process in processes]
+        self.assertEqual(sorted(results), ['lost', 'lost', 'lost', 'won'])
+
+class TestSharedData(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        path = os.path.join(self.workdir.name, 'state.db')
+        self.first = SharedState(path, job_retention=60)
+        self.second = SharedState(path)
+        self.addCleanup(self.first.close)
+        self.addCleanup(self.second.close)
+
+    def test_jobs_visible_to_other_workers(self):
+        self.first.save_job({"jobId": "abc", "key": "office", "state": "running", "finished": None})
+        self.assertEqual(self.second.job("abc")["state"], "running")
+        self.assertIsNone(self.second.job("missing"))
+
+    def test_expired_jobs_are_dropped(self):
+        self.first.save_job({"jobId": "old", "key": "office", "state": "succeeded", "finished": time.time() - 120})
+        self.first.save_job({"jobId": "new", "key": "office", "state": "succeeded", "finished": time.time()})
+        self.assertIsNone(self.second.job("old"))
+        self.assertIsNotNone(self.second.job("new"))
+
+    def test_heater_state_changes(self):
+        state = self.first.update_heater_state("office", {"level": "low"})
+        self.assertEqual(state["level"], "low")
+        self.assertIsNone(self.second.update_heater_state("office", {"level": "low"}))
+        self.assertEqual(self.second.update_heater_state("office", {"running": True})["level"], "low")
+        self.assertTrue(self.first.heater_state("office")["running"])
+
+    def test_config_hashes(self):
+        self.first.remember_hash("ellsworth-office", "/etc/bosminer.toml", "abc")
+        path, digest, _ = self.second.remembered_hash("ellsworth-office")
+        self.assertEqual((path, digest), ("/etc/bosminer.toml", "abc"))
+        self.second.forget_hash("ellsworth-office")
+        self.assertIsNone(self.first.remembered_hash("ellsworth-office"))
+
+if __name__ == '__main__':
+    unittest.main()
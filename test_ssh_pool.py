@@ -0,0 +1,236 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+import socket
+import paramiko
+from circuit_breaker import CircuitBreaker, HostUnreachableError
+from ssh_pool import SSHConnectionPool, PoolExhaustedError
+from metrics import ssh_connections
+
+def make_client(active=True):
+    """Build a mock paramiko.SSHClient whose transport reports the given state."""
+    client = MagicMock()
+    client.get_transport.return_value.is_active.return_value = active
+    return client
+
+class TestSSHConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        key_patcher = patch.object(SSHConnectionPool, '_load_private_key', return_value=MagicMock())
+        self.mock_load_key = key_patcher.start()
+        self.addCleanup(key_patcher.stop)
+
+        # Every host has a single address unless a test adds more
+        self.addresses = {}
+        def open_socket(host, exclude=()):
+            remaining = [address for address in self.addresses.get(host, [host]) if address not in exclude]
+            if not remaining:
+                raise LookupError(f"No other address to try for {host}")
+            return MagicMock(), remaining[0]
+        socket_patcher = patch.object(SSHConnectionPool, '_open_socket', side_effect=open_socket)
+        self.mock_open_socket = socket_patcher.start()
+        self.addCleanup(socket_patcher.stop)
+
+        client_patcher = patch('paramiko.SSHClient')
+        self.mock_ssh_client = client_patcher.start()
+        self.addCleanup(client_patcher.stop)
+
+        self.pool = SSHConnectionPool(max_connections=2, breaker=CircuitBreaker(failure_threshold=2))
+        self.addCleanup(self.pool.close_all)
+
+    def test_connection_is_reused_for_same_host(self):
+        client = make_client()
+        self.mock_ssh_client.return_value = client
+
+        first = self.pool.run('miner1', lambda c: c)
+        second = self.pool.run('miner1', lambda c: c)
+
+        self.assertIs(first, second)
+        client.connect.assert_called_once()
+        client.get_transport.return_value.set_keepalive.assert_called_once_with(self.pool.keepalive_interval)
+        # The key is parsed once, not per connection
+        self.mock_load_key.assert_called_once()
+
+    def test_prewarm_loads_key_once(self):
+        self.assertIsNotNone(self.pool.prewarm())
+        self.pool.run('miner1', lambda c: None)
+
+        self.mock_load_key.assert_called_once()
+        client = self.mock_ssh_client.return_value
+        client.set_missing_host_key_policy.assert_called_once_with(self.pool.host_key_policy())
+
+    def test_prewarm_tolerates_missing_key(self):
+        self.mock_load_key.side_effect = FileNotFoundError("no key")
+        with self.assertLogs("ssh_pool", level="WARNING"):
+            self.assertIsNone(self.pool.prewarm())
+
+    def test_connection_reuse_is_counted(self):
+        self.mock_ssh_client.return_value = make_client()
+
+        self.pool.run('reuse-host', lambda c: None)
+        self.pool.run('reuse-host', lambda c: None)
+
+        self.assertEqual(ssh_connections.value(host='reuse-host', reused='false'), 1)
+        self.assertEqual(ssh_connections.value(host='reuse-host', reused='true'), 1)
+
+    def test_unhealthy_connection_is_replaced(self):
+        stale, fresh = make_client(), make_client()
+        self.mock_ssh_client.side_effect = [stale, fresh]
+
+        self.pool.run('miner1', lambda c: None)
+        stale.get_transport.return_value.is_active.return_value = False
+
+        self.assertIs(self.pool.run('miner1', lambda c: c), fresh)
+        stale.close.assert_called_once()
+
+    def test_broken_transport_is_retried_once(self):
+        broken, fresh = make_client(), make_client()
+        self.mock_ssh_client.side_effect = [broken, fresh]
+        self.pool.run('miner1', lambda c: None)
+
+        def operation(client):
+            if client is broken:
+                broken.get_transport.return_value.is_active.return_value = False
+                raise EOFError()
+            return 'ok'
+
+        # Health check passes before reuse, then the transport dies mid-operation
+        self.assertEqual(self.pool.run('miner1', operation, idempotent=True), 'ok')
+        broken.close.assert_called_once()
+
+    def test_broken_transport_is_not_retried_by_default(self):
+        broken = make_client()
+        self.mock_ssh_client.return_value = broken
+        self.pool.run('miner1', lambda c: None)
+
+        def operation(client):
+            broken.get_transport.return_value.is_active.return_value = False
+            raise EOFError()
+
+        # The command may have run before the connection broke, so it is not repeated
+        with self.assertRaises(EOFError):
+            self.pool.run('miner1', operation)
+        broken.close.assert_called_once()
+        self.mock_ssh_client.assert_called_once()
+
+    def test_operation_error_on_live_transport_is_not_retried(self):
+        client = make_client()
+        self.mock_ssh_client.return_value = client
+
+        with self.assertRaises(IOError):
+            self.pool.run('miner1', MagicMock(side_effect=IOError('no such file')))
+
+        client.connect.assert_called_once()
+        client.close.assert_not_called()
+
+    def test_idle_connections_are_evicted(self):
+        client = make_client()
+        self.mock_ssh_client.return_value = client
+        self.pool.idle_timeout = 0
+
+        self.pool.run('miner1', lambda c: None)
+        self.pool.evict_idle()
+
+        client.close.assert_called_once()
+        self.assertEqual(self.pool.stats()['connections'], [])
+
+    def test_least_recently_used_idle_connection_is_evicted_at_cap(self):
+        clients = [make_client(), make_client(), make_client()]
+        self.mock_ssh_client.side_effect = clients
+
+        self.pool.run('miner1', lambda c: None)
+        self.pool.run('miner2', lambda c: None)
+        self.pool.run('miner3', lambda c: None)
+
+        clients[0].close.assert_called_once()
+        hosts = [conn['host'] for conn in self.pool.stats()['connections']]
+        self.assertEqual(sorted(hosts), ['miner2', 'miner3'])
+
+    def test_pool_exhausted_when_all_connections_leased(self):
+        self.mock_ssh_client.side_effect = lambda: make_client()
+
+        with self.pool.connection('miner1'), self.pool.connection('miner2'):
+            with self.assertRaises(PoolExhaustedError):
+                self.pool.acquire('miner3')
+
+    def test_unreachable_host_fails_fast(self):
+        client = make_client()
+        client.connect.side_effect = socket.timeout('timed out')
+        self.mock_ssh_client.return_value = client
+
+        for _ in range(2):
+            with self.assertRaises(socket.timeout):
+                self.pool.run('miner1', lambda c: None)
+        with self.assertRaises(HostUnreachableError):
+            self.pool.run('miner1', lambda c: None)
+
+        self.assertEqual(client.connect.call_count, 2)
+        self.assertEqual(self.pool.stats()['unreachable'][0]['host'], 'miner1')
+
+    def test_auth_failure_does_not_mark_host_down(self):
+        client = make_client()
+        client.connect.side_effect = paramiko.AuthenticationException()
+        self.mock_ssh_client.return_value = client
+
+        for _ in range(3):
+            with self.assertRaises(paramiko.AuthenticationException):
+                self.pool.run('miner1', lambda c: None)
+        self.assertEqual(client.connect.call_count, 3)
+
+    def test_failed_handshake_retries_other_address_once(self):
+        self.addresses['miner1'] = ['192.168.1.10', 'miner1.local']
+        client = make_client()
+        client.connect.side_effect = [paramiko.SSHException("Error reading SSH protocol banner"), None]
+        self.mock_ssh_client.return_value = client
+
+        with self.assertLogs("ssh_pool", level="WARNING"):
+            self.pool.run('miner1', lambda c: None)
+
+        self.assertEqual(client.connect.call_count, 2)
+        self.assertEqual(self.mock_open_socket.call_args.kwargs, {"exclude": ('192.168.1.10',)})
+
+        # A refused key is not retried: the other address reaches the same sshd
+        self.addresses['miner2'] = ['192.168.1.11', 'miner2.local']
+        client.connect.side_effect = paramiko.AuthenticationException()
+        with self.assertRaises(paramiko.AuthenticationException):
+            self.pool.run('miner2', lambda c: None)
+        self.assertEqual(client.connect.call_count, 3)
+
+    def test_other_address_is_tried_only_once(self):
+        self.addresses['miner1'] = ['192.168.1.10', 'miner1.local']
+        client = make_client()
+        client.connect.side_effect = paramiko.SSHException("Error reading SSH protocol banner")
+        self.mock_ssh_client.return_value = client
+
+        with self.assertLogs("ssh_pool", level="WARNING"), self.assertRaises(paramiko.SSHException):
+            self.pool.run('miner1', lambda c: None)
+        self.assertEqual(client.connect.call_count, 2)
+
+class TestPrivateKey(unittest.TestCase):
+
+    def setUp(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.key_path = os.path.join(workdir.name, 'id_rsa')
+
+    def test_key_type_is_detected(self):
+        paramiko.ECDSAKey.generate().write_private_key_file(self.key_path)
+        key = SSHConnectionPool(key_path=self.key_path).private_key()
+        self.assertIsInstance(key, paramiko.ECDSAKey)
+
+    def test_unreadable_key_names_every_type_tried(self):
+        with open(self.key_path, 'w') as file:
+            file.write("not a key")
+        with self.assertRaises(paramiko.SSHException) as raised:
+            SSHConnectionPool(key_path=self.key_path).private_key()
+        self.assertIn(self.key_path, str(raised.exception))
+        self.assertIn("Ed25519Key", str(raised.exception))
+
+    @patch('ssh_pool.KEY_TYPES', ())
+    def test_no_key_types_raises_an_error(self):
+        with self.assertRaises(paramiko.SSHException):
+            SSHConnectionPool(key_path=self.key_path).private_key()
+
+if __name__ == '__main__':
+    unittest.main()
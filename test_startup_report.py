@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+
+import paramiko
+
+from startup_report import measure
+
+
+class TestStartupReport(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.TemporaryDirectory()
+        cls.key_path = os.path.join(cls.workdir.name, "id_rsa")
+        paramiko.RSAKey.generate(2048).write_private_key_file(cls.key_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.workdir.cleanup()
+
+    def test_service_starts_without_ssh_libraries(self):
+        result = measure("lazy", self.key_path)
+
+        self.assertEqual(result["heavy_modules_at_startup"], [])
+        self.assertIsNotNone(result["ssh_setup_ms"])
+
+    def test_eager_mode_loads_paramiko_up_front(self):
+        result = measure("eager", self.key_path)
+        self.assertIn("paramiko", result["heavy_modules_at_startup"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import json
+import socketserver
+import threading
+import unittest
+from unittest.mock import patch
+from telemetry import (RingBuffer, Rollup, TelemetryStore, TelemetryCollector,
+                       read_miner_metrics, query_miner_api, MinerAPIError)
+
+RESPONSES = {
+    "summary": {"STATUS": [{"STATUS": "S"}], "SUMMARY": [{"MHS 5s": 13500000.0, "MHS av": 13400000.0}]},
+    "temps": {"STATUS": [{"STATUS": "S"}], "TEMPS": [{"Board": 55.0, "Chip": 70.0}, {"Board": 58.0, "Chip": 73.5}]},
+    "fans": {"STATUS": [{"STATUS": "S"}], "FANS": [{"RPM": 3000, "Speed": 55}, {"RPM": 3200, "Speed": 55}]},
+    "tunerstatus": {"STATUS": [{"STATUS": "S"}], "TUNERSTATUS": [{"ApproximateMinerPowerConsumption": 702}]},
+}
+
+class FakeMinerAPI(socketserver.BaseRequestHandler):
+    """Answers bosminer API commands like a miner on port 4028."""
+
+    def handle(self):
+        command = json.loads(self.request.recv(4096))["command"]
+        response = RESPONSES.get(command, {"STATUS": [{"STATUS": "E", "Msg": "Invalid command"}]})
+        self.request.sendall(json.dumps(response).encode() + b"\0")
+
+class FakeMinerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FakeMinerAPI)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+class TestMinerAPI(FakeMinerTestCase):
+
+    def test_read_miner_metrics(self):
+        metrics = read_miner_metrics("127.0.0.1", self.port)
+
+        self.assertEqual(metrics["up"], 1.0)
+        self.assertAlmostEqual(metrics["hashrate_ths"], 13.5)
+        self.assertEqual(metrics["temp_board_c"], 58.0)
+        self.assertEqual(metrics["temp_chip_c"], 73.5)
+        self.assertEqual(metrics["fan_rpm"], 3100)
+        self.assertEqual(metrics["power_w"], 702)
+
+    def test_stopped_fan_counts_as_zero_rpm(self):
+        fans = {"STATUS": [{"STATUS": "S"}], "FANS": [{"RPM": 0, "Speed": 0}, {"RPM": 3000, "Speed": 55}]}
+        with patch.dict(RESPONSES, {"fans": fans}):
+            metrics = read_miner_metrics("127.0.0.1", self.port)
+        self.assertEqual(metrics["fan_rpm"], 1500)
+
+    def test_malformed_answers_raise_api_error(self):
+        for command, response in (("summary", {"STATUS": [{"STATUS": "S"}], "SUMMARY": [{"MHS 5s": "n/a"}]}),
+                                  ("temps", {"STATUS": [{"STATUS": "S"}], "TEMPS": ["55.0"]}),
+                                  ("summary", ["not", "an", "object"])):
+            with self.subTest(command=command, response=response), patch.dict(RESPONSES, {command: response}):
+                with self.assertRaises(MinerAPIError):
+                    read_miner_metrics("127.0.0.1", self.port)
+
+    def test_api_error_status(self):
+        with self.assertRaises(MinerAPIError):
+            query_miner_api("127.0.0.1", "bogus", self.port)
+
+class TestCollector(FakeMinerTestCase):
+
+    def test_poll_once_records_every_heater(self):
+        heaters = [
+            {"heaterName": "office", "hostname": "ellsworth-office", "ipAddress": "127.0.0.1"},
+            {"heaterName": "loft", "hostname": "ellsworth-loft", "ipAddress": "127.0.0.1"},
+        ]
+        store = TelemetryStore()
+        collector = TelemetryCollector(lambda: heaters, store, port=self.port, timeout=1)
+        self.addCleanup(collector.stop)
+
+        results = collector.poll_once()
+
+        self.assertEqual(results["office"]["power_w"], 702)
+        self.assertEqual(store.latest()["loft"]["metrics"]["fan_rpm"], 3100)
+        _, points = store.query("office", "hashrate_ths", 0, 2 ** 40, "raw")
+        self.assertEqual(len(points), 1)
+
+    def test_unreachable_miner_is_recorded_as_down(self):
+        store = TelemetryStore()
+        collector = TelemetryCollector(lambda: [], store, port=1, timeout=0.5)
+        self.addCleanup(collector.stop)
+
+        metrics = collector.poll_heater({"heaterName": "offline", "hostname": "x", "ipAddress": "127.0.0.1"})
+        self.assertEqual(metrics, {"up": 0.0})
+
+    def test_malformed_answer_is_recorded_as_down(self):
+        store = TelemetryStore()
+        collector = TelemetryCollector(lambda: [], store, port=self.port, timeout=1)
+        self.addCleanup(collector.stop)
+
+        with patch.dict(RESPONSES, {"fans": {"STATUS": [{"STATUS": "S"}], "FANS": [{"RPM": "fast"}]}}):
+            metrics = collector.poll_heater({"heaterName": "office", "hostname": "x", "ipAddress": "127.0.0.1"})
+        self.assertEqual(metrics, {"up": 0.0})
+
+class TestTimeSeries(unittest.TestCase):
+
+    def test_ring_buffer_wraps_and_ranges(self):
+        ring = RingBuffer(4)
+        for t in range(10):
+            ring.append(float(t), t * 10.0)
+
+        self.assertEqual(len(ring), 4)
+        self.assertEqual(ring.range(0, 100), [(6.0, 60.0), (7.0, 70.0), (8.0, 80.0), (9.0, 90.0)])
+        self.assertEqual(ring.range(7, 9), [(7.0, 70.0), (8.0, 80.0)])
+        self.assertEqual(ring.last(), (9.0, 90.0))
+
+    def test_rollup_buckets(self):
+        rollup = Rollup(60, capacity=10)
+        for t, value in ((0, 1.0), (30, 3.0), (61, 10.0), (119, 20.0), (185, 5.0)):
+            rollup.add(t, value)
+
+        points = rollup.range(0, 1000)
+        self.assertEqual([p["t"] for p in points], [0, 60, 180])
+        self.assertEqual((points[0]["avg"], points[0]["min"], points[0]["max"]), (2.0, 1.0, 3.0))
+        self.assertEqual(points[1]["count"], 2)
+        self.assertEqual([p["t"] for p in rollup.range(60, 180)], [60])
+
+    def test_store_query_resolutions(self):
+        store = TelemetryStore(raw_samples=100)
+        for t in range(0, 7200, 30):
+            store.record("office", {"power_w": 600.0 + (t % 120)}, timestamp=float(t))
+
+        resolution, raw = store.query("office", "power_w", 0, 120, "raw")
+        self.assertEqual(resolution, "raw")
+        self.assertEqual(raw, [])  # only the last 100 raw samples are kept
+
+        resolution, minutes = store.query("office", "power_w", 0, 7200)
+        self.assertEqual(resolution, "1m")
+        self.assertEqual(len(minutes), 120)
+
+        _, hours = store.query("office", "power_w", 0, 7200, "1h")
+        self.assertEqual([p["count"] for p in hours], [120, 120])
+
+        with self.assertRaises(KeyError):
+            store.query("office", "fan_rpm", 0, 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+import tracing
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        self.path = os.path.join(self.workdir.name, 'traces.log')
+        self.tracer = tracing.enable(self.path)
+        self.addCleanup(tracing.disable)
+
+    def read_lines(self):
+        with open(self.path) as file:
+            return [line.split() for line in file.read().splitlines()]
+
+    def test_disabled_spans_are_shared_noop(self):
+        tracing.disable()
+        with tracing.span('work', host='a') as span:
+            span.set(status=200)
+        self.assertIs(span, tracing.NOOP_SPAN)
+        self.assertEqual(tracing.slowest_traces(), [])
+
+    def test_nested_spans_share_trace_and_record_parent(self):
+        with tracing.span('http_request', path='/apply'):
+            with tracing.span('acquire', host='miner') as acquire:
+                with tracing.span('connect', host='miner'):
+                    pass
+            with tracing.span('exec', host='miner'):
+                pass
+
+        lines = self.read_lines()
+        self.assertEqual([line[5] for line in lines], ['http_request', 'acquire', 'connect', 'exec'])
+        self.assertEqual(len({line[1] for line in lines}), 1)
+        root_id = lines[0][2]
+        self.assertEqual(lines[0][3], '-')
+        self.assertEqual(lines[1][3], root_id)
+        self.assertEqual(lines[2][3], acquire.span_id)
+        self.assertEqual(lines[3][3], root_id)
+        self.assertIn('path=/apply', lines[0])
+
+    def test_separate_root_spans_start_new_traces(self):
+        with tracing.span('first'):
+            pass
+        with tracing.span('second'):
+            pass
+        self.assertNotEqual(*[line[1] for line in self.read_lines()])
+
+    def test_errors_are_recorded(self):
+        with self.assertRaises(OSError):
+            with tracing.span('connect', host='miner'):
+                raise OSError('no route to host')
+
+        trace = tracing.slowest_traces()[0]
+        self.assertEqual(trace['error'], 'OSError: no route to host')
+        self.assertIn("error='OSError: no route to host'", ' '.join(self.read_lines()[0]))
+
+    def test_slowest_traces_sorted_and_filtered(self):
+        # A tracer of its own, so traces finished by background threads of other tests cannot interleave
+        tracer = tracing.Tracer(os.path.join(self.workdir.name, 'slowest.log'))
+        self.addCleanup(tracer.close)
+        for name, seconds in (('fast', 0), ('slow', 0.2), ('medium', 0.08)):
+            with tracing.Span(tracer, name, {}):
+                time.sleep(seconds)
+
+        self.assertEqual([trace['name'] for trace in tracer.slowest()], ['slow', 'medium', 'fast'])
+        self.assertEqual([trace['name'] for trace in tracer.slowest(limit=1)], ['slow'])
+        self.assertEqual([trace['name'] for trace in tracer.slowest(min_ms=150)], ['slow'])
+
+    def test_started_span_finished_later(self):
+        request = tracing.start_span('http_request', method='GET')
+        with tracing.span('registry_lookup'):
+            pass
+        request.set(status=404)
+        request.finish()
+
+        trace = tracing.slowest_traces()[0]
+        self.assertEqual(trace['attributes'], {'method': 'GET', 'status': '404'})
+        self.assertEqual([span['name'] for span in trace['spans']], ['http_request', 'registry_lookup'])
+
+    def test_threads_start_their_own_traces(self):
+        with tracing.span('outer'):
+            thread = threading.Thread(target=lambda: tracing.span('worker').start().finish())
+            thread.start()
+            thread.join()
+        self.assertEqual(sorted(trace['name'] for trace in tracing.slowest_traces()), ['outer', 'worker'])
+
+if __name__ == '__main__':
+    unittest.main()
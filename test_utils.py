@@ -1,18 +1,27 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import os
-from utils import transfer_file_to_remote_host, replace_host_name_in_toml
+import hashlib
+import utils
+from shared_state import SharedState
+from utils import transfer_file_to_remote_host, replace_host_name_in_toml, render_config, clear_config_cache, push_config, apply_config
 
 class TestUtils(unittest.TestCase):
 
-    @patch('utils.paramiko.SSHClient')
-    @patch('utils.replace_host_name_in_toml')
-    def test_transfer_file_to_remote_host(self, mock_replace_host_name_in_toml, mock_ssh_client):
-        # Mock the SSH client and SFTP session
+    def setUp(self):
+        clear_config_cache()
+        self.addCleanup(clear_config_cache)
+        self.addCleanup(utils._remote_hashes.clear)
+
+    @patch('utils.get_pool')
+    @patch('utils.replace_host_name_in_toml', return_value='hostname=test_host')
+    def test_transfer_file_to_remote_host(self, mock_replace_host_name_in_toml, mock_get_pool):
+        # Mock the pooled SSH connection and SFTP session
         mock_ssh = MagicMock()
         mock_sftp = MagicMock()
-        mock_ssh_client.return_value = mock_ssh
         mock_ssh.open_sftp.return_value = mock_sftp
+        mock_pool = mock_get_pool.return_value
+        mock_pool.run.side_effect = lambda host, operation, idempotent=False: operation(mock_ssh)
 
         # Define test parameters
         # local_file_path = 'test_local.toml'
@@ -21,14 +30,23 @@ class TestUtils(unittest.TestCase):
         hostname = 'test_host'
 
         # Call the function
-        transfer_file_to_remote_host(local_file_path, remote_file_path, hostname)
+        self.assertTrue(transfer_file_to_remote_host(local_file_path, remote_file_path, hostname))
 
         # Assertions
-        mock_ssh.connect.assert_called_once_with(hostname, username='root', pkey=unittest.mock.ANY)
+        mock_pool.run.assert_called_once_with(f'{hostname}.local', unittest.mock.ANY, idempotent=True)
         mock_replace_host_name_in_toml.assert_called_once_with(local_file_path, hostname)
-        mock_sftp.put.assert_called_once_with('./tmpFile/newConfigTmp.toml', remote_file_path)
+        mock_sftp.putfo.assert_called_once_with(unittest.mock.ANY, remote_file_path)
+        uploaded = mock_sftp.putfo.call_args.args[0]
+        self.assertEqual(uploaded.getvalue(), b'hostname=test_host')
+        mock_sftp.put.assert_not_called()
         mock_sftp.close.assert_called_once()
-        mock_ssh.close.assert_called_once()
+        # The SSH connection is pooled and must stay open
+        mock_ssh.close.assert_not_called()
+
+    @patch('utils.get_pool')
+    def test_transfer_file_to_remote_host_missing_template(self, mock_get_pool):
+        self.assertFalse(transfer_file_to_remote_host('./bosminerConfig/missing.toml', '/etc/bosminer.toml', 'test_host'))
+        mock_get_pool.return_value.run.assert_not_called()
 
     @patch('os.path.exists')
     @patch('os.makedirs')
@@ -43,13 +61,204 @@ class TestUtils(unittest.TestCase):
         hostname = '12345'
 
         # Call the function
-        replace_host_name_in_toml(file_path, hostname)
+        updated_content = replace_host_name_in_toml(file_path, hostname)
 
         # Assertions
-        mock_open.assert_called_with(file_path, 'w')
+        self.assertEqual(updated_content, 'hostname=12345')
+        mock_open.assert_called_once_with(file_path, 'r')
         mock_open().read.assert_called_once()
-        mock_open().write.assert_called_once_with('hostname=12345')
-        mock_makedirs.assert_called_once_with('./tmpFile', exist_ok=True)
+        # Nothing is written to a temporary file any more
+        mock_open().write.assert_not_called()
+        mock_makedirs.assert_not_called()
+
+    @patch('os.path.exists', return_value=True)
+    @patch('builtins.open', new_callable=unittest.mock.mock_open, read_data='user = "pool.{hostname}"')
+    def test_render_config_reads_template_once(self, mock_open, mock_exists):
+        file_path = './bosminerConfig/test_local.toml'
+
+        self.assertEqual(render_config(file_path, 'miner1'), b'user = "pool.miner1"')
+        self.assertEqual(render_config(file_path, 'miner2'), b'user = "pool.miner2"')
+        self.assertIs(render_config(file_path, 'miner1'), render_config(file_path, 'miner1'))
+
+        mock_open.assert_called_once_with(file_path, 'r')
+
+class RemoteConfigTestCase(unittest.TestCase):
+    """Renders a fixed config and runs pool operations on a mock SSH connection."""
+
+    CONTENT = b'hostname=miner1'
+
+    def setUp(self):
+        utils._remote_hashes.clear()
+        self.addCleanup(utils._remote_hashes.clear)
+
+        render_patcher = patch('utils.render_config', return_value=self.CONTENT)
+        render_patcher.start()
+        self.addCleanup(render_patcher.stop)
+
+        # Pooled SSH connection whose remote file and bosminer state are configurable
+        self.mock_ssh = MagicMock()
+        self.mock_sftp = self.mock_ssh.open_sftp.return_value
+        self.remote_content = b'hostname=old'
+        self.mock_sftp.open.return_value.__enter__.return_value.read.side_effect = lambda: self.remote_content
+        self.mock_stdout = MagicMock()
+        self.mock_stdout.channel.recv_exit_status.return_value = 0
+        self.mock_ssh.exec_command.return_value = (MagicMock(), self.mock_stdout, MagicMock())
+
+        pool_patcher = patch('utils.get_pool')
+        self.mock_pool = pool_patcher.start().return_value
+        self.mock_pool.run.side_effect = lambda host, operation, idempotent=False: operation(self.mock_ssh)
+        self.addCleanup(pool_patcher.stop)
+
+class TestPushConfig(RemoteConfigTestCase):
+
+    def push(self, force=False):
+        return push_config('bosminerConfig/bosminer-quiet-low.toml', '/etc/bosminer.toml', 'miner1', force=force)
+
+    def test_changed_config_is_uploaded(self):
+        self.assertEqual(self.push(), 'updated')
+        self.mock_sftp.putfo.assert_called_once()
+
+    def test_matching_remote_hash_skips_upload(self):
+        self.remote_content = self.CONTENT
+
+        self.assertEqual(self.push(), 'unchanged')
+        self.mock_sftp.putfo.assert_not_called()
+
+    def test_matching_config_with_stopped_bosminer(self):
+        self.remote_content = self.CONTENT
+        self.mock_stdout.channel.recv_exit_status.return_value = 1
+
+        self.assertEqual(self.push(), 'not_running')
+        self.mock_sftp.putfo.assert_not_called()
+
+    def test_remembered_hash_skips_connection(self):
+        self.push()
+        utils.config_activated('miner1')
+        self.mock_pool.run.reset_mock()
+
+        self.assertEqual(self.push(), 'unchanged')
+        self.mock_pool.run.assert_not_called()
+
+    def test_remembered_hash_expires(self):
+        self.push()
+        utils.config_activated('miner1')
+        with patch('utils.REMOTE_HASH_TTL', -1):
+            self.push()
+        self.assertEqual(self.mock_pool.run.call_count, 2)
+
+    def test_shared_hash_store_is_seen_by_other_workers(self):
+        store = SharedState()
+        self.addCleanup(store.close)
+        utils.use_hash_store(store)
+        self.addCleanup(utils.use_hash_store, None)
+
+        self.push()
+        utils.config_activated('miner1')
+        self.assertEqual(utils._remote_hashes, {})
+        self.assertEqual(store.remembered_hash('miner1')[1], hashlib.sha256(self.CONTENT).hexdigest())
+
+        utils.forget_remote_hash('miner1')
+        self.push()
+        self.assertEqual(self.mock_pool.run.call_count, 2)
+
+    def test_uploaded_config_stays_pending_until_activated(self):
+        self.mock_sftp.putfo.side_effect = lambda file, path: setattr(self, 'remote_content', file.getvalue())
+
+        self.assertEqual(self.push(), 'updated')
+        self.assertTrue(utils.config_pending('miner1', '/etc/bosminer.toml', hashlib.sha256(self.CONTENT).hexdigest()))
+
+        # The file on disk matches and bosminer runs, but it was never restarted onto it
+        self.assertEqual(self.push(), 'pending')
+        self.assertEqual(self.mock_sftp.putfo.call_count, 1)
+
+        utils.config_activated('miner1')
+        self.assertEqual(self.push(), 'unchanged')
+        self.assertEqual(self.mock_pool.run.call_count, 2)
+
+    def test_force_always_uploads(self):
+        self.remote_content = self.CONTENT
+        utils.remember_remote_hash('miner1', '/etc/bosminer.toml', hashlib.sha256(self.CONTENT).hexdigest())
+
+        self.assertEqual(self.push(force=True), 'updated')
+        self.mock_sftp.putfo.assert_called_once()
+        self.mock_sftp.open.assert_not_called()
+
+class TestApplyConfig(RemoteConfigTestCase):
+
+    def apply(self, force=False):
+        return apply_config('bosminerConfig/bosminer-quiet-low.toml', '/etc/bosminer.toml', 'miner1',
+                            host='192.168.1.10', force=force)
+
+    def uploaded(self, file, path):
+        self.remote_content = file.getvalue()
+
+    def test_changed_config_is_uploaded_verified_and_restarted(self):
+        self.mock_sftp.putfo.side_effect = self.uploaded
+
+        result = self.apply()
+
+        self.assertEqual(result['status'], 'updated')
+        self.assertEqual(result['restart']['exit_code'], 0)
+        self.mock_ssh.exec_command.assert_called_once_with('/etc/init.d/bosminer restart')
+        self.mock_pool.run.assert_called_once()
+        self.assertEqual(self.mock_pool.run.call_args.args[0], '192.168.1.10')
+        self.assertEqual([step['step'] for step in result['steps']],
+                         ['render', 'connect', 'compare', 'upload', 'verify', 'restart'])
+
+    def test_failed_verification_raises_without_restart(self):
+        with self.assertRaises(IOError):
+            self.apply()
+        self.mock_ssh.exec_command.assert_not_called()
+
+    def test_running_config_is_left_alone(self):
+        self.remote_content = self.CONTENT
+
+        result = self.apply()
+
+        self.assertEqual(result['status'], 'unchanged')
+        self.assertIsNone(result['restart'])
+        self.mock_sftp.putfo.assert_not_called()
+        self.mock_ssh.exec_command.assert_called_once_with('pidof bosminer')
+
+    def test_stopped_bosminer_is_restarted_without_upload(self):
+        self.remote_content = self.CONTENT
+        self.mock_stdout.channel.recv_exit_status.side_effect = [1, 0]
+
+        result = self.apply()
+
+        self.assertEqual(result['status'], 'not_running')
+        self.assertEqual(result['restart']['exit_code'], 0)
+        self.mock_sftp.putfo.assert_not_called()
+
+    def test_pending_config_is_restarted_without_upload(self):
+        self.remote_content = self.CONTENT
+        utils.remember_remote_hash('miner1', '/etc/bosminer.toml',
+                                   utils.PENDING_HASH_PREFIX + hashlib.sha256(self.CONTENT).hexdigest())
+
+        result = self.apply()
+
+        self.assertEqual(result['status'], 'pending')
+        self.assertEqual(result['restart']['exit_code'], 0)
+        self.mock_sftp.putfo.assert_not_called()
+        self.assertEqual(utils.remembered_remote_hash('miner1', '/etc/bosminer.toml'),
+                         hashlib.sha256(self.CONTENT).hexdigest())
+
+    def test_failed_restart_forgets_hash(self):
+        self.mock_sftp.putfo.side_effect = self.uploaded
+        self.mock_stdout.channel.recv_exit_status.return_value = 1
+
+        self.assertEqual(self.apply()['restart']['exit_code'], 1)
+        self.assertIsNone(utils.remembered_remote_hash('miner1', '/etc/bosminer.toml'))
+
+    def test_broken_restart_forgets_hash(self):
+        utils.remember_remote_hash('miner1', '/etc/bosminer.toml', 'old')
+        self.mock_sftp.putfo.side_effect = self.uploaded
+        self.mock_ssh.exec_command.side_effect = OSError("Socket is closed")
+
+        with self.assertRaises(OSError):
+            self.apply()
+        self.mock_sftp.putfo.assert_called_once()
+        self.assertIsNone(utils.remembered_remote_hash('miner1', '/etc/bosminer.toml'))
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
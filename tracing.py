@@ -0,0 +1,246 @@
+"""
+Opt-in tracing of requests and remote operations as timelines of nested spans.
+
+A span times one step (an HTTP request, a registry lookup, a config render, an
+SSH connect or handshake, an SFTP put, a command's exit wait) and records the
+span that was current when it started as its parent, so a slow /set_heater can
+be broken down into where the time went. The outermost span starts a trace with
+a new trace ID: every HTTP request is one trace, and remote operations run
+outside a request (reconciler passes, background jobs) get a trace of their own.
+
+Tracing is off until enable() is called. While it is off span() returns a
+shared no-op object, so instrumented code pays one function call per span.
+
+Finished traces are written to a rotating file, one line per span:
+
+    <start UTC> <trace id> <span id> <parent id or -> <duration ms> <name> [key=value ...]
+
+and the most recent ones are kept in memory for GET /debug/traces.
+"""
+
+import logging
+import logging.handlers
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+TRACE_PATH = "./heater_traces.log"
+TRACE_MAX_BYTES = 5 * 1024 * 1024  # size at which the trace file is rotated
+TRACE_BACKUPS = 3  # rotated trace files kept
+RECENT_TRACES = 500  # finished traces kept in memory
+
+_current_span = ContextVar("current_span", default=None)
+_tracer = None
+
+
+def _new_id():
+    return f"{random.getrandbits(64):016x}"
+
+
+def _format_attribute(value):
+    text = str(value)
+    return repr(text) if not text or any(char.isspace() or char in "='\"" for char in text) else text
+
+
+class _NoopSpan:
+    """
+    Stands in for a span while tracing is disabled.
+    """
+
+    __slots__ = ()
+
+    def start(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+    def finish(self, error=None):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _Trace:
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self):
+        self.trace_id = _new_id()
+        self.spans = []
+
+
+class Span:
+    """
+    One timed step of a trace. Use it as a context manager, or call start()
+    and finish() when the step does not fit in one block.
+    """
+
+    __slots__ = ("tracer", "name", "attributes", "trace", "span_id", "parent_id",
+                 "started_at", "duration", "error", "_started", "_token")
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.trace = None
+        self.span_id = _new_id()
+        self.parent_id = None
+        self.started_at = None
+        self.duration = None
+        self.error = None
+        self._started = None
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def start(self):
+        parent = _current_span.get()
+        if parent is None:
+            self.trace = _Trace()
+        else:
+            self.trace = parent.trace
+            self.parent_id = parent.span_id
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def finish(self, error=None):
+        self.duration = time.perf_counter() - self._started
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Finished from another context than it was started in
+            _current_span.set(None)
+        self.trace.spans.append(self)
+        if self.parent_id is None:
+            self.tracer.finish_trace(self.trace, self)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(exc)
+        return False
+
+    def format(self):
+        started = datetime.fromtimestamp(self.started_at, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        fields = [started, self.trace.trace_id, self.span_id, self.parent_id or "-",
+                  f"{self.duration * 1000:.3f}ms", self.name]
+        fields.extend(f"{key}={_format_attribute(value)}" for key, value in self.attributes.items())
+        if self.error:
+            fields.append(f"error={_format_attribute(self.error)}")
+        return " ".join(fields)
+
+    def to_dict(self, trace_started):
+        return {
+            "spanId": self.span_id,
+            "parentId": self.parent_id,
+            "name": self.name,
+            "offsetMs": round((self.started_at - trace_started) * 1000, 3),
+            "durationMs": round(self.duration * 1000, 3),
+            "attributes": {key: str(value) for key, value in self.attributes.items()},
+            "error": self.error
+        }
+
+
+class Tracer:
+    """
+    Writes finished traces to a rotating file and keeps the latest in memory.
+    """
+
+    def __init__(self, path=TRACE_PATH, max_bytes=TRACE_MAX_BYTES, backups=TRACE_BACKUPS, recent=RECENT_TRACES):
+        self.path = path
+        self._handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                             encoding="utf-8")
+        self._recent = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def finish_trace(self, trace, root):
+        spans = sorted(trace.spans, key=lambda span: span.started_at)
+        for span in spans:
+            self._handler.handle(logging.makeLogRecord({"msg": span.format()}))
+        summary = {
+            "traceId": trace.trace_id,
+            "name": root.name,
+            "start": root.started_at,
+            "durationMs": round(root.duration * 1000, 3),
+            "attributes": {key: str(value) for key, value in root.attributes.items()},
+            "error": root.error,
+            "spans": [span.to_dict(root.started_at) for span in spans]
+        }
+        with self._lock:
+            self._recent.append(summary)
+
+    def slowest(self, limit=20, min_ms=0):
+        """
+        Return up to limit of the recent traces that took at least min_ms, slowest first.
+        """
+        with self._lock:
+            traces = [trace for trace in self._recent if trace["durationMs"] >= min_ms]
+        return sorted(traces, key=lambda trace: trace["durationMs"], reverse=True)[:limit]
+
+    def close(self):
+        self._handler.close()
+
+
+def span(name, **attributes):
+    """
+    Return a span context manager for one step, or a no-op while tracing is disabled.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return NOOP_SPAN
+    return Span(tracer, name, attributes)
+
+
+def start_span(name, **attributes):
+    """
+    Start a span that is ended later with its finish(error=None) method.
+    """
+    return span(name, **attributes).start()
+
+
+def enable(path=TRACE_PATH, **options):
+    """
+    Start tracing to path. Returns the Tracer.
+    """
+    global _tracer
+    disable()
+    _tracer = Tracer(path, **options)
+    logger.info(f"Tracing enabled; writing spans to {path}")
+    return _tracer
+
+
+def disable():
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.close()
+
+
+def enabled():
+    return _tracer is not None
+
+
+def slowest_traces(limit=20, min_ms=0):
+    """
+    Return the slowest recent traces, or an empty list while tracing is disabled.
+    """
+    tracer = _tracer
+    return tracer.slowest(limit, min_ms) if tracer is not None else []
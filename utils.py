@@ -1,82 +1,373 @@
-import paramiko
+import hashlib
+import io
 import os
+import threading
+import time
+from functools import lru_cache
+from ssh_pool import get_pool, ssh_phase
+from tracing import span
 
-# SSH Configuration
-SSH_USERNAME = "root"  # Replace with your SSH username
-SSH_KEY_PATH = os.path.expanduser("~/.ssh/id_rsa")  # Path to your SSH private key
+# Number of rendered (template, hostname) configs kept in memory
+RENDER_CACHE_SIZE = 64
 
-def transfer_file_to_remote_host(local_file_path, remote_file_path, hostname):
+# Seconds a remembered remote config hash is trusted without re-checking the host
+REMOTE_HASH_TTL = 300
+
+# Exits with status 0 when bosminer is running
+BOSMINER_RUNNING_COMMAND = "pidof bosminer"
+
+# Restarts bosminer so it loads the current config (also starts a stopped bosminer)
+BOSMINER_RESTART_COMMAND = "/etc/init.d/bosminer restart"
+
+# Results of push_config
+PUSH_UPDATED = "updated"  # config transferred; bosminer needs a restart
+PUSH_UNCHANGED = "unchanged"  # remote already runs this config; nothing to do
+PUSH_NOT_RUNNING = "not_running"  # remote has this config but bosminer is stopped
+PUSH_PENDING = "pending"  # remote has this config from an earlier push, but bosminer was not restarted since
+
+# Prefix of a remembered hash whose config was uploaded but not yet loaded by bosminer
+PENDING_HASH_PREFIX = "pending:"
+
+# hostname -> (remote_file_path, sha256 of the config, time recorded)
+_remote_hashes = {}
+_remote_hashes_lock = threading.Lock()
+
+# SharedState keeping the hashes instead, so every worker process sees them (see use_hash_store)
+_hash_store = None
+
+def use_hash_store(store):
+    """
+    Keep remembered config hashes in a shared_state.SharedState, or in this process with None.
+    """
+    global _hash_store
+    _hash_store = store
+
+def config_file_for(miner_type, action):
+    """
+    Return the local bosminer config template for a miner type and level.
+
+    :param miner_type: Heater type from heaters.json, e.g. 'standard' or 'quiet'.
+    :param action: Configuration level, e.g. 'low', 'medium' or 'high'.
+    """
+    return f"bosminerConfig/bosminer-{miner_type}-{action}.toml"
+
+def transfer_file_to_remote_host(local_file_path, remote_file_path, hostname, host=None):
     """
     Transfers a file from the local machine to a remote host using SFTP with private key-based authentication.
+    The connection is drawn from the shared SSH connection pool, so the private key
+    is only loaded once and an existing session to the host is reused.
+
+    The config is rendered for the host in memory and streamed to the remote file,
+    so concurrent transfers never share a temporary file on disk.
 
     :param local_file_path: Path to the local file to be transferred.
     :param remote_file_path: Path to the remote file (including filename) where the file will be saved.
     :param hostname: Hostname of the remote host.
+    :param host: Address to connect to. Defaults to '<hostname>.local'.
+    :return: True if the file was transferred, False if an error occurred.
     """
     try:
-        # Create an SSH client
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        push_config(local_file_path, remote_file_path, hostname, host=host, force=True)
+        return True
+
+    except Exception as e:
+        print(f"An error occurred (HostName: {hostname}): {e}")
+        return False
 
-        # Load the private key
-        private_key = paramiko.RSAKey.from_private_key_file(SSH_KEY_PATH)
+def push_config(local_file_path, remote_file_path, hostname, host=None, force=False):
+    """
+    Pushes a rendered config to a remote host unless the host already has it.
 
-        # Connect to the remote host using the private key
-        ssh.connect(f"{hostname}.local", username=SSH_USERNAME, pkey=private_key)
+    The SHA-256 of the rendered config is compared with the last hash recorded for
+    the host (trusted for REMOTE_HASH_TTL seconds) and, failing that, with the hash
+    of the remote file itself. When they match and bosminer is running, neither the
+    transfer nor a restart is needed, unless this service uploaded the file without
+    restarting bosminer since: a matching file on disk does not mean bosminer loaded it.
 
+    push_config does not restart bosminer, so an uploaded config is only recorded as
+    pending; call config_activated() once bosminer has been (re)started onto it.
+
+    :param local_file_path: Path to the local config template.
+    :param remote_file_path: Path to the remote file (including filename) where the file will be saved.
+    :param hostname: Hostname of the remote host; the config is rendered for it.
+    :param host: Address to connect to. Defaults to '<hostname>.local'; when the
+                 service runs, either one is raced with the heater's other address.
+    :param force: Always transfer the file, skipping the comparison.
+    :return: PUSH_UPDATED, PUSH_UNCHANGED, PUSH_NOT_RUNNING or PUSH_PENDING.
+    :raises Exception: If the config cannot be rendered or transferred.
+    """
+    # Update config file with hostname
+    with span("render_config", template=local_file_path, hostname=hostname):
+        content = render_config(local_file_path, hostname)
+    digest = hashlib.sha256(content).hexdigest()
+
+    if not force and remembered_remote_hash(hostname, remote_file_path) == digest:
+        print(f"Config for {hostname} is unchanged (cached hash); skipping transfer")
+        return PUSH_UNCHANGED
+
+    host = host or f"{hostname}.local"
+
+    def sync(ssh):
         # Open an SFTP session
-        sftp = ssh.open_sftp()
+        with ssh_phase("sftp_open", host):
+            sftp = ssh.open_sftp()
+        try:
+            if not force:
+                with ssh_phase("sftp_read", host):
+                    remote_digest = remote_file_hash(sftp, remote_file_path)
+                if remote_digest == digest:
+                    print(f"Config for {hostname} is unchanged (remote hash); skipping transfer")
+                    with ssh_phase("exec", host):
+                        running = bosminer_running(ssh)
+                    if not running:
+                        return PUSH_NOT_RUNNING
+                    return PUSH_PENDING if config_pending(hostname, remote_file_path, digest) else PUSH_UNCHANGED
 
-        # Update config file with hostname and save to temporary location
-        replace_host_name_in_toml(local_file_path, hostname)
+            # Stream the rendered config from memory
+            with ssh_phase("sftp_put", host):
+                sftp.putfo(io.BytesIO(content), remote_file_path)
+            print(f"File {local_file_path} transferred to {remote_file_path} on {hostname}")
+            return PUSH_UPDATED
+        finally:
+            # Close the SFTP session; the SSH connection stays pooled
+            sftp.close()
 
-        # TODO - update previous function to return the new file path
-        new_local_file_path = "./tmpFile/newConfigTmp.toml"
+    # Reading the hash and uploading the same content again are safe to repeat
+    status = get_pool().run(host, sync, idempotent=True)
+    if status == PUSH_UNCHANGED:
+        remember_remote_hash(hostname, remote_file_path, digest)
+    else:
+        remember_remote_hash(hostname, remote_file_path, PENDING_HASH_PREFIX + digest)
+    return status
 
-        # Transfer the file
-        sftp.put(new_local_file_path, remote_file_path)
-        print(f"File {new_local_file_path} transferred to {remote_file_path} on {hostname}")
+def apply_config(local_file_path, remote_file_path, hostname, host=None, force=False):
+    """
+    Uploads a rendered config, verifies it and restarts bosminer, all in one pooled SSH session.
 
-        # Close the SFTP session and SSH connection
-        sftp.close()
-        ssh.close()
+    As with push_config, nothing is uploaded or restarted when the host already runs
+    the config. A host that has the config but a stopped bosminer, or a config pushed
+    without a restart, is only restarted.
 
-    except Exception as e:
-        print(f"An error occurred (HostName: {hostname}): {e}")
+    :param local_file_path: Path to the local config template.
+    :param remote_file_path: Path to the remote file (including filename) where the file will be saved.
+    :param hostname: Hostname of the remote host; the config is rendered for it.
+    :param host: Address to connect to. Defaults to '<hostname>.local'.
+    :param force: Always upload and restart, skipping the comparison.
+    :return: Dict with the push status, the restart result (or None) and the
+             duration of each step in seconds.
+    :raises Exception: If the config cannot be rendered, uploaded or verified.
+    """
+    host = host or f"{hostname}.local"
+    started = time.perf_counter()
+    steps = []
 
-def replace_host_name_in_toml(file_path, hostname):
+    def step(name, since):
+        now = time.perf_counter()
+        steps.append({"step": name, "seconds": round(now - since, 4)})
+        return now
+
+    # Update config file with hostname
+    with span("render_config", template=local_file_path, hostname=hostname):
+        content = render_config(local_file_path, hostname)
+    digest = hashlib.sha256(content).hexdigest()
+    rendered = step("render", started)
+
+    if not force and remembered_remote_hash(hostname, remote_file_path) == digest:
+        print(f"Config for {hostname} is unchanged (cached hash); skipping apply")
+        return {"status": PUSH_UNCHANGED, "restart": None, "steps": steps,
+                "elapsed": round(time.perf_counter() - started, 4)}
+
+    def apply(ssh):
+        # A retry on a fresh connection starts the remote steps over
+        del steps[1:]
+        mark = step("connect", rendered)
+
+        with ssh_phase("sftp_open", host):
+            sftp = ssh.open_sftp()
+        try:
+            status = PUSH_UPDATED
+            if not force:
+                with ssh_phase("sftp_read", host):
+                    remote_digest = remote_file_hash(sftp, remote_file_path)
+                mark = step("compare", mark)
+                if remote_digest == digest:
+                    with ssh_phase("exec", host):
+                        running = bosminer_running(ssh)
+                    mark = step("check_running", mark)
+                    if not running:
+                        status = PUSH_NOT_RUNNING
+                    elif config_pending(hostname, remote_file_path, digest):
+                        status = PUSH_PENDING
+                    else:
+                        print(f"Config for {hostname} is unchanged (remote hash); skipping apply")
+                        return PUSH_UNCHANGED, None
+
+            if status == PUSH_UPDATED:
+                # Stream the rendered config from memory, then read it back
+                with ssh_phase("sftp_put", host):
+                    sftp.putfo(io.BytesIO(content), remote_file_path)
+                mark = step("upload", mark)
+                with ssh_phase("sftp_read", host):
+                    uploaded_digest = remote_file_hash(sftp, remote_file_path)
+                mark = step("verify", mark)
+                if uploaded_digest != digest:
+                    raise IOError(f"Uploaded config on {hostname} does not match (sha256 {uploaded_digest})")
+        finally:
+            # Close the SFTP session; the SSH connection stays pooled
+            sftp.close()
+
+        with ssh_phase("exec", host):
+            stdin, stdout, stderr = ssh.exec_command(BOSMINER_RESTART_COMMAND)
+        with ssh_phase("exit_wait", host):
+            exit_code = stdout.channel.recv_exit_status()
+        restart = {
+            "command": BOSMINER_RESTART_COMMAND,
+            "exit_code": exit_code,
+            "output": stdout.read().decode().strip(),
+            "error": stderr.read().decode().strip()
+        }
+        step("restart", mark)
+        return status, restart
+
+    try:
+        status, restart = get_pool().run(host, apply)
+    except Exception:
+        # The upload may have happened without the restart; the hash is only kept once bosminer runs it
+        forget_remote_hash(hostname)
+        raise
+    if restart is not None and restart["exit_code"] != 0:
+        forget_remote_hash(hostname)
+    else:
+        remember_remote_hash(hostname, remote_file_path, digest)
+    return {"status": status, "restart": restart, "steps": steps,
+            "elapsed": round(time.perf_counter() - started, 4)}
+
+def remote_file_hash(sftp, remote_file_path):
     """
-    Replaces occurrences of '{hostname}' in a .toml file with the provided hostname value.
-    Saves the updated content to a new file named 'newConfigTmp.toml' in the ./tmpFile directory.
+    Returns the SHA-256 hex digest of a remote file, or None if it does not exist.
 
-    :param file_path: Path to the input .toml file.
-    :param hostname: The value to replace '{hostname}' with.
+    :param sftp: Open paramiko SFTP client.
+    :param remote_file_path: Path to the remote file.
     """
     try:
-        # Ensure the input file exists
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"The file {file_path} does not exist.")
+        with sftp.open(remote_file_path, 'rb') as remote_file:
+            return hashlib.sha256(remote_file.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+def bosminer_running(ssh):
+    """
+    Checks whether bosminer is running on a connected host.
+
+    :param ssh: Connected paramiko SSH client.
+    """
+    stdin, stdout, stderr = ssh.exec_command(BOSMINER_RUNNING_COMMAND)
+    return stdout.channel.recv_exit_status() == 0
 
-        # Read the content of the .toml file
-        with open(file_path, 'r') as file:
-            content = file.read()
+def remember_remote_hash(hostname, remote_file_path, digest):
+    """
+    Records the config hash a host is known to run.
+    """
+    if _hash_store is not None:
+        _hash_store.remember_hash(hostname, remote_file_path, digest)
+        return
+    with _remote_hashes_lock:
+        _remote_hashes[hostname] = (remote_file_path, digest, time.monotonic())
 
-        # Replace all occurrences of '{hostname}' with the provided hostname
-        updated_content = content.replace('{hostname}', hostname)
+def _remembered_entry(hostname):
+    # (remote_file_path, digest, seconds since recorded), or None
+    if _hash_store is not None:
+        entry, now = _hash_store.remembered_hash(hostname), time.time()
+    else:
+        with _remote_hashes_lock:
+            entry = _remote_hashes.get(hostname)
+        now = time.monotonic()
+    if entry is None:
+        return None
+    path, digest, recorded_at = entry
+    return path, digest, now - recorded_at
+
+def remembered_remote_hash(hostname, remote_file_path):
+    """
+    Returns the recorded config hash for a host, or None if unknown or expired.
+    A pending config is returned with PENDING_HASH_PREFIX, so it never matches a digest.
+    """
+    entry = _remembered_entry(hostname)
+    if entry is None or entry[0] != remote_file_path or entry[2] > REMOTE_HASH_TTL:
+        return None
+    return entry[1]
 
-        # Ensure the ./tmpFile directory exists
-        tmp_dir = "./tmpFile"
-        if not os.path.exists(tmp_dir):
-            os.makedirs(tmp_dir)
+def config_pending(hostname, remote_file_path, digest):
+    """
+    Checks whether a config was uploaded to a host without bosminer being restarted since.
+    Unlike remembered hashes, a pending mark does not expire.
+    """
+    entry = _remembered_entry(hostname)
+    return entry is not None and entry[:2] == (remote_file_path, PENDING_HASH_PREFIX + digest)
 
-        # Define the path for the new file in the ./tmpFile directory
-        new_file_path = os.path.join(tmp_dir, 'newConfigTmp.toml')
+def config_activated(hostname):
+    """
+    Records that bosminer on a host was (re)started onto its pending config, if any.
+    """
+    entry = _remembered_entry(hostname)
+    if entry is not None and entry[1].startswith(PENDING_HASH_PREFIX):
+        remember_remote_hash(hostname, entry[0], entry[1][len(PENDING_HASH_PREFIX):])
 
-        # Write the updated content to the new file
-        with open(new_file_path, 'w') as new_file:
-            new_file.write(updated_content)
+def forget_remote_hash(hostname):
+    """
+    Forgets the recorded config hash for a host, e.g. after bosminer was stopped.
+    """
+    if _hash_store is not None:
+        _hash_store.forget_hash(hostname)
+        return
+    with _remote_hashes_lock:
+        _remote_hashes.pop(hostname, None)
 
-        print(f"Updated .toml file saved as {new_file_path}")
+@lru_cache(maxsize=None)
+def load_config_template(file_path):
+    """
+    Reads a .toml config template once and caches it split around '{hostname}'.
+    Call clear_config_cache() after editing a template while the service is running.
 
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    :param file_path: Path to the input .toml file.
+    :return: Tuple of the template text between '{hostname}' placeholders.
+    """
+    # Ensure the input file exists
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"The file {file_path} does not exist.")
+
+    # Read the content of the .toml file
+    with open(file_path, 'r') as file:
+        content = file.read()
+
+    return tuple(content.split('{hostname}'))
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_config(file_path, hostname):
+    """
+    Renders a config template for a host and keeps the result in a small LRU cache.
+
+    :param file_path: Path to the input .toml file.
+    :param hostname: The value to replace '{hostname}' with.
+    :return: The rendered config as UTF-8 bytes.
+    """
+    return replace_host_name_in_toml(file_path, hostname).encode('utf-8')
+
+def clear_config_cache():
+    """
+    Drops every cached template and rendered config.
+    """
+    load_config_template.cache_clear()
+    render_config.cache_clear()
+
+def replace_host_name_in_toml(file_path, hostname):
+    """
+    Replaces occurrences of '{hostname}' in a .toml file with the provided hostname value.
+    The template is read from the in-memory cache; nothing is written to disk.
+
+    :param file_path: Path to the input .toml file.
+    :param hostname: The value to replace '{hostname}' with.
+    :return: The updated config content.
+    """
+    # Replace all occurrences of '{hostname}' with the provided hostname
+    return hostname.join(load_config_template(file_path))